@@ -0,0 +1,62 @@
+import logging
+
+import numpy as np
+
+try:
+    import av  # PyAV, only needed for the optional Opus transport
+except ImportError:
+    av = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Opus decoders always produce 48kHz output
+OPUS_SAMPLE_RATE = 48000
+
+
+def opus_available() -> bool:
+    """Whether this server can decode Opus audio from the browser"""
+    return av is not None
+
+
+class OpusDecoder:
+    """
+    Decodes a stream of raw Opus packets, as produced by the browser's WebCodecs
+    AudioEncoder and sent one per websocket frame, into mono float32 samples on
+    the int16 scale at 48kHz.
+    """
+
+    def __init__(self, channels: int = 1):
+        if av is None:
+            raise RuntimeError("Opus transport requires PyAV (pip install av)")
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        """Start a fresh decoder state, e.g. for a new recording"""
+        self._context = av.CodecContext.create('opus', 'r')
+        self._context.sample_rate = OPUS_SAMPLE_RATE
+        self._context.layout = 'mono' if self.channels == 1 else 'stereo'
+
+    def decode(self, packet: bytes) -> np.ndarray:
+        try:
+            frames = self._context.decode(av.Packet(packet))
+        except Exception as e:
+            logger.warning(f"Dropping undecodable Opus packet ({len(packet)} bytes): {e}")
+            return np.empty(0, dtype=np.float32)
+
+        decoded = []
+        for frame in frames:
+            samples = frame.to_ndarray()
+            if frame.format.is_planar:
+                # (channels, samples)
+                samples = samples.mean(axis=0, dtype=np.float32) if samples.shape[0] > 1 else samples[0]
+            else:
+                # (1, samples * channels), interleaved
+                samples = samples.reshape(-1, len(frame.layout.channels)).mean(axis=1, dtype=np.float32)
+            if samples.dtype.kind == 'f':
+                samples = samples * np.float32(32768.0)
+            decoded.append(samples.astype(np.float32, copy=False))
+        if not decoded:
+            return np.empty(0, dtype=np.float32)
+        return decoded[0] if len(decoded) == 1 else np.concatenate(decoded)
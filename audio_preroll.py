@@ -0,0 +1,91 @@
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class PreRollBuffer:
+    """
+    Holds processed audio that arrives while the realtime session is still being set up,
+    so that nothing the user says during connection setup is lost.
+
+    Chunks are kept in arrival order with their arrival time. The buffer is bounded by
+    a byte cap (and optionally a maximum age); when full, the oldest audio is dropped.
+    """
+
+    def __init__(self, max_bytes: int, max_age: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._chunks: Deque[Tuple[float, bytes]] = deque()
+        self._bytes = 0
+
+        # Counters over the lifetime of the connection
+        self.chunks_buffered = 0
+        self.chunks_flushed = 0
+        self.chunks_dropped = 0
+        self.bytes_dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._bytes
+
+    def append(self, chunk: bytes, now: Optional[float] = None):
+        if not chunk:
+            return
+        now = time.monotonic() if now is None else now
+        self._chunks.append((now, chunk))
+        self._bytes += len(chunk)
+        self.chunks_buffered += 1
+        self._evict(now)
+
+    def oldest_age(self, now: Optional[float] = None) -> float:
+        """Seconds since the oldest buffered chunk arrived"""
+        if not self._chunks:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return now - self._chunks[0][0]
+
+    async def flush(self, send: Callable[[bytes], Awaitable[None]]) -> int:
+        """Send every buffered chunk in arrival order; returns the number of chunks sent"""
+        self._evict(time.monotonic())
+        sent = 0
+        while self._chunks:
+            _, chunk = self._chunks[0]
+            await send(chunk)
+            # Only forget the chunk once it has been handed over
+            self._chunks.popleft()
+            self._bytes -= len(chunk)
+            self.chunks_flushed += 1
+            sent += 1
+        return sent
+
+    def clear(self):
+        """Discard buffered audio, counting it as dropped"""
+        self.chunks_dropped += len(self._chunks)
+        self.bytes_dropped += self._bytes
+        self._chunks.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks_buffered": self.chunks_buffered,
+            "chunks_flushed": self.chunks_flushed,
+            "chunks_dropped": self.chunks_dropped,
+            "bytes_dropped": self.bytes_dropped,
+        }
+
+    def _evict(self, now: float):
+        while self._chunks and (
+            self._bytes > self.max_bytes
+            or (self.max_age is not None and now - self._chunks[0][0] > self.max_age)
+        ):
+            _, chunk = self._chunks.popleft()
+            self._bytes -= len(chunk)
+            self.chunks_dropped += 1
+            self.bytes_dropped += len(chunk)
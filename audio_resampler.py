@@ -0,0 +1,115 @@
+import logging
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+import scipy.signal
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@lru_cache(maxsize=16)
+def _design_polyphase_filter(up: int, down: int) -> np.ndarray:
+    """
+    Design the anti-aliasing FIR filter the same way scipy.signal.resample_poly does
+    and split it into `up` phases. Returns a float32 array of shape (up, taps_per_phase)
+    where phases[p, i] multiplies the input sample i steps before the newest one.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = scipy.signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * up
+    taps_per_phase = -(-len(h) // up)
+    padded = np.zeros(taps_per_phase * up, dtype=np.float64)
+    padded[:len(h)] = h
+    phases = padded.reshape(taps_per_phase, up).T.astype(np.float32)
+    phases.setflags(write=False)
+    return phases
+
+
+class StreamingResampler:
+    """
+    Polyphase rational resampler that keeps its filter state between chunks.
+
+    The filter is designed once per (source, target) pair, input history is carried
+    over so there are no edge transients at chunk boundaries, and every output sample
+    is accumulated in the same order no matter how the stream was split, so the
+    output is bit-identical for any chunking of the same input.
+    """
+
+    def __init__(self, source_sample_rate: int, target_sample_rate: int):
+        divisor = gcd(source_sample_rate, target_sample_rate)
+        self.source_sample_rate = source_sample_rate
+        self.target_sample_rate = target_sample_rate
+        self.up = target_sample_rate // divisor
+        self.down = source_sample_rate // divisor
+        self.phases = _design_polyphase_filter(self.up, self.down)
+        self.taps = self.phases.shape[1]
+        # Phases in time order, so they line up with sliding windows of the input
+        self._kernels = np.ascontiguousarray(self.phases[:, ::-1])
+
+        # Preallocated work buffers, grown on demand
+        self._history_len = self.taps - 1
+        self._input = np.zeros(self._history_len + 4096, dtype=np.float32)
+        self._acc = np.empty(0, dtype=np.float32)
+        self._products = np.empty((0, self.taps), dtype=np.float32)
+        self._coefs = np.empty((0, self.taps), dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Forget all filter state, as if starting a new stream"""
+        self._input[:self._history_len] = 0.0
+        self._consumed = 0   # input samples seen so far
+        self._produced = 0   # output samples emitted so far
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample a chunk of samples; returns a float32 array that is reused on the next call"""
+        n = len(samples)
+        hist = self._history_len
+        if hist + n > len(self._input):
+            grown = np.zeros(hist + n, dtype=np.float32)
+            grown[:hist] = self._input[:hist]
+            self._input = grown
+        buf = self._input
+        buf[hist:hist + n] = samples
+
+        total_in = self._consumed + n
+        # Output n depends on input index (n * down) // up, so it is ready once that index has arrived
+        total_out = -(-total_in * self.up // self.down)
+        count = total_out - self._produced
+        if count > len(self._acc):
+            self._acc = np.empty(count, dtype=np.float32)
+            self._products = np.empty((count, self.taps), dtype=np.float32)
+            self._coefs = np.empty((count, self.taps), dtype=np.float32)
+        acc = self._acc[:count]
+
+        if count > 0:
+            positions = np.arange(self._produced, total_out, dtype=np.int64) * self.down
+            # Index into buf of the oldest input sample each output uses
+            oldest = positions // self.up - self._consumed
+            windows = np.lib.stride_tricks.sliding_window_view(buf[:hist + n], self.taps)
+            products = self._products[:count]
+            if self.up == 1:
+                # Pure decimation: the windows are an evenly strided view, no gather needed
+                start = oldest[0]
+                np.multiply(windows[start:start + count * self.down:self.down], self._kernels[0], out=products)
+            else:
+                coefs = self._coefs[:count]
+                np.take(self._kernels, positions % self.up, axis=0, out=coefs)
+                np.take(windows, oldest, axis=0, out=products)
+                products *= coefs
+            # A fixed-length row reduction sums every output in the same order however the stream was split
+            np.sum(products, axis=1, out=acc)
+
+        # Carry the last `hist` input samples over as history for the next chunk
+        if hist:
+            buf[:hist] = buf[n:n + hist]
+        self._consumed = total_in
+        self._produced = total_out
+        return acc
+
+    def process_int16(self, samples: np.ndarray) -> bytes:
+        """Resample samples on the int16 scale and return int16 PCM bytes"""
+        out = self.process(samples)
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype(np.int16).tobytes()
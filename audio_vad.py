@@ -0,0 +1,119 @@
+import logging
+import math
+from collections import deque
+from typing import Deque, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class VoiceActivityGate:
+    """
+    Drops silence from 16-bit mono PCM before it is uploaded.
+
+    Audio is classified in short frames, all frames of a chunk at once: a frame is speech
+    if it is loud enough, or a little quieter but with a high zero-crossing rate (fricatives
+    like "s" and "f"). Leading silence is trimmed, every pause is cut down to max_pause,
+    and trailing silence is dropped by flush(). The last hangover of a pause is always kept
+    after speech, and lookback of audio is put back before speech resumes, so word
+    endings and onsets aren't clipped.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 24000,
+        frame_ms: int = 20,
+        threshold_db: float = -50.0,
+        hangover_ms: int = 300,
+        lookback_ms: int = 200,
+        max_pause_ms: int = 700,
+        fricative_zcr: float = 0.25,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.fricative_zcr = fricative_zcr
+        self.hangover_frames = math.ceil(hangover_ms / frame_ms)
+        self.lookback_frames = math.ceil(lookback_ms / frame_ms)
+        # Silence kept from a pause beyond the hangover, replayed when speech resumes
+        self.pause_frames = max(self.lookback_frames, math.ceil(max_pause_ms / frame_ms) - self.hangover_frames)
+
+        # Totals over the whole session
+        self.samples_in = 0
+        self.samples_out = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the current recording; session totals are kept"""
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._pending: Deque[np.ndarray] = deque()
+        self._silent_frames = 0
+        self._speech_seen = False
+
+    def classify(self, frames: np.ndarray) -> np.ndarray:
+        """Speech flags for a (n_frames, frame_samples) int16 array"""
+        x = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(x * x, axis=1))
+        level_db = 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return (level_db > self.threshold_db) | (
+            (level_db > self.threshold_db - 10) & (zcr > self.fricative_zcr)
+        )
+
+    def process(self, pcm: bytes) -> bytes:
+        """Returns the audio to upload now; may be empty"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        self.samples_in += len(samples)
+        if len(self._remainder):
+            samples = np.concatenate((self._remainder, samples))
+        n_frames = len(samples) // self.frame_samples
+        self._remainder = samples[n_frames * self.frame_samples:].copy()
+        if not n_frames:
+            return b""
+
+        frames = samples[:n_frames * self.frame_samples].reshape(n_frames, self.frame_samples)
+        speech = self.classify(frames)
+        out: List[np.ndarray] = []
+        for frame, is_speech in zip(frames, speech):
+            if is_speech:
+                # Resuming: keep the tail of the pause (just the lookback before the first word)
+                out.extend(self._pending)
+                self._pending.clear()
+                self._speech_seen = True
+                self._silent_frames = 0
+                out.append(frame)
+                continue
+            self._silent_frames += 1
+            if self._speech_seen and self._silent_frames <= self.hangover_frames:
+                out.append(frame)
+                continue
+            self._pending.append(frame)
+            if len(self._pending) > (self.pause_frames if self._speech_seen else self.lookback_frames):
+                self._pending.popleft()
+        return self._emit(out)
+
+    def flush(self) -> bytes:
+        """End of the recording: drop trailing silence, keep a partial frame still inside speech"""
+        out = []
+        if self._speech_seen and self._silent_frames <= self.hangover_frames and len(self._remainder):
+            out.append(self._remainder)
+        self.reset()
+        return self._emit(out)
+
+    def stats(self) -> Dict[str, float]:
+        buffered = len(self._remainder) + len(self._pending) * self.frame_samples
+        return {
+            "seconds_in": round(self.samples_in / self.sample_rate, 2),
+            "seconds_sent": round(self.samples_out / self.sample_rate, 2),
+            "seconds_suppressed": round((self.samples_in - self.samples_out - buffered) / self.sample_rate, 2),
+        }
+
+    def _emit(self, out: List[np.ndarray]) -> bytes:
+        if not out:
+            return b""
+        audio = np.concatenate(out)
+        self.samples_out += len(audio)
+        return audio.tobytes()
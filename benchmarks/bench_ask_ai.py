@@ -0,0 +1,80 @@
+"""
+Throughput of 100 concurrent /api/v1/ask_ai calls against a simulated slow model.
+
+Compares the async endpoint (with a few per-model concurrency limits) to the previous
+design, a sync endpoint calling a blocking client from Starlette's threadpool.
+No network access is needed. Run from the repository root:
+    OPENAI_API_KEY=test python benchmarks/bench_ask_ai.py
+"""
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import realtime_server  # noqa: E402
+from llm_processor import ModelConcurrencyLimiter  # noqa: E402
+
+CALLS = 100
+MODEL_LATENCY = 1.0
+
+
+async def slow_answer(text, prompt, model=None, answered_by=None):
+    await asyncio.sleep(MODEL_LATENCY)
+    return "answer"
+
+
+def slow_answer_sync(text, prompt, model=None):
+    time.sleep(MODEL_LATENCY)
+    return "answer"
+
+
+def threadpool_app():
+    """The old endpoint shape: a plain def holding a threadpool worker per call"""
+    app = FastAPI()
+
+    @app.post("/api/v1/ask_ai")
+    def ask_ai(request: realtime_server.AskAIRequest):
+        return {"answer": slow_answer_sync(request.text, "prompt")}
+
+    return app
+
+
+async def run(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            http.post("/api/v1/ask_ai", json={"text": f"question {i}"}) for i in range(CALLS)
+        ])
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    return elapsed
+
+
+async def main():
+    print(f"{CALLS} concurrent Ask AI calls, {MODEL_LATENCY:.1f}s simulated model latency\n")
+    print(f"{'endpoint':<30}{'wall s':>10}{'calls/s':>10}")
+
+    elapsed = await run(threadpool_app())
+    print(f"{'sync def (threadpool)':<30}{elapsed:>10.2f}{CALLS / elapsed:>10.1f}")
+
+    processor = MagicMock()
+    processor.process_text_async = AsyncMock(side_effect=slow_answer)
+    for limit in (10, 50, 100):
+        limiter = ModelConcurrencyLimiter(limits={"o1-mini": limit})
+        with patch.object(realtime_server, 'llm_processor', processor), \
+             patch.object(realtime_server, 'llm_limiter', limiter), \
+             patch.object(realtime_server, 'log_content'):
+            elapsed = await run(realtime_server.app)
+        label = f"async, o1-mini limit {limit}"
+        print(f"{label:<30}{elapsed:>10.2f}{CALLS / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
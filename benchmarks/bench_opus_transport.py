@@ -0,0 +1,84 @@
+"""
+Upstream bandwidth and server CPU per second of audio: raw PCM16 versus Opus.
+
+Needs PyAV (pip install av). Run from the repository root:
+    OPENAI_API_KEY=test python benchmarks/bench_opus_transport.py
+"""
+import fractions
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import av  # noqa: E402
+from realtime_server import AudioProcessor  # noqa: E402
+
+SECONDS = 30
+FRAME_MS = 20
+OPUS_BITRATE = 24000
+
+
+def speech_like_signal(sample_rate, seconds, seed=0):
+    """Voiced harmonics with a syllable-rate envelope and some breath noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(sample_rate * seconds) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2
+    signal = voiced * envelope * 6000 + rng.standard_normal(len(t)) * 300
+    return signal.clip(-32768, 32767).astype(np.int16)
+
+
+def frames_of(samples, frame_samples):
+    return [samples[i:i + frame_samples] for i in range(0, len(samples), frame_samples)]
+
+
+def encode_opus(samples, sample_rate, frame_samples):
+    encoder = av.CodecContext.create('libopus', 'w')
+    encoder.sample_rate = sample_rate
+    encoder.layout = 'mono'
+    encoder.format = 's16'
+    encoder.bit_rate = OPUS_BITRATE
+    encoder.open()
+    packets = []
+    for start in range(0, len(samples), frame_samples):
+        chunk = samples[start:start + frame_samples]
+        frame = av.AudioFrame.from_ndarray(chunk.reshape(1, -1), format='s16', layout='mono')
+        frame.sample_rate = sample_rate
+        frame.pts = start
+        frame.time_base = fractions.Fraction(1, sample_rate)
+        packets.extend(bytes(packet) for packet in encoder.encode(frame))
+    return packets
+
+
+def server_cpu(processor, payloads):
+    start = time.process_time()
+    for payload in payloads:
+        processor.process_audio_chunk(payload)
+    return (time.process_time() - start) / SECONDS * 1000
+
+
+def main():
+    print(f"{SECONDS}s of speech-like audio, {FRAME_MS} ms frames\n")
+    print(f"{'transport':<22}{'upstream kbit/s':>16}{'server CPU ms per audio s':>28}")
+    for sample_rate in (48000, 24000):
+        samples = speech_like_signal(sample_rate, SECONDS)
+        frame_samples = sample_rate * FRAME_MS // 1000
+
+        pcm_payloads = [frame.tobytes() for frame in frames_of(samples, frame_samples)]
+        pcm_kbps = sum(len(p) for p in pcm_payloads) * 8 / SECONDS / 1000
+        pcm_cpu = server_cpu(AudioProcessor(source_sample_rate=sample_rate), pcm_payloads)
+        print(f"{f'pcm16 @ {sample_rate // 1000} kHz':<22}{pcm_kbps:>16.1f}{pcm_cpu:>28.2f}")
+
+        opus_packets = encode_opus(samples, sample_rate, frame_samples)
+        opus_kbps = sum(len(p) for p in opus_packets) * 8 / SECONDS / 1000
+        opus_cpu = server_cpu(AudioProcessor(source_sample_rate=sample_rate, sample_format="opus"), opus_packets)
+        print(f"{f'opus @ {sample_rate // 1000} kHz':<22}{opus_kbps:>16.1f}{opus_cpu:>28.2f}")
+
+
+if __name__ == '__main__':
+    main()
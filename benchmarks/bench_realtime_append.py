@@ -0,0 +1,107 @@
+"""
+Cost of streaming audio to the realtime API: 50 concurrent sessions, each sending 30 seconds
+of 24kHz PCM16 in 40 ms chunks as fast as the socket takes them.
+
+Compares the previous send_audio (dict + base64 + json.dumps per chunk, INFO log) to the
+precomputed envelope, with and without aggregating chunks into 200 ms messages. The sessions
+talk to a local websocket sink in a separate process, so the CPU figures are the sender's only.
+No network access is needed. Run from the repository root:
+    OPENAI_API_KEY=test python benchmarks/bench_realtime_append.py
+"""
+import asyncio
+import base64
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai_realtime_client import OpenAIRealtimeAudioTextClient  # noqa: E402
+
+SESSIONS = 50
+SECONDS = 30
+CHUNK_MS = 40
+SAMPLE_RATE = 24000
+AGGREGATE_MS = 200
+
+logger = logging.getLogger("openai_realtime_client")
+
+
+class PreviousClient(OpenAIRealtimeAudioTextClient):
+    """send_audio as it was before the envelope"""
+
+    async def send_audio(self, audio_data: bytes):
+        if self.ws and self.ws.open:
+            await self.ws.send(json.dumps({
+                "type": "input_audio_buffer.append",
+                "audio": base64.b64encode(audio_data).decode('utf-8')
+            }))
+            logger.info("Sent input_audio_buffer.append message to OpenAI")
+            self.appends_sent += 1
+        else:
+            logger.error("WebSocket is not open. Cannot send audio.")
+
+
+def run_sink(port_queue):
+    async def sink(ws, path=None):
+        async for _ in ws:
+            pass
+
+    async def serve():
+        async with websockets.serve(sink, "127.0.0.1", 0, max_size=None) as server:
+            port_queue.put(server.sockets[0].getsockname()[1])
+            await asyncio.Future()
+
+    asyncio.run(serve())
+
+
+async def session(make_client, url, chunk, chunks):
+    client = make_client()
+    client.ws = await websockets.connect(url, max_size=None)
+    for _ in range(chunks):
+        await client.send_audio(chunk)
+    await client.commit_audio()
+    messages = client.appends_sent
+    await client.ws.close()
+    return messages
+
+
+async def run(make_client, url):
+    chunk_bytes = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+    chunk = os.urandom(chunk_bytes)
+    chunks = SECONDS * 1000 // CHUNK_MS
+    cpu = time.process_time()
+    start = time.perf_counter()
+    messages = await asyncio.gather(*[session(make_client, url, chunk, chunks) for _ in range(SESSIONS)])
+    return time.perf_counter() - start, time.process_time() - cpu, sum(messages)
+
+
+async def main(url):
+    variants = [
+        ("json.dumps per chunk (previous)", lambda: PreviousClient("bench")),
+        ("envelope per chunk", lambda: OpenAIRealtimeAudioTextClient("bench")),
+        (f"envelope, {AGGREGATE_MS} ms messages", lambda: OpenAIRealtimeAudioTextClient(
+            "bench", min_append_bytes=SAMPLE_RATE * 2 * AGGREGATE_MS // 1000)),
+    ]
+    audio_seconds = SESSIONS * SECONDS
+    print(f"{SESSIONS} sessions x {SECONDS}s of audio in {CHUNK_MS} ms chunks\n")
+    print(f"{'send path':<36}{'messages':>10}{'wall s':>9}{'audio s/s':>11}{'CPU ms/audio s':>16}")
+    for label, make_client in variants:
+        wall, cpu, messages = await run(make_client, url)
+        print(f"{label:<36}{messages:>10}{wall:>9.2f}{audio_seconds / wall:>11.0f}"
+              f"{cpu * 1000 / audio_seconds:>16.3f}")
+
+
+if __name__ == '__main__':
+    port_queue = multiprocessing.Queue()
+    sink_process = multiprocessing.Process(target=run_sink, args=(port_queue,), daemon=True)
+    sink_process.start()
+    try:
+        asyncio.run(main(f"ws://127.0.0.1:{port_queue.get(timeout=10)}"))
+    finally:
+        sink_process.terminate()
@@ -0,0 +1,61 @@
+"""
+Per-chunk CPU cost of the streaming resampler versus calling resample_poly on every chunk.
+
+Run from the repository root:
+    python benchmarks/bench_resampler.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.signal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from audio_resampler import StreamingResampler  # noqa: E402
+
+CHUNK_SAMPLES = 4096
+ITERATIONS = 2000
+
+
+def legacy_process(audio_bytes, source_rate, target_rate):
+    pcm_data = np.frombuffer(audio_bytes, dtype=np.int16)
+    float_data = pcm_data.astype(np.float32) / 32768.0
+    resampled = scipy.signal.resample_poly(float_data, target_rate, source_rate)
+    return (resampled * 32768.0).clip(-32768, 32767).astype(np.int16).tobytes()
+
+
+def bench(label, fn, chunks):
+    # Warm up caches and the filter design before timing
+    for chunk in chunks[:10]:
+        fn(chunk)
+    start = time.perf_counter()
+    for chunk in chunks:
+        fn(chunk)
+    per_chunk_us = (time.perf_counter() - start) / len(chunks) * 1e6
+    print(f"  {label:<28} {per_chunk_us:9.1f} us/chunk")
+    return per_chunk_us
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for source_rate in (48000, 44100):
+        chunks = [
+            (rng.standard_normal(CHUNK_SAMPLES) * 3000).astype(np.int16).tobytes()
+            for _ in range(ITERATIONS)
+        ]
+        print(f"{source_rate} Hz -> 24000 Hz, {CHUNK_SAMPLES}-sample chunks")
+        legacy = bench("resample_poly per chunk", lambda c: legacy_process(c, source_rate, 24000), chunks)
+
+        resampler = StreamingResampler(source_rate, 24000)
+        streaming = bench(
+            "StreamingResampler",
+            lambda c: resampler.process_int16(np.frombuffer(c, dtype=np.int16)),
+            chunks,
+        )
+        print(f"  speedup: {legacy / streaming:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
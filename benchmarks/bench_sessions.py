@@ -0,0 +1,239 @@
+"""
+End-to-end load benchmark: concurrent dictations against one server, fully offline.
+
+Starts the mock realtime API (mock_realtime.py), the mock chat completions API
+(mock_llm.py) and realtime_server.py pointed at both, then replays WAV files through
+session_simulator.py: SESSIONS dictations, CONCURRENCY at a time, each followed by a
+Readability request on its transcript. Reports p50/p95/p99 of connect, stop-to-first-text,
+stop-to-done and Readability latencies, plus the server's CPU time and resident memory
+per session (read from /proc, so Linux only). Without WAV files a synthetic 10 s
+dictation is used. Run from the repository root:
+    python benchmarks/bench_sessions.py --sessions 40 --concurrency 20
+    python benchmarks/bench_sessions.py --json before.json
+    python benchmarks/bench_sessions.py --baseline before.json   # exits 1 on a regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_llm  # noqa: E402
+import mock_realtime  # noqa: E402
+from bench_workers import stop_server, wait_ready  # noqa: E402
+from mock_llm import free_port  # noqa: E402
+from session_simulator import read_wav, simulate_dictation, speech_like_audio, write_wav  # noqa: E402
+
+LATENCIES = ["connect", "stop_to_first_text", "stop_to_done", "readability_first_byte", "readability_total"]
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        # Fields after the parenthesised command name; utime and stime are the 14th and 15th
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_bytes(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class PeakMemory:
+    """Samples a process's RSS in a thread while the load runs"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = rss_bytes(pid)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes(self.pid))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return {"p50": round(p50, 1), "p95": round(p95, 1), "p99": round(p99, 1)}
+
+
+async def run_load(port, recordings, sessions, concurrency, speed):
+    url = f"ws://127.0.0.1:{port}/api/v1/ws"
+    http_base = f"http://127.0.0.1:{port}"
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        pcm, rate, channels = recordings[i % len(recordings)]
+        async with limit:
+            return await simulate_dictation(url, pcm, rate, channels, speed=speed, http_base=http_base)
+
+    return await asyncio.gather(*[one(i) for i in range(sessions)], return_exceptions=True)
+
+
+def benchmark(args, recordings):
+    realtime, realtime_port = mock_realtime.start_in_process(
+        first_delta_delay=args.first_delta_delay, delta_interval=args.delta_interval, jitter=args.jitter,
+    )
+    llm, llm_port = mock_llm.start_in_process(
+        first_token_delay=args.first_token_delay, token_interval=args.token_interval, jitter=args.jitter,
+    )
+    port = free_port()
+    # Synthetic dictations stay out of the real transcript journal
+    journal_dir = tempfile.TemporaryDirectory()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="bench",
+        OPENAI_REALTIME_URL=f"ws://127.0.0.1:{realtime_port}",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+        LLM_WARMUP="0",
+        SHARED_STATE_URL="",
+        TRACE_EXPORT="",
+        JOURNAL_DIR=journal_dir.name,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "realtime_server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--ws", "websockets", "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    try:
+        wait_ready(port)
+        # One dictation first, so imports and first-use allocations aren't counted per session
+        asyncio.run(run_load(port, recordings, 1, 1, 0))
+        cpu_before, rss_before = cpu_seconds(server.pid), rss_bytes(server.pid)
+        started = time.perf_counter()
+        with PeakMemory(server.pid) as memory:
+            outcomes = asyncio.run(run_load(port, recordings, args.sessions, args.concurrency, args.speed))
+        elapsed = time.perf_counter() - started
+        cpu = cpu_seconds(server.pid) - cpu_before
+        rss_after = rss_bytes(server.pid)
+    finally:
+        stop_server(server)
+        realtime.terminate()
+        llm.terminate()
+        journal_dir.cleanup()
+
+    completed = [outcome for outcome in outcomes if isinstance(outcome, dict)]
+    errors = [repr(outcome) for outcome in outcomes if not isinstance(outcome, dict)]
+    audio_seconds = sum(len(pcm) / (2 * rate * channels) for pcm, rate, channels in recordings)
+    audio_seconds *= args.sessions / len(recordings)
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "speed": args.speed,
+            "audio_seconds": round(audio_seconds, 1),
+            "cpus": os.cpu_count(),
+        },
+        "wall_seconds": round(elapsed, 2),
+        "latency_ms": {name: percentiles([t[name] for t in completed if name in t]) for name in LATENCIES},
+        "cpu_ms_per_session": round(cpu * 1000 / max(1, len(completed)), 1),
+        "cpu_ms_per_audio_second": round(cpu * 1000 / audio_seconds, 2),
+        "rss_mib": {
+            "before": round(rss_before / 2**20, 1),
+            "peak": round(memory.peak / 2**20, 1),
+            "after": round(rss_after / 2**20, 1),
+        },
+        "rss_kib_per_concurrent_session": round((memory.peak - rss_before) / 1024 / min(args.concurrency, args.sessions), 1),
+        "errors": errors,
+    }
+
+
+def report(result):
+    config = result["config"]
+    print(f"{config['sessions']} dictations, {config['concurrency']} at a time, "
+          f"{config['audio_seconds']:.0f} s of audio at {config['speed'] or 'max'}x speed, {config['cpus']} CPUs, "
+          f"{result['wall_seconds']:.1f} s\n")
+    print(f"{'latency (ms)':<26}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, values in result["latency_ms"].items():
+        cells = "".join(f"{value:>9.1f}" if value is not None else f"{'-':>9}" for value in values.values())
+        print(f"{name:<26}{cells}")
+    rss = result["rss_mib"]
+    print(f"\nserver CPU: {result['cpu_ms_per_session']:.1f} ms per session, "
+          f"{result['cpu_ms_per_audio_second']:.2f} ms per audio second")
+    print(f"server RSS: {rss['before']:.1f} MiB before, {rss['peak']:.1f} MiB peak, {rss['after']:.1f} MiB after, "
+          f"{result['rss_kib_per_concurrent_session']:.0f} KiB per concurrent session")
+    print(f"errors: {len(result['errors'])}")
+    for error in result["errors"][:5]:
+        print(f"  {error}")
+
+
+def regressions(result, baseline, tolerance, slack_ms=5.0):
+    """What got worse than the baseline by more than tolerance (a fraction) plus a little noise"""
+    found = []
+    for name, values in result["latency_ms"].items():
+        before, after = baseline["latency_ms"].get(name, {}).get("p95"), values["p95"]
+        if before is not None and after is not None and after > before * (1 + tolerance) + slack_ms:
+            found.append(f"{name} p95 {before:.1f} -> {after:.1f} ms")
+    for name in ("cpu_ms_per_session", "rss_kib_per_concurrent_session"):
+        before, after = baseline.get(name), result[name]
+        if before is not None and after > before * (1 + tolerance) and after - before > 1:
+            found.append(f"{name} {before} -> {after}")
+    if len(result["errors"]) > len(baseline.get("errors", [])):
+        found.append(f"errors {len(baseline.get('errors', []))} -> {len(result['errors'])}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load benchmark of concurrent dictation sessions')
+    parser.add_argument('wav', nargs='*', help='16-bit PCM WAV files to replay, round-robin')
+    parser.add_argument('--sessions', type=int, default=20, help='Dictations in total')
+    parser.add_argument('--concurrency', type=int, default=10, help='Dictations at a time')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed: 1 is real time, 0 as fast as possible')
+    parser.add_argument('--first-delta-delay', type=float, default=0.2, help='Mock realtime: seconds to the first delta')
+    parser.add_argument('--delta-interval', type=float, default=0.01, help='Mock realtime: seconds between deltas')
+    parser.add_argument('--first-token-delay', type=float, default=0.3, help='Mock LLM: seconds to the first token')
+    parser.add_argument('--token-interval', type=float, default=0.01, help='Mock LLM: seconds between tokens')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Mocks: random +/- fraction on every delay (seeded)')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Results of an earlier run; exit 1 if this one is worse')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    if args.wav:
+        recordings = [read_wav(path) for path in args.wav]
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            # Goes through the WAV reader like real files would
+            path = os.path.join(directory, "synthetic.wav")
+            write_wav(path, speech_like_audio(10))
+            recordings = [read_wav(path)]
+
+    result = benchmark(args, recordings)
+    report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Scaling of concurrent dictation sessions with the number of server workers.
+
+Starts uvicorn with --workers 1, 2 and 4 against the mock realtime API, with the workers
+sharing state through the state_server.py stand-in, then runs
+SESSIONS concurrent dictations from several client processes: each sends 48kHz PCM16
+speech-like audio as fast as the server takes it, stops, and waits for the transcript.
+Reports completed sessions per second and stop-to-idle latency per worker count; on a
+machine with at least as many cores as workers the throughput should grow almost linearly.
+No network access is needed. Run from the repository root:
+    python benchmarks/bench_workers.py
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_realtime import start_in_process  # noqa: E402
+from session_simulator import speech_like_audio  # noqa: E402
+from state_server import start_in_thread  # noqa: E402
+
+WORKER_COUNTS = [int(n) for n in os.getenv("BENCH_WORKERS", "1,2,4").split(",")]
+SESSIONS = int(os.getenv("BENCH_SESSIONS", "48"))
+CLIENT_PROCESSES = int(os.getenv("BENCH_CLIENTS", "4"))
+AUDIO_SECONDS = 10
+SAMPLE_RATE = 48000
+CHUNK_MS = 40
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def dictation(url, chunks):
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "audio_format", "sample_rate": SAMPLE_RATE, "channels": 1, "sample_format": "pcm16"}))
+        await ws.recv()
+        await ws.send(json.dumps({"type": "start_recording"}))
+        for chunk in chunks:
+            await ws.send(chunk)
+        stopped = time.perf_counter()
+        await ws.send(json.dumps({"type": "stop_recording"}))
+        text = ""
+        while True:
+            message = json.loads(await ws.recv())
+            if message["type"] == "text":
+                text += message["content"]
+            elif message == {"type": "status", "status": "idle"} and text:
+                return time.perf_counter() - stopped
+
+
+def client_process(url, sessions, results):
+    audio = speech_like_audio(AUDIO_SECONDS)
+    size = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+    chunks = [audio[i:i + size] for i in range(0, len(audio), size)]
+
+    async def main():
+        return await asyncio.gather(*[dictation(url, chunks) for _ in range(sessions)], return_exceptions=True)
+
+    results.put(asyncio.run(main()))
+
+
+def run_load(port):
+    results = multiprocessing.Queue()
+    per_client = [SESSIONS // CLIENT_PROCESSES + (i < SESSIONS % CLIENT_PROCESSES) for i in range(CLIENT_PROCESSES)]
+    start = time.perf_counter()
+    clients = [multiprocessing.Process(target=client_process, args=(f"ws://127.0.0.1:{port}/api/v1/ws", n, results))
+               for n in per_client]
+    for process in clients:
+        process.start()
+    outcomes = [item for _ in clients for item in results.get(timeout=600)]
+    elapsed = time.perf_counter() - start
+    for process in clients:
+        process.join()
+    latencies = [item for item in outcomes if isinstance(item, float)]
+    errors = [item for item in outcomes if not isinstance(item, float)]
+    return elapsed, latencies, errors
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/v1/stats", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def stop_server(server):
+    """Stop uvicorn and its workers; a worker that doesn't shut down in time is killed"""
+    os.killpg(server.pid, signal.SIGTERM)
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(server.pid, signal.SIGKILL)
+        server.wait()
+
+
+def main():
+    mock, mock_port = start_in_process(first_delta_delay=0.2)
+    # Synthetic dictations stay out of the real transcript journal
+    journal_dir = tempfile.TemporaryDirectory()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="bench",
+        OPENAI_REALTIME_URL=f"ws://127.0.0.1:{mock_port}",
+        LLM_WARMUP="0",
+        SHARED_STATE_URL=f"redis://127.0.0.1:{start_in_thread()}",
+        JOURNAL_DIR=journal_dir.name,
+    )
+    print(f"{SESSIONS} concurrent sessions x {AUDIO_SECONDS}s of 48kHz audio, {os.cpu_count()} CPUs\n")
+    print(f"{'workers':>8}{'wall s':>9}{'sessions/s':>12}{'scaling':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    baseline = None
+    try:
+        for workers in WORKER_COUNTS:
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "realtime_server:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(workers), "--ws", "websockets", "--log-level", "warning"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+            )
+            try:
+                wait_ready(port)
+                elapsed, latencies, errors = run_load(port)
+            finally:
+                stop_server(server)
+            rate = len(latencies) / elapsed
+            baseline = baseline or rate
+            p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else float("nan")
+            print(f"{workers:>8}{elapsed:>9.2f}{rate:>12.2f}{rate / baseline:>8.2f}x{p50:>9.0f}{p95:>9.0f}{len(errors):>8}")
+    finally:
+        mock.terminate()
+        journal_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests and benchmarks.
+
+Answers POST /v1/chat/completions, streamed as server-sent events or as one JSON body,
+after a configurable time to the first token and at a configurable token rate, and GET
+/v1/models for the server's warm-up. By default the answer echoes the text after the last
+blank line of the prompt, which is where the server puts the transcript, so answer length
+follows input length like a readability rewrite. The OpenAI client picks it up from
+OPENAI_BASE_URL:
+    python benchmarks/mock_llm.py --port 8766
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 python realtime_server.py
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+RESPONSE_TEXT = "This is a simulated answer from the language model."
+
+
+class MockChatCompletions:
+    def __init__(
+        self,
+        first_token_delay: float = 0.3,
+        token_interval: float = 0.01,
+        token_chars: int = 4,
+        response_text: str = RESPONSE_TEXT,
+        echo: bool = True,
+        jitter: float = 0.0,
+        seed: int = 0,
+    ):
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+        self.token_chars = token_chars
+        self.response_text = response_text
+        self.echo = echo
+        # Every delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.app = self._build_app()
+
+    def _delay(self, seconds: float) -> float:
+        if self.jitter and seconds:
+            seconds *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return seconds
+
+    def answer(self, messages) -> str:
+        if not self.echo or not messages:
+            return self.response_text
+        content = messages[-1].get("content") or ""
+        return content.rsplit("\n\n", 1)[-1] or self.response_text
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/v1/models")
+        async def models():
+            return {"object": "list", "data": [{"id": "gpt-4o", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            self.requests += 1
+            model = body.get("model", "gpt-4o")
+            text = self.answer(body.get("messages", []))
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+            if not body.get("stream"):
+                await asyncio.sleep(self._delay(self.first_token_delay) + self._delay(self.token_interval) * self._tokens(text))
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": self._tokens(text), "total_tokens": self._tokens(text)},
+                }
+
+            def chunk(delta, finish_reason=None):
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }) + "\n\n"
+
+            async def events():
+                await asyncio.sleep(self._delay(self.first_token_delay))
+                yield chunk({"role": "assistant", "content": ""})
+                for start in range(0, len(text), self.token_chars):
+                    yield chunk({"content": text[start:start + self.token_chars]})
+                    if self.token_interval:
+                        await asyncio.sleep(self._delay(self.token_interval))
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return app
+
+    def _tokens(self, text: str) -> int:
+        return max(1, -(-len(text) // self.token_chars))
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def _run(host, port, options):
+    # HTTP only: no websocket implementation needed
+    uvicorn.run(MockChatCompletions(**options).app, host=host, port=port, log_level="warning", ws="none")
+
+
+def start_in_process(host: str = "127.0.0.1", port: int = 0, **options):
+    """Run the mock in its own process; returns (process, port) once it accepts connections"""
+    port = port or free_port(host)
+    process = multiprocessing.Process(target=_run, args=(host, port, options), daemon=True)
+    process.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("Mock chat completions API did not start")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a mock OpenAI chat completions API')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--first-token-delay', type=float, default=0.3, help='Seconds to the first token')
+    parser.add_argument('--token-interval', type=float, default=0.01, help='Seconds between tokens')
+    parser.add_argument('--token-chars', type=int, default=4, help='Characters per token')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- fraction applied to every delay')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the jitter')
+    parser.add_argument('--no-echo', action='store_true', help='Always answer with the fixed text')
+    args = parser.parse_args()
+
+    print(f"Mock chat completions API on http://{args.host}:{args.port}/v1")
+    _run(args.host, args.port, dict(
+        first_token_delay=args.first_token_delay,
+        token_interval=args.token_interval,
+        token_chars=args.token_chars,
+        jitter=args.jitter,
+        seed=args.seed,
+        echo=not args.no_echo,
+    ))
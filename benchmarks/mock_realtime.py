@@ -0,0 +1,146 @@
+"""
+Local stand-in for the OpenAI realtime websocket API, for load tests and benchmarks.
+
+Accepts sessions, counts appended audio and answers every response.create with a text
+response streamed as deltas. The handshake delay, time to the first delta, delta size and
+rate are configurable, with optional seeded jitter so runs stay reproducible. Point the
+server at it with OPENAI_REALTIME_URL:
+    python benchmarks/mock_realtime.py --port 8765
+    OPENAI_REALTIME_URL=ws://127.0.0.1:8765 python realtime_server.py
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import uuid
+
+import websockets
+
+# "{n}" is replaced by the response's number, so transcripts differ like real ones do
+RESPONSE_TEXT = "This is simulated transcription number {n} of the recording."
+
+
+class MockRealtimeServer:
+    def __init__(
+        self,
+        response_text: str = RESPONSE_TEXT,
+        first_delta_delay: float = 0.2,
+        delta_interval: float = 0.01,
+        delta_chars: int = 8,
+        connect_delay: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0,
+    ):
+        self.response_text = response_text
+        self.first_delta_delay = first_delta_delay
+        self.delta_interval = delta_interval
+        self.delta_chars = delta_chars
+        # Before session.created, like the real API's handshake
+        self.connect_delay = connect_delay
+        # Every delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self.sessions = 0
+        self.audio_bytes = 0
+        self.commits = 0
+        self.responses = 0
+
+    def _delay(self, seconds: float) -> float:
+        if self.jitter and seconds:
+            seconds *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return seconds
+
+    async def handler(self, ws, path=None):
+        self.sessions += 1
+        if self.connect_delay:
+            await asyncio.sleep(self._delay(self.connect_delay))
+        await ws.send(json.dumps({"type": "session.created", "session": {"id": f"sess_{uuid.uuid4().hex[:12]}"}}))
+        responses = set()
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                kind = event.get("type")
+                if kind == "session.update":
+                    await ws.send(json.dumps({"type": "session.updated", "session": event.get("session", {})}))
+                elif kind == "input_audio_buffer.append":
+                    self.audio_bytes += len(event["audio"]) * 3 // 4
+                elif kind == "input_audio_buffer.commit":
+                    self.commits += 1
+                elif kind == "response.create":
+                    # Answer concurrently, like the real API, so appends keep flowing meanwhile
+                    task = asyncio.create_task(self.respond(ws))
+                    responses.add(task)
+                    task.add_done_callback(responses.discard)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for task in responses:
+                task.cancel()
+
+    async def respond(self, ws):
+        self.responses += 1
+        number = self.responses
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        ids = {"response_id": response_id, "item_id": f"item_{response_id[5:]}", "output_index": 0, "content_index": 0}
+        try:
+            await ws.send(json.dumps({"type": "response.created", "response": {"id": response_id}}))
+            await asyncio.sleep(self._delay(self.first_delta_delay))
+            text = self.response_text.replace("{n}", str(number))
+            for start in range(0, len(text), self.delta_chars):
+                await ws.send(json.dumps({"type": "response.text.delta", "delta": text[start:start + self.delta_chars], **ids}))
+                if self.delta_interval:
+                    await asyncio.sleep(self._delay(self.delta_interval))
+            await ws.send(json.dumps({"type": "response.text.done", "text": text, **ids}))
+            await ws.send(json.dumps({"type": "response.done", "response": {"id": response_id, "status": "completed"}}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0):
+        return await websockets.serve(self.handler, host, port, max_size=None)
+
+
+def _run(port_queue, host, port, options):
+    async def main():
+        server = await MockRealtimeServer(**options).serve(host, port)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await asyncio.Future()
+
+    asyncio.run(main())
+
+
+def start_in_process(host: str = "127.0.0.1", port: int = 0, **options):
+    """Run the mock in its own process; returns (process, port)"""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(port_queue, host, port, options), daemon=True)
+    process.start()
+    return process, port_queue.get(timeout=10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a mock OpenAI realtime API')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--first-delta-delay', type=float, default=0.2, help='Seconds from response.create to the first delta')
+    parser.add_argument('--delta-interval', type=float, default=0.01, help='Seconds between deltas')
+    parser.add_argument('--delta-chars', type=int, default=8, help='Characters per delta')
+    parser.add_argument('--connect-delay', type=float, default=0.0, help='Seconds before session.created')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- fraction applied to every delay')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the jitter')
+    parser.add_argument('--response-text', default=RESPONSE_TEXT, help='Text of every response')
+    args = parser.parse_args()
+
+    async def main():
+        await MockRealtimeServer(
+            response_text=args.response_text,
+            first_delta_delay=args.first_delta_delay,
+            delta_interval=args.delta_interval,
+            delta_chars=args.delta_chars,
+            connect_delay=args.connect_delay,
+            jitter=args.jitter,
+            seed=args.seed,
+        ).serve(args.host, args.port)
+        print(f"Mock realtime API on ws://{args.host}:{args.port}")
+        await asyncio.Future()
+
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+Browser stand-in for load tests: replays WAV files as dictations over /api/v1/ws.
+
+Each dictation declares the file's format in the audio_format handshake, streams its PCM16
+frames in CHUNK_MS chunks at real time (speed 1), faster (speed 4) or as fast as the server
+takes them (speed 0), stops, and times the transcript. With an HTTP base URL it then asks
+for Readability on the transcript, joining the session's trace like the browser does.
+Against a running server:
+    python benchmarks/session_simulator.py --url ws://127.0.0.1:3005/api/v1/ws dictation.wav
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import wave
+from typing import Dict, Optional, Tuple
+
+import httpx
+import numpy as np
+import websockets
+
+CHUNK_MS = 40
+
+
+def speech_like_audio(seconds: float, sample_rate: int = 48000, seed: int = 0) -> bytes:
+    """Mono PCM16 with a gliding pitch and syllable-rate envelope, loud enough to pass VAD"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    phase = 2 * np.pi * np.cumsum(140 + 30 * np.sin(2 * np.pi * 0.7 * t)) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.3 + 0.7 * np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    signal = voiced * envelope * 6000 + rng.standard_normal(len(t)) * 200
+    return signal.clip(-32768, 32767).astype(np.int16).tobytes()
+
+
+def write_wav(path: str, pcm: bytes, sample_rate: int = 48000, channels: int = 1):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+
+
+def read_wav(path: str) -> Tuple[bytes, int, int]:
+    """(PCM16 bytes, sample rate, channels); only 16-bit PCM WAV files are supported"""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit PCM, got {8 * f.getsampwidth()}-bit")
+        return f.readframes(f.getnframes()), f.getframerate(), f.getnchannels()
+
+
+async def simulate_dictation(
+    url: str,
+    pcm: bytes,
+    sample_rate: int = 48000,
+    channels: int = 1,
+    speed: float = 1.0,
+    chunk_ms: int = CHUNK_MS,
+    http_base: Optional[str] = None,
+    timeout: float = 120.0,
+) -> Dict[str, float]:
+    """
+    One dictation; returns seconds for connect (socket open to first status), stop_to_first_text,
+    stop_to_done (stop to the idle status after the transcript) and, with http_base,
+    readability_first_byte and readability_total.
+    """
+    timings = {}
+    size = sample_rate * channels * 2 * chunk_ms // 1000
+    interval = chunk_ms / 1000 / speed if speed else 0
+    opened = time.perf_counter()
+    async with websockets.connect(url, max_size=None) as ws:
+        hello = json.loads(await ws.recv())
+        timings["connect"] = time.perf_counter() - opened
+        await ws.send(json.dumps({"type": "audio_format", "sample_rate": sample_rate, "channels": channels, "sample_format": "pcm16"}))
+        await ws.recv()
+        await ws.send(json.dumps({"type": "start_recording"}))
+        started = time.perf_counter()
+        for i, offset in enumerate(range(0, len(pcm), size)):
+            if interval:
+                # Paced against the start, so slow sends don't add up to drift
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await ws.send(pcm[offset:offset + size])
+        stopped = time.perf_counter()
+        await ws.send(json.dumps({"type": "stop_recording"}))
+        transcript = ""
+        deadline = stopped + timeout
+        while True:
+            message = json.loads(await asyncio.wait_for(ws.recv(), timeout=max(0.0, deadline - time.perf_counter())))
+            if message["type"] == "text":
+                if message["content"] and "stop_to_first_text" not in timings:
+                    timings["stop_to_first_text"] = time.perf_counter() - stopped
+                transcript = message["content"] if message.get("isNewResponse") else transcript + message["content"]
+            elif message["type"] == "error":
+                raise RuntimeError(message["content"])
+            elif message.get("status") == "idle" and transcript:
+                timings["stop_to_done"] = time.perf_counter() - stopped
+                break
+
+    if http_base:
+        headers = {"traceparent": hello["traceparent"]} if hello.get("traceparent") else {}
+        async with httpx.AsyncClient(base_url=http_base, timeout=timeout) as http:
+            requested = time.perf_counter()
+            async with http.stream("POST", "/api/v1/readability", json={"text": transcript}, headers=headers) as response:
+                response.raise_for_status()
+                async for _ in response.aiter_bytes():
+                    timings.setdefault("readability_first_byte", time.perf_counter() - requested)
+            timings["readability_total"] = time.perf_counter() - requested
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay WAV files as dictations against a running server')
+    parser.add_argument('wav', nargs='*', help='16-bit PCM WAV files; a synthetic 10 s dictation if none')
+    parser.add_argument('--url', default="ws://127.0.0.1:3005/api/v1/ws")
+    parser.add_argument('--speed', type=float, default=1.0, help='1 for real time, 0 for as fast as possible')
+    parser.add_argument('--readability', action='store_true', help='Also request Readability on each transcript')
+    args = parser.parse_args()
+
+    async def main():
+        files = [read_wav(path) for path in args.wav] or [(speech_like_audio(10), 48000, 1)]
+        http_base = args.url.replace("ws", "http", 1).split("/api/")[0] if args.readability else None
+        for (pcm, rate, channels), name in zip(files, args.wav or ["synthetic"]):
+            timings = await simulate_dictation(args.url, pcm, rate, channels, speed=args.speed, http_base=http_base)
+            print(os.path.basename(name), {key: round(value * 1000, 1) for key, value in timings.items()})
+
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class DeltaBatcher:
+    """
+    Collects small text deltas and forwards them as one message per time window,
+    or as soon as enough text has piled up. flush() sends whatever is pending right
+    away, e.g. on response.done.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]], window: float = 0.04, max_chars: int = 512):
+        self.send = send
+        self.window = window
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._chars = 0
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        self.deltas_received = 0
+        self.batches_sent = 0
+
+    async def add(self, delta: str):
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._chars += len(delta)
+        self.deltas_received += 1
+        if self._chars >= self.max_chars:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """Send pending text now"""
+        self._cancel_timer()
+        async with self._lock:
+            if not self._parts:
+                return
+            text = "".join(self._parts)
+            self._parts = []
+            self._chars = 0
+            self.batches_sent += 1
+            await self.send(text)
+
+    async def close(self):
+        """Drop the timer; call flush() first if pending text should still be sent"""
+        self._cancel_timer()
+        self._parts = []
+        self._chars = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "deltas_received": self.deltas_received,
+            "batches_sent": self.batches_sent,
+        }
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        # Detach first so flush() doesn't cancel the task it is running in
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing text deltas: {e}")
+
+    def _cancel_timer(self):
+        if self._timer and not self._timer.done() and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import IO, Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# When to fsync the journal file
+FSYNC_NEVER = "never"        # Leave it to the OS
+FSYNC_BATCH = "batch"        # After every batch written
+FSYNC_INTERVAL = "interval"  # At most once per fsync_interval seconds
+
+
+class JournalWriter:
+    """
+    Asynchronous, batched journal of transcripts and LLM results.
+
+    record() only enqueues; a background task writes batches of records as JSON lines
+    to logs/YYYY-MM-DD.jsonl through one buffered handle, switching files at midnight.
+    The actual file I/O runs in a worker thread so it never blocks the event loop.
+    Records made before start() are held (up to max_queue) and written once it runs.
+    """
+
+    def __init__(
+        self,
+        log_dir: str,
+        fsync: str = FSYNC_NEVER,
+        fsync_interval: float = 1.0,
+        max_batch: int = 256,
+        max_queue: int = 10000,
+    ):
+        if fsync not in (FSYNC_NEVER, FSYNC_BATCH, FSYNC_INTERVAL):
+            raise ValueError(f"Unsupported fsync policy: {fsync}")
+        self.log_dir = log_dir
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._file: Optional[IO[str]] = None
+        self._file_date: Optional[str] = None
+        self._last_fsync = 0.0
+
+        self.records_written = 0
+        self.records_dropped = 0
+        self.batches_written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        while self._pending:
+            self._queue.put_nowait(self._pending.popleft())
+        self._task = asyncio.create_task(self._writer_loop())
+        logger.info(f"Journal writer started in {self.log_dir} (fsync={self.fsync})")
+
+    async def stop(self):
+        """Write everything still queued, then close the file"""
+        if self.running:
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+        await asyncio.to_thread(self._close_file)
+        logger.info(f"Journal writer stopped: {self.stats()}")
+
+    def record(
+        self,
+        record_type: str,
+        content: str,
+        session_id: Optional[str] = None,
+        model: Optional[str] = None,
+        latency_ms: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        now = datetime.now()
+        entry = {
+            "ts": now.isoformat(timespec="milliseconds"),
+            "type": record_type,
+            "session_id": session_id,
+            "model": model,
+            "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+            "content": content,
+        }
+        if not self.running:
+            # Not started yet (e.g. outside the server lifespan): hold it for the writer
+            if len(self._pending) >= self.max_queue:
+                self.records_dropped += 1
+                logger.error(f"Journal not running and {self.max_queue} records waiting, dropped {record_type} record")
+            else:
+                self._pending.append(entry)
+            return entry
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.records_dropped += 1
+            logger.error(f"Journal queue full, dropped {record_type} record")
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": (self._queue.qsize() if self._queue else 0) + len(self._pending),
+            "records_written": self.records_written,
+            "records_dropped": self.records_dropped,
+            "batches_written": self.batches_written,
+        }
+
+    async def _writer_loop(self):
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            batch = []
+            if entry is None:
+                stopping = True
+            else:
+                batch.append(entry)
+            # Drain whatever else is already waiting, up to one batch
+            while len(batch) < self.max_batch and not self._queue.empty():
+                entry = self._queue.get_nowait()
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write_batch, batch)
+                except Exception as e:
+                    logger.error(f"Error writing journal batch: {e}", exc_info=True)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        lines = []
+        for entry in batch:
+            # Records carry their own date, so a batch spanning midnight is split across files
+            day = entry["ts"][:10]
+            if day != self._file_date:
+                self._write_lines(lines)
+                self._open_file(day)
+            lines.append(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._write_lines(lines)
+        if self.fsync == FSYNC_BATCH or (
+            self.fsync == FSYNC_INTERVAL and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+        self.records_written += len(batch)
+        self.batches_written += 1
+
+    def _write_lines(self, lines: List[str]):
+        # One write per file and batch: with several workers appending to the same day's
+        # file, whole batches interleave rather than parts of lines
+        if lines:
+            self._file.write("".join(lines))
+            self._file.flush()
+            lines.clear()
+
+    def _open_file(self, day: str):
+        self._close_file()
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = os.path.join(self.log_dir, f"{day}.jsonl")
+        self._file = open(path, "a", encoding="utf-8", buffering=64 * 1024)
+        self._file_date = day
+        logger.info(f"Journal writing to {path}")
+
+    def _close_file(self):
+        if self._file:
+            self._file.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self._file.fileno())
+            self._file.close()
+        self._file = None
+        self._file_date = None
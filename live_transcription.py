@@ -0,0 +1,71 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_CJK_END = ("。", "！", "？", "，", "、")
+
+
+class LiveSegmenter:
+    """
+    Decides when the audio sent so far should be committed as one segment of a live
+    transcription: at the first pause after min_segment seconds, or after max_segment
+    seconds regardless. A segment starts at its first speech, so silence is never
+    committed on its own and doesn't count toward either length.
+    Expects 16-bit mono PCM.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 24000,
+        min_segment: float = 3.0,
+        max_segment: float = 15.0,
+        silence: float = 0.6,
+        silence_rms: float = 500.0,
+    ):
+        self.sample_rate = sample_rate
+        self.min_segment = min_segment
+        self.max_segment = max_segment
+        self.silence = silence
+        self.silence_rms = silence_rms
+        self.segments = 0
+        self.reset()
+
+    def reset(self):
+        self.segment_seconds = 0.0
+        self.trailing_silence = 0.0
+        self.speech_seen = False
+
+    def feed(self, pcm: bytes) -> bool:
+        """Account for a chunk; True if a segment boundary falls right after it"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if not len(samples):
+            return False
+        seconds = len(samples) / self.sample_rate
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float32)))
+        if rms < self.silence_rms:
+            if not self.speech_seen:
+                # Nothing worth transcribing yet; the segment starts with the first speech
+                return False
+            self.trailing_silence += seconds
+        else:
+            self.trailing_silence = 0.0
+            self.speech_seen = True
+        self.segment_seconds += seconds
+
+        at_pause = self.segment_seconds >= self.min_segment and self.trailing_silence >= self.silence
+        if not (at_pause or self.segment_seconds >= self.max_segment):
+            return False
+        logger.debug(f"Segment boundary after {self.segment_seconds:.1f}s ({'pause' if at_pause else 'max length'})")
+        self.segments += 1
+        self.reset()
+        return True
+
+
+def segment_separator(previous_text: str) -> str:
+    """What goes between two stitched segment transcripts"""
+    if not previous_text or previous_text[-1].isspace():
+        return ""
+    return "" if previous_text.endswith(_CJK_END) else " "
@@ -1,9 +1,17 @@
 import os
+import socket
+import time
+import asyncio
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import aclosing, asynccontextmanager, nullcontext
 import google.generativeai as genai
+import httpx
 from openai import OpenAI, AsyncOpenAI
-from typing import AsyncGenerator, Generator, Optional
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Generator, List, Optional
 import logging
+from metrics import Histogram, Registry
+from shared_state import SharedState
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -17,6 +25,19 @@ class LLMProcessor(ABC):
     def process_text_sync(self, text: str, prompt: str, model: Optional[str] = None) -> str:
         pass
 
+    async def process_text_async(self, text: str, prompt: str, model: Optional[str] = None) -> str:
+        """Complete answer without holding a thread; processors override with a native call"""
+        parts = []
+        async for part in self.process_text(text, prompt, model):
+            parts.append(part)
+        return "".join(parts)
+
+    async def warm_up(self, model: Optional[str] = None):
+        """Prepare clients before the first request; nothing to do by default"""
+
+    async def close(self):
+        pass
+
 class GeminiProcessor(LLMProcessor):
     def __init__(self, default_model: str = 'gemini-1.5-pro'):
         api_key = os.getenv("GOOGLE_API_KEY")
@@ -24,14 +45,24 @@ class GeminiProcessor(LLMProcessor):
             raise EnvironmentError("GOOGLE_API_KEY is not set")
         genai.configure(api_key=api_key)
         self.default_model = default_model
+        # GenerativeModel handles are reusable; the SDK shares its transport between them
+        self._models: Dict[str, genai.GenerativeModel] = {}
+
+    def _model(self, model_name: str) -> genai.GenerativeModel:
+        genai_model = self._models.get(model_name)
+        if genai_model is None:
+            genai_model = self._models[model_name] = genai.GenerativeModel(model_name)
+        return genai_model
+
+    async def warm_up(self, model: Optional[str] = None):
+        self._model(model or self.default_model)
 
     async def process_text(self, text: str, prompt: str, model: Optional[str] = None) -> AsyncGenerator[str, None]:
         all_prompt = f"{prompt}\n\n{text}"
         model_name = model or self.default_model
         logger.info(f"Using model: {model_name} for processing")
         logger.info(f"Prompt: {all_prompt}")
-        genai_model = genai.GenerativeModel(model_name)
-        response = await genai_model.generate_content_async(
+        response = await self._model(model_name).generate_content_async(
             all_prompt,
             stream=True
         )
@@ -44,18 +75,45 @@ class GeminiProcessor(LLMProcessor):
         model_name = model or self.default_model
         logger.info(f"Using model: {model_name} for sync processing")
         logger.info(f"Prompt: {all_prompt}")
-        genai_model = genai.GenerativeModel(model_name)
-        response = genai_model.generate_content(all_prompt)
+        response = self._model(model_name).generate_content(all_prompt)
+        return response.text
+
+    async def process_text_async(self, text: str, prompt: str, model: Optional[str] = None) -> str:
+        all_prompt = f"{prompt}\n\n{text}"
+        model_name = model or self.default_model
+        logger.info(f"Using model: {model_name} for async processing")
+        response = await self._model(model_name).generate_content_async(all_prompt)
         return response.text
 
 class GPTProcessor(LLMProcessor):
-    def __init__(self):
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, keepalive_expiry: float = 60.0):
         if not os.getenv("OPENAI_API_KEY"):
             raise ValueError("OpenAI API key not found in environment variables")
-        self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.sync_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Explicitly sized keep-alive pools, shared by every request through this processor
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        timeout = httpx.Timeout(600.0, connect=10.0)
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        )
+        self.sync_client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.Client(limits=limits, timeout=timeout),
+        )
         self.default_model = "gpt-4"
 
+    async def warm_up(self, model: Optional[str] = None):
+        """Open a pooled TLS connection with a cheap request"""
+        await self.async_client.models.list()
+
+    async def close(self):
+        await self.async_client.close()
+        self.sync_client.close()
+
     async def process_text(self, text: str, prompt: str, model: Optional[str] = None) -> AsyncGenerator[str, None]:
         all_prompt = f"{prompt}\n\n{text}"
         model_name = model or self.default_model
@@ -85,11 +143,551 @@ class GPTProcessor(LLMProcessor):
         )
         return response.choices[0].message.content
 
-def get_llm_processor(model: str) -> LLMProcessor:
+    async def process_text_async(self, text: str, prompt: str, model: Optional[str] = None) -> str:
+        all_prompt = f"{prompt}\n\n{text}"
+        model_name = model or self.default_model
+        logger.info(f"Using model: {model_name} for async processing")
+        response = await self.async_client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {"role": "user", "content": all_prompt}
+            ]
+        )
+        return response.choices[0].message.content
+
+class ModelConcurrencyLimiter:
+    """
+    Caps in-flight LLM calls per model so a burst of slow requests to one model
+    queues up instead of exhausting upstream rate limits or starving other models.
+
+    With shared state that other workers see, the cap also holds across workers through a
+    counter per model. Each worker also records how many of those slots it holds in a
+    lease hash, renewed every lease / 3 seconds while it holds any. When a worker dies
+    mid-call its lease stops being renewed; once it is `lease` seconds old, the next worker
+    that finds the cap full removes it and gives its slots back to the counter. A worker
+    that was only slow may release those slots again later, so the counter is clamped at
+    zero whenever it goes down.
+    Within a worker, only one waiter per model polls the counter; the others queue locally.
+    """
+
+    def __init__(
+        self,
+        default_limit: int = 16,
+        limits: Optional[Dict[str, int]] = None,
+        shared: Optional[SharedState] = None,
+        lease: float = 30.0,
+        worker_id: Optional[str] = None,
+    ):
+        self.default_limit = default_limit
+        self.limits = dict(limits or {})
+        self.shared = shared if shared is not None and shared.shared else None
+        self.lease = lease
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._waiting: Dict[str, int] = defaultdict(int)
+        # Shared slots this worker holds, per model
+        self._held: Dict[str, int] = defaultdict(int)
+        self._pollers: Dict[str, asyncio.Lock] = {}
+        self._released: Dict[str, asyncio.Event] = {}
+        self._last_reclaim: Dict[str, float] = defaultdict(float)
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.slots_reclaimed = 0
+
+    @classmethod
+    def from_spec(
+        cls, spec: str, default_limit: int = 16, shared: Optional[SharedState] = None, **options
+    ) -> "ModelConcurrencyLimiter":
+        """Build from a "model=limit,model=limit" string, e.g. "o1-mini=8,gpt-4o=32" """
+        limits = {model: int(limit) for model, limit in parse_model_map(spec).items()}
+        return cls(default_limit, limits, shared=shared, **options)
+
+    def limit_for(self, model: str) -> int:
+        return self.limits.get(model.lower(), self.default_limit)
+
+    @asynccontextmanager
+    async def limit(self, model: str):
+        model = model.lower()
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores[model] = asyncio.Semaphore(self.limit_for(model))
+        self._waiting[model] += 1
+        try:
+            await semaphore.acquire()
+            try:
+                shared_slot = await self._acquire_shared(model)
+            except BaseException:
+                semaphore.release()
+                raise
+        finally:
+            self._waiting[model] -= 1
+        self._in_flight[model] += 1
+        try:
+            yield
+        finally:
+            self._in_flight[model] -= 1
+            if shared_slot:
+                await self._release_shared(model)
+            semaphore.release()
+
+    def _shared_key(self, model: str) -> str:
+        return f"brainwave:llm_in_flight:{model}"
+
+    def _lease_key(self, model: str) -> str:
+        return f"brainwave:llm_leases:{model}"
+
+    async def _acquire_shared(self, model: str) -> bool:
+        """Wait for a slot in the cross-worker counter; False if there is no usable one"""
+        if self.shared is None:
+            return False
+        poller = self._pollers.get(model)
+        if poller is None:
+            poller = self._pollers[model] = asyncio.Lock()
+            self._released[model] = asyncio.Event()
+        async with poller:
+            delay = 0.02
+            while True:
+                try:
+                    count = await self.shared.incr(self._shared_key(model), 1)
+                except Exception as e:
+                    # The local cap still applies; the shared one is back on the next call
+                    logger.warning(f"Shared concurrency limit unavailable for {model}: {e}")
+                    return False
+                if count <= self.limit_for(model):
+                    # Leased only once the slot is ours, so the lease never over-reports
+                    self._held[model] += 1
+                    try:
+                        await self._renew_lease(model)
+                    except Exception as e:
+                        logger.warning(f"Could not record {model} concurrency lease, retrying on the heartbeat: {e}")
+                    self._start_heartbeat()
+                    return True
+                try:
+                    await self._decrement(model, 1)
+                    if await self._reclaim(model):
+                        delay = 0
+                except Exception as e:
+                    logger.warning(f"Shared concurrency limit unavailable for {model}: {e}")
+                    return False
+                # A slot freed by this worker wakes the poller right away
+                released = self._released[model]
+                released.clear()
+                try:
+                    await asyncio.wait_for(released.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(max(delay * 2, 0.02), 0.5)
+
+    async def _release_shared(self, model: str):
+        self._held[model] -= 1
+        try:
+            await self._decrement(model, 1)
+            await self._renew_lease(model)
+        except Exception as e:
+            logger.warning(f"Could not release shared concurrency slot for {model}: {e}")
+        self._released[model].set()
+
+    async def _decrement(self, model: str, amount: int):
+        """Take slots off the shared counter, never below zero"""
+        count = await self.shared.incr(self._shared_key(model), -amount)
+        if count < 0:
+            # Slots released by a worker whose lease was already reclaimed
+            await self.shared.incr(self._shared_key(model), -count)
+
+    async def _renew_lease(self, model: str):
+        held = self._held[model]
+        if held > 0:
+            await self.shared.hset(self._lease_key(model), self.worker_id, f"{held} {time.time() + self.lease}")
+        else:
+            await self.shared.hdel(self._lease_key(model), self.worker_id)
+
+    async def _reclaim(self, model: str) -> bool:
+        """Give back the slots of workers whose lease ran out; True if any came back"""
+        now = time.time()
+        if now - self._last_reclaim[model] < self.lease / 3:
+            return False
+        self._last_reclaim[model] = now
+        reclaimed = 0
+        for worker, value in (await self.shared.hgetall(self._lease_key(model))).items():
+            count, expires_at = value.split()
+            # Only the worker whose delete succeeds gives the slots back, so they count once
+            if float(expires_at) < now and worker != self.worker_id \
+                    and await self.shared.hdel(self._lease_key(model), worker):
+                await self._decrement(model, int(count))
+                reclaimed += int(count)
+                logger.warning(f"Reclaimed {count} {model} slots from expired worker {worker}")
+        self.slots_reclaimed += reclaimed
+        return reclaimed > 0
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        """Keep this worker's leases fresh while it holds slots"""
+        while any(self._held.values()):
+            await asyncio.sleep(self.lease / 3)
+            for model, held in list(self._held.items()):
+                if held > 0:
+                    try:
+                        await self._renew_lease(model)
+                    except Exception as e:
+                        logger.warning(f"Could not renew {model} concurrency lease: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            model: {
+                "limit": self.limit_for(model),
+                "in_flight": self._in_flight[model],
+                "waiting": self._waiting[model],
+            }
+            for model in self._semaphores
+        }
+
+class _Flight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        # Replaced on every new chunk so each waiter wakes once per change
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent LLM streams: the first caller for a key starts the
+    upstream stream in a background task, and everyone asking for the same key while
+    it runs shares it. A late joiner gets the chunks emitted so far, then the live tail.
+    The upstream call is cancelled once every subscriber has gone away.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.upstream_streams = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+            self.upstream_streams += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight LLM stream after {len(flight.chunks)} chunks")
+        flight.subscribers += 1
+        try:
+            index = 0
+            while True:
+                changed = flight.changed
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                if changed is flight.changed:
+                    await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight(),
+            "upstream_streams": self.upstream_streams,
+            "coalesced": self.coalesced,
+        }
+
+    async def _run(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+def parse_model_map(spec: str) -> Dict[str, str]:
+    """Parse "model=value,model=value" settings; model names are lower-cased"""
+    result = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, value = item.partition("=")
+        if not value.strip():
+            raise ValueError(f"Invalid model setting: {item}")
+        result[model.strip().lower()] = value.strip()
+    return result
+
+def provider_for_model(model: str) -> str:
     model = model.lower()
     if model.startswith(('gemini', 'gemini-')):
-        return GeminiProcessor(default_model=model)
+        return "gemini"
     elif model.startswith(('gpt-', 'o1-')):
-        return GPTProcessor()
+        return "openai"
     else:
         raise ValueError(f"Unsupported model type: {model}")
+
+def get_llm_processor(model: str) -> LLMProcessor:
+    if provider_for_model(model) == "gemini":
+        return GeminiProcessor(default_model=model.lower())
+    return GPTProcessor()
+
+class ProcessorRegistry(LLMProcessor):
+    """
+    Routes each call to the processor for the model's provider, building one processor
+    per provider on first use.
+
+    With a latency SLO and a fallback model configured, a call whose first output hasn't
+    arrived within the SLO (or that fails before producing any) is retried on the fallback.
+    In "fallback" mode the slow call is abandoned; in "hedge" mode both keep running and
+    whichever answers first wins. Time to first output and total time are recorded per provider.
+
+    Callers hold the concurrency slot of the model they asked for; a rerouted call takes its
+    own slot from limiter for the fallback model. answered_by, when given, is told which
+    model the returned output comes from, before any of it is returned.
+    """
+
+    def __init__(
+        self,
+        default_model: str = "gpt-4o",
+        factories: Optional[Dict[str, Callable[[], LLMProcessor]]] = None,
+        fallbacks: Optional[Dict[str, str]] = None,
+        latency_slo: Optional[float] = None,
+        hedge: bool = False,
+        metrics_registry: Optional[Registry] = None,
+        limiter: Optional[ModelConcurrencyLimiter] = None,
+    ):
+        self.default_model = default_model
+        self.factories = factories or {"openai": GPTProcessor, "gemini": GeminiProcessor}
+        self.fallbacks = {model.lower(): fallback for model, fallback in (fallbacks or {}).items()}
+        self.latency_slo = latency_slo
+        self.hedge = hedge
+        self.limiter = limiter
+        self._processors: Dict[str, LLMProcessor] = {}
+        self.latency = Histogram(
+            "brainwave_llm_provider_seconds",
+            "Time to first output and total time of LLM calls per provider",
+            ["provider", "kind"],
+            registry=metrics_registry,
+        )
+        self.fallbacks_used = 0
+
+    def processor_for(self, model: str) -> LLMProcessor:
+        provider = provider_for_model(model)
+        processor = self._processors.get(provider)
+        if processor is None:
+            logger.info(f"Creating {provider} processor")
+            processor = self._processors[provider] = self.factories[provider]()
+        return processor
+
+    async def process_text(
+        self, text: str, prompt: str, model: Optional[str] = None,
+        answered_by: Optional[Callable[[str], None]] = None,
+    ) -> AsyncGenerator[str, None]:
+        model = model or self.default_model
+        fallback = self._fallback_for(model)
+        primary = self._timed_stream(model, text, prompt)
+        if fallback is None:
+            if answered_by:
+                answered_by(model)
+            async with aclosing(primary):
+                async for part in primary:
+                    yield part
+            return
+
+        # Race on the first chunk; the rest of the winning stream follows
+        streams = {asyncio.create_task(_next_chunk(primary)): primary}
+        models = {primary: model}
+        try:
+            done, _ = await asyncio.wait(streams, timeout=self.latency_slo)
+            if not done or not _succeeded(next(iter(streams))):
+                self.fallbacks_used += 1
+                logger.warning(f"{model} {'failed' if done else 'exceeded the latency SLO'}, routing to {fallback}")
+                if not self.hedge or done:
+                    await _abandon(streams)
+                    streams = {}
+                backup = self._timed_stream(fallback, text, prompt, rerouted=True)
+                streams[asyncio.create_task(_next_chunk(backup))] = backup
+                models[backup] = fallback
+            winner = await _first_success(streams)
+            stream = streams.pop(winner)
+        finally:
+            # Whether a stream won, every attempt failed or the caller went away,
+            # the others must not keep their upstream requests open
+            await _abandon(streams)
+        if answered_by:
+            answered_by(models[stream])
+
+        async with aclosing(stream):
+            try:
+                yield winner.result()
+            except StopAsyncIteration:
+                return
+            async for part in stream:
+                yield part
+
+    def process_text_sync(self, text: str, prompt: str, model: Optional[str] = None) -> str:
+        model = model or self.default_model
+        return self.processor_for(model).process_text_sync(text, prompt, model=model)
+
+    async def process_text_async(
+        self, text: str, prompt: str, model: Optional[str] = None,
+        answered_by: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        model = model or self.default_model
+        fallback = self._fallback_for(model)
+        primary = asyncio.create_task(self._timed_complete(model, text, prompt))
+        if fallback is None:
+            answer = await primary
+            if answered_by:
+                answered_by(model)
+            return answer
+
+        models = {primary: model}
+        try:
+            done, _ = await asyncio.wait(models, timeout=self.latency_slo)
+            if not done or not _succeeded(primary):
+                self.fallbacks_used += 1
+                logger.warning(f"{model} {'failed' if done else 'exceeded the latency SLO'}, routing to {fallback}")
+                if not self.hedge or done:
+                    primary.cancel()
+                    models = {}
+                models[asyncio.create_task(self._timed_complete(fallback, text, prompt, rerouted=True))] = fallback
+            winner = await _first_success(models)
+        finally:
+            # The losers, or every attempt if the caller went away
+            for task in models:
+                task.cancel()
+        if answered_by:
+            answered_by(models[winner])
+        return winner.result()
+
+    async def warm_up(self, models=()):
+        """Build the processors for these models and let each open its connections"""
+        for model in models:
+            try:
+                await self.processor_for(model).warm_up(model)
+                logger.info(f"Warmed up {model}")
+            except Exception as e:
+                logger.warning(f"Warm-up for {model} failed: {e}")
+
+    async def close(self):
+        for processor in self._processors.values():
+            await processor.close()
+        self._processors.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "providers": sorted(self._processors),
+            "fallbacks_used": self.fallbacks_used,
+            "latency": self._latency_stats(),
+        }
+
+    def _latency_stats(self) -> Dict[str, Dict[str, Dict[str, object]]]:
+        latency: Dict[str, Dict[str, Dict[str, object]]] = {}
+        for (provider, kind), histogram in self.latency.children().items():
+            latency.setdefault(provider, {})[kind] = {
+                "count": histogram.count,
+                "sum": round(histogram.sum, 3),
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+            }
+        return latency
+
+    def _fallback_for(self, model: str) -> Optional[str]:
+        if self.latency_slo is None:
+            return None
+        fallback = self.fallbacks.get(model.lower())
+        if fallback is None:
+            return None
+        try:
+            self.processor_for(fallback)
+        except Exception as e:
+            logger.warning(f"Fallback {fallback} for {model} unavailable: {e}")
+            return None
+        return fallback
+
+    def _observe(self, model: str, kind: str, seconds: float):
+        self.latency.labels(provider_for_model(model), kind).observe(seconds)
+
+    def _slot(self, model: str, rerouted: bool):
+        """The concurrency slot a rerouted call needs; the caller already holds one for its own model"""
+        if rerouted and self.limiter is not None:
+            return self.limiter.limit(model)
+        return nullcontext()
+
+    async def _timed_stream(
+        self, model: str, text: str, prompt: str, rerouted: bool = False
+    ) -> AsyncGenerator[str, None]:
+        processor = self.processor_for(model)
+        async with self._slot(model, rerouted):
+            started = time.monotonic()
+            first = True
+            # Closing this stream closes the provider's, ending its upstream request
+            async with aclosing(processor.process_text(text, prompt, model=model)) as parts:
+                async for part in parts:
+                    if first:
+                        self._observe(model, "first_output", time.monotonic() - started)
+                        first = False
+                    yield part
+            self._observe(model, "total", time.monotonic() - started)
+
+    async def _timed_complete(self, model: str, text: str, prompt: str, rerouted: bool = False) -> str:
+        async with self._slot(model, rerouted):
+            started = time.monotonic()
+            answer = await self.processor_for(model).process_text_async(text, prompt, model=model)
+        elapsed = time.monotonic() - started
+        self._observe(model, "first_output", elapsed)
+        self._observe(model, "total", elapsed)
+        return answer
+
+async def _next_chunk(stream: AsyncIterator[str]) -> str:
+    return await stream.__anext__()
+
+def _succeeded(task: asyncio.Task) -> bool:
+    """Finished without an error; an empty stream (StopAsyncIteration) counts as success"""
+    if task.cancelled():
+        return False
+    error = task.exception()
+    return error is None or isinstance(error, StopAsyncIteration)
+
+async def _first_success(tasks) -> asyncio.Task:
+    """Wait for the first task to succeed, or raise the last error if none do"""
+    pending = set(tasks)
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if _succeeded(task):
+                    return task
+                error = task.exception() if not task.cancelled() else asyncio.CancelledError()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise error
+
+async def _abandon(streams: Dict[asyncio.Task, AsyncIterator[str]]):
+    """Cancel pending first-chunk reads and close their streams"""
+    for task, stream in streams.items():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await stream.aclose()
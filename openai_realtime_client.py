@@ -1,29 +1,97 @@
 import websockets
 import json
-import base64
+import binascii
 import logging
 import time
-from typing import Optional, Callable, Dict, List
+from collections import deque
+from typing import Optional, Callable, Deque, Dict, List
 import asyncio
+from metrics import Counter, Histogram
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+CONNECT_SECONDS = Histogram(
+    "brainwave_realtime_connect_seconds",
+    "Time to open and configure an OpenAI realtime session",
+)
+REALTIME_BYTES = Counter(
+    "brainwave_realtime_bytes",
+    "Bytes of websocket messages exchanged with the OpenAI realtime API",
+    ["direction"],
+)
+
+# Dispatch modes: run handlers inside the receive loop, or from a per-session queue
+DISPATCH_INLINE = "inline"
+DISPATCH_QUEUED = "queued"
+
+# What the queued dispatcher does when its queue is full
+BACKPRESSURE_BLOCK = "block"        # stop reading from OpenAI until there is room
+BACKPRESSURE_COALESCE = "coalesce"  # also merge queued text deltas while the consumer is behind
+
+# Fields that must match for two response.text.delta events to be merged
+_DELTA_KEYS = ("response_id", "item_id", "output_index", "content_index")
+
+# input_audio_buffer.append exactly as json.dumps writes it; the base64 audio is spliced in
+# between, which needs no escaping
+_APPEND_PREFIX = b'{"type": "input_audio_buffer.append", "audio": "'
+_APPEND_SUFFIX = b'"}'
+
 class OpenAIRealtimeAudioTextClient:
-    def __init__(self, api_key: str, model: str = "gpt-4o-realtime-preview"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4o-realtime-preview",
+        dispatch_mode: str = DISPATCH_INLINE,
+        max_queue_size: int = 256,
+        backpressure: str = BACKPRESSURE_COALESCE,
+        min_append_bytes: int = 0,
+        base_url: str = "wss://api.openai.com/v1/realtime",
+    ):
         self.api_key = api_key
         self.model = model
         self.ws = None
         self.session_id = None
-        self.base_url = "wss://api.openai.com/v1/realtime"
+        self.connected_at: Optional[float] = None
+        self.base_url = base_url
         self.last_audio_time = None 
         self.auto_commit_interval = 5
         self.receive_task = None
         self.handlers: Dict[str, Callable[[dict], asyncio.Future]] = {}
-        self.queue = asyncio.Queue()
+
+        # Queued dispatch: the receive loop only parses and enqueues, a worker runs handlers
+        self.dispatch_mode = dispatch_mode
+        self.max_queue_size = max_queue_size
+        self.backpressure = backpressure
+        self.dispatch_task = None
+        self.queue: Deque[dict] = deque()
+        self._queue_not_empty = asyncio.Event()
+        self._queue_not_full = asyncio.Event()
+        self._closed = False
+        self.max_queue_depth = 0
+        self.coalesced_events = 0
+        self.blocked_enqueues = 0
+
+        # Audio appends: small chunks are held until min_append_bytes have piled up. Each
+        # message is assembled in one buffer kept across appends, which saves allocating
+        # it but not copying into it: the audio is still copied by the base64 encoding,
+        # into the buffer and again when decoded to the str that ws.send takes
+        self.min_append_bytes = min_append_bytes
+        self._pending_audio = bytearray()
+        self._append_message = bytearray(_APPEND_PREFIX)
+        self.appends_sent = 0
+        self.audio_bytes_sent = 0
+
+        # Tracing: when the handshake steps happened (time.time_ns()), so the span can be
+        # recorded later by whoever uses a pre-connected session, and the span audio
+        # appends are recorded under while it is set
+        self.connect_times: Dict[str, int] = {}
+        self.trace_parent = None
         
     async def connect(self, modalities: List[str] = ["text"]):
         """Connect to OpenAI's realtime API and configure the session"""
+        started = time.monotonic()
+        self.connect_times = {"started": time.time_ns()}
         self.ws = await websockets.connect(
             f"{self.base_url}?model={self.model}",
             extra_headers={
@@ -35,12 +103,13 @@ class OpenAIRealtimeAudioTextClient:
         # Wait for session creation
         response = await self.ws.recv()
         response_data = json.loads(response)
+        self.connect_times["session_created"] = time.time_ns()
         if response_data["type"] == "session.created":
             self.session_id = response_data["session"]["id"]
             logger.info(f"Session created with ID: {self.session_id}")
             
             # Configure session
-            await self.ws.send(json.dumps({
+            await self._send_json({
                 "type": "session.update",
                 "session": {
                     "modalities": modalities,
@@ -48,29 +117,106 @@ class OpenAIRealtimeAudioTextClient:
                     "input_audio_transcription": None,
                     "turn_detection": None,
                 }
-            }))
+            })
+            self.connect_times["session_update_sent"] = time.time_ns()
+            CONNECT_SECONDS.observe(time.monotonic() - started)
         
         # Register the default handler
         self.register_handler("default", self.default_handler)
+        # The answer to session.update usually arrives while a pre-warmed session has no
+        # other handlers yet; it is expected, so it shouldn't be logged as unhandled
+        self.register_handler("session.updated", self.session_updated_handler)
         
         # Start the receiver coroutine
         self.receive_task = asyncio.create_task(self.receive_messages())
+        if self.dispatch_mode == DISPATCH_QUEUED:
+            self.dispatch_task = asyncio.create_task(self.dispatch_messages())
+        self.connected_at = time.monotonic()
+
+    def is_healthy(self, max_age: Optional[float] = None) -> bool:
+        """Whether the session is still open, receiving, and younger than max_age seconds"""
+        if not (self.ws and self.ws.open) or self.connected_at is None:
+            return False
+        if self.receive_task is None or self.receive_task.done():
+            return False
+        if self.dispatch_task is not None and self.dispatch_task.done():
+            return False
+        if max_age is not None and time.monotonic() - self.connected_at > max_age:
+            return False
+        return True
     
     async def receive_messages(self):
         try:
             async for message in self.ws:
+                REALTIME_BYTES.labels("received").inc(len(message))
                 data = json.loads(message)
-                message_type = data.get("type", "default")
-                handler = self.handlers.get(message_type, self.handlers.get("default"))
-                if handler:
-                    await handler(data)
+                if "session_updated" not in self.connect_times and data.get("type") == "session.updated":
+                    self.connect_times["session_updated"] = time.time_ns()
+                if self.dispatch_mode == DISPATCH_QUEUED:
+                    await self._enqueue(data)
                 else:
-                    logger.warning(f"No handler for message type: {message_type}")
+                    await self._dispatch(data)
         except websockets.exceptions.ConnectionClosed as e:
             logger.error(f"OpenAI WebSocket connection closed: {e}")
         except Exception as e:
             logger.error(f"Error in receive_messages: {e}", exc_info=True)
     
+    async def _dispatch(self, data: dict):
+        message_type = data.get("type", "default")
+        handler = self.handlers.get(message_type, self.handlers.get("default"))
+        if handler:
+            await handler(data)
+        else:
+            logger.warning(f"No handler for message type: {message_type}")
+
+    async def _enqueue(self, data: dict):
+        if self.backpressure == BACKPRESSURE_COALESCE and self._coalesce(data):
+            return
+        if len(self.queue) >= self.max_queue_size:
+            # Backpressure: stop reading from OpenAI until the worker catches up
+            self.blocked_enqueues += 1
+            while len(self.queue) >= self.max_queue_size and not self._closed:
+                self._queue_not_full.clear()
+                await self._queue_not_full.wait()
+        self.queue.append(data)
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        self._queue_not_empty.set()
+
+    def _coalesce(self, data: dict) -> bool:
+        """Merge a text delta into the last queued one; only possible while the worker is behind"""
+        if data.get("type") != "response.text.delta" or not self.queue:
+            return False
+        last = self.queue[-1]
+        if last.get("type") != "response.text.delta":
+            return False
+        if any(last.get(key) != data.get(key) for key in _DELTA_KEYS):
+            return False
+        last["delta"] = last.get("delta", "") + data.get("delta", "")
+        self.coalesced_events += 1
+        return True
+
+    async def dispatch_messages(self):
+        """Worker that runs handlers for queued events, so slow handlers don't stall the receive loop"""
+        while not self._closed:
+            if not self.queue:
+                self._queue_not_empty.clear()
+                await self._queue_not_empty.wait()
+                continue
+            data = self.queue.popleft()
+            self._queue_not_full.set()
+            try:
+                await self._dispatch(data)
+            except Exception as e:
+                logger.error(f"Error in handler for {data.get('type')}: {e}", exc_info=True)
+
+    def dispatch_stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_queue_depth,
+            "coalesced_events": self.coalesced_events,
+            "blocked_enqueues": self.blocked_enqueues,
+        }
+
     def register_handler(self, message_type: str, handler: Callable[[dict], asyncio.Future]):
         self.handlers[message_type] = handler
     
@@ -78,21 +224,60 @@ class OpenAIRealtimeAudioTextClient:
         message_type = data.get("type", "unknown")
         logger.warning(f"Unhandled message type received from OpenAI: {message_type}")
     
+    async def session_updated_handler(self, data: dict):
+        logger.debug(f"Session {self.session_id} updated")
+
     async def send_audio(self, audio_data: bytes):
-        if self.ws and self.ws.open:
-            await self.ws.send(json.dumps({
-                "type": "input_audio_buffer.append",
-                "audio": base64.b64encode(audio_data).decode('utf-8')
-            }))
-            logger.info("Sent input_audio_buffer.append message to OpenAI")
-        else:
+        """Append audio; below min_append_bytes it is held until more arrives or the next commit"""
+        if not (self.ws and self.ws.open):
             logger.error("WebSocket is not open. Cannot send audio.")
+            return
+        if self.min_append_bytes:
+            self._pending_audio += audio_data
+            if len(self._pending_audio) < self.min_append_bytes:
+                return
+            audio_data = self._pending_audio
+        await self._send_append(audio_data)
+
+    async def flush_audio(self):
+        """Send audio held back by send_audio"""
+        if self._pending_audio and self.ws and self.ws.open:
+            await self._send_append(self._pending_audio)
+
+    async def _send_append(self, audio_data):
+        size = len(audio_data)
+        message = self._append_message
+        del message[len(_APPEND_PREFIX):]
+        message += binascii.b2a_base64(audio_data, newline=False)
+        message += _APPEND_SUFFIX
+        self.appends_sent += 1
+        self.audio_bytes_sent += size
+        # Encoded above, so the held audio can be reused before the send yields
+        self._pending_audio.clear()
+        REALTIME_BYTES.labels("sent").inc(len(message))
+        started = time.time_ns()
+        await self.ws.send(message.decode("ascii"))
+        if self.trace_parent is not None:
+            self.trace_parent.record("realtime.append", started, time.time_ns(), audio_bytes=size)
+        logger.debug(f"Sent input_audio_buffer.append message to OpenAI, {size} bytes")
+
+    def append_stats(self) -> Dict[str, int]:
+        return {
+            "appends_sent": self.appends_sent,
+            "audio_bytes_sent": self.audio_bytes_sent,
+            "pending_audio_bytes": len(self._pending_audio),
+        }
     
+    async def _send_json(self, event: dict):
+        message = json.dumps(event)
+        REALTIME_BYTES.labels("sent").inc(len(message))
+        await self.ws.send(message)
+
     async def commit_audio(self):
         """Commit the audio buffer and notify OpenAI"""
         if self.ws and self.ws.open:
-            commit_message = json.dumps({"type": "input_audio_buffer.commit"})
-            await self.ws.send(commit_message)
+            await self.flush_audio()
+            await self._send_json({"type": "input_audio_buffer.commit"})
             logger.info("Sent input_audio_buffer.commit message to OpenAI")
             # No recv call here. The receive_messages coroutine handles incoming messages.
         else:
@@ -100,9 +285,9 @@ class OpenAIRealtimeAudioTextClient:
     
     async def clear_audio_buffer(self):
         """Clear the audio buffer"""
+        self._pending_audio.clear()
         if self.ws and self.ws.open:
-            clear_message = json.dumps({"type": "input_audio_buffer.clear"})
-            await self.ws.send(clear_message)
+            await self._send_json({"type": "input_audio_buffer.clear"})
             logger.info("Sent input_audio_buffer.clear message to OpenAI")
         else:
             logger.error("WebSocket is not open. Cannot clear audio buffer.")
@@ -110,25 +295,39 @@ class OpenAIRealtimeAudioTextClient:
     async def start_response(self, instructions: str):
         """Start a new response with given instructions"""
         if self.ws and self.ws.open:
-            await self.ws.send(json.dumps({
+            await self._send_json({
                 "type": "response.create",
                 "response": {
                     "modalities": ["text"],
                     "instructions": instructions
                 }
-            }))
+            })
             logger.info(f"Started response with instructions: {instructions}")
         else:
             logger.error("WebSocket is not open. Cannot start response.")
     
     async def close(self):
         """Close the WebSocket connection"""
-        if self.ws:
-            await self.ws.close()
-            logger.info("Closed OpenAI WebSocket connection")
-        if self.receive_task:
-            self.receive_task.cancel()
-            try:
-                await self.receive_task
-            except asyncio.CancelledError:
-                pass
+        self._closed = True
+        # Wake the dispatch worker and any blocked enqueue so they can exit
+        self._queue_not_empty.set()
+        self._queue_not_full.set()
+        try:
+            if self.ws:
+                await self.ws.close()
+                logger.info("Closed OpenAI WebSocket connection")
+        finally:
+            # close() may be called from a handler running inside one of these tasks;
+            # that task then finishes on its own once the handler returns
+            for task in (self.receive_task, self.dispatch_task):
+                if task and task is not asyncio.current_task():
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+            # Handlers close over the browser connection that used this session
+            self.handlers.clear()
+            self.queue.clear()
+            self._pending_audio.clear()
+            self.trace_parent = None
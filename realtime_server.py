@@ -1,25 +1,44 @@
 import asyncio
 import json
 import os
+import socket
+import time
+import uuid
 from dotenv import load_dotenv
 import numpy as np
 from fastapi import FastAPI, WebSocket, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, PlainTextResponse
 import uvicorn
 import logging
 from prompts import PROMPTS
-from openai_realtime_client import OpenAIRealtimeAudioTextClient
+from openai_realtime_client import OpenAIRealtimeAudioTextClient, DISPATCH_QUEUED
+from realtime_session_pool import RealtimeSessionPool
+from audio_resampler import StreamingResampler
+from audio_codecs import OpusDecoder, OPUS_SAMPLE_RATE, opus_available
+from audio_preroll import PreRollBuffer
+from delta_batcher import DeltaBatcher
+from journal import JournalWriter
+from response_cache import ResponseCache, cache_key, replay
+from speculative import SpeculativeRunner
+from text_chunker import split_text, overlap_context, stream_in_order
+from live_transcription import LiveSegmenter, segment_separator
+from transcript_buffer import TranscriptBuffer
+from audio_vad import VoiceActivityGate
+from shared_state import shared_state_from_url
+import tracing
+from tracing import Tracer, exporter_from_url, SPAN_KIND_CLIENT, SPAN_KIND_SERVER
+from metrics import REGISTRY, Counter, Gauge, Histogram, CPU_BUCKETS, merge_families, render
 from starlette.websockets import WebSocketState
 import wave
-import datetime
-import scipy.signal
 from openai import OpenAI, AsyncOpenAI
 from pydantic import BaseModel, Field
 from typing import Generator
-from llm_processor import get_llm_processor
-from datetime import datetime, timedelta
+from llm_processor import (
+    ProcessorRegistry, GPTProcessor, GeminiProcessor, ModelConcurrencyLimiter, SingleFlight, parse_model_map,
+)
 import argparse
+from contextlib import asynccontextmanager
 import pyperclip  # 添加剪贴板库
 
 # Configure logging
@@ -59,78 +78,531 @@ class ClipboardResponse(BaseModel):
     success: bool = Field(..., description="Whether the operation was successful.")
     message: str = Field(..., description="A message describing the result of the operation.")
 
-app = FastAPI()
-
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.error("OPENAI_API_KEY is not set in environment variables.")
     raise EnvironmentError("OPENAI_API_KEY is not set.")
 
-# Initialize with a default model
-llm_processor = get_llm_processor("gpt-4o")  # Default processor
+# Audio kept while a realtime session is being set up: 10 seconds of 24kHz PCM16
+PREROLL_MAX_BYTES = int(os.getenv("PREROLL_MAX_BYTES", str(24000 * 2 * 10)))
+# Transcript characters kept per recording for logging and post-processing (0 for no limit);
+# the browser still receives all of the text
+MAX_TRANSCRIPT_CHARS = int(os.getenv("MAX_TRANSCRIPT_CHARS", "200000"))
+# Stopped recordings per connection still waiting for their transcription; each holds a
+# realtime session, so start_recording beyond this is refused
+MAX_PENDING_RECORDINGS = int(os.getenv("MAX_PENDING_RECORDINGS", "3"))
+# Largest websocket message taken from the browser; audio frames are a few KB
+MAX_WS_MESSAGE_BYTES = int(os.getenv("MAX_WS_MESSAGE_BYTES", str(256 * 1024)))
+
+# How long a stopped recording may wait for its transcription
+RESPONSE_TIMEOUT = float(os.getenv("RESPONSE_TIMEOUT", "120"))
+
+# Text deltas to the browser are batched per time window or once this many characters pile up
+TEXT_BATCH_WINDOW_MS = int(os.getenv("TEXT_BATCH_WINDOW_MS", "40"))
+TEXT_BATCH_MAX_CHARS = int(os.getenv("TEXT_BATCH_MAX_CHARS", "512"))
+
+# Opt-in: post-process every finished transcript before the user asks, e.g.
+# SPECULATIVE_POSTPROCESS="readability,correctness", within a per-session cost cap
+SPECULATIVE_PROMPTS = {"readability": "readability-enhance", "correctness": "correctness-check"}
+SPECULATIVE_POSTPROCESS = [
+    name.strip() for name in os.getenv("SPECULATIVE_POSTPROCESS", "").split(",") if name.strip()
+]
+SPECULATIVE_MAX_RUNS = int(os.getenv("SPECULATIVE_MAX_RUNS", "20"))
+SPECULATIVE_MAX_CHARS = int(os.getenv("SPECULATIVE_MAX_CHARS", "50000"))
+
+# Readability for long dictations: above the threshold the text is split into chunks that are
+# enhanced concurrently and streamed back in order, each with the tail of the previous one as context
+READABILITY_CHUNK_THRESHOLD = int(os.getenv("READABILITY_CHUNK_THRESHOLD", "6000"))
+READABILITY_CHUNK_CHARS = int(os.getenv("READABILITY_CHUNK_CHARS", "2000"))
+READABILITY_CHUNK_OVERLAP = int(os.getenv("READABILITY_CHUNK_OVERLAP", "300"))
+READABILITY_CHUNK_CONCURRENCY = int(os.getenv("READABILITY_CHUNK_CONCURRENCY", "4"))
+
+# Live transcription: commit audio at pauses (or every LIVE_SEGMENT_MAX_SECONDS) while recording
+# and show each segment's text as it arrives. On for everyone with LIVE_TRANSCRIPTION=1, or per
+# recording when the browser asks for it (?live=1)
+LIVE_TRANSCRIPTION = os.getenv("LIVE_TRANSCRIPTION", "0") == "1"
+LIVE_SEGMENT_MIN_SECONDS = float(os.getenv("LIVE_SEGMENT_MIN_SECONDS", "3"))
+LIVE_SEGMENT_MAX_SECONDS = float(os.getenv("LIVE_SEGMENT_MAX_SECONDS", "15"))
+LIVE_SEGMENT_SILENCE_MS = int(os.getenv("LIVE_SEGMENT_SILENCE_MS", "600"))
+LIVE_SILENCE_RMS = float(os.getenv("LIVE_SILENCE_RMS", "500"))
+
+# Server-side voice activity detection: leading and trailing silence is not uploaded and long
+# pauses are cut down to VAD_MAX_PAUSE_MS. The hangover after speech and the lookback before it
+# keep word endings and onsets intact. Off by default, since it changes what is uploaded
+VAD_ENABLED = os.getenv("VAD_ENABLED", "0") == "1"
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "-50"))
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "300"))
+VAD_LOOKBACK_MS = int(os.getenv("VAD_LOOKBACK_MS", "200"))
+VAD_MAX_PAUSE_MS = int(os.getenv("VAD_MAX_PAUSE_MS", "700"))
+
+# State every worker must see when running several (--workers, or several hosts behind a proxy):
+# the shared response cache tier, global LLM concurrency limits and per-worker stats.
+# Empty keeps it in-process; redis://host:port/db points at Redis or the state_server.py stand-in
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")
+# How often each worker publishes its stats to the shared state, in seconds
+STATS_PUBLISH_INTERVAL = float(os.getenv("STATS_PUBLISH_INTERVAL", "5"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+WORKERS_KEY = "brainwave:workers"
+METRICS_KEY = "brainwave:metrics"
+
+shared_state = shared_state_from_url(SHARED_STATE_URL)
+
+# Where finished trace spans go as OpenTelemetry JSON: empty for nowhere, a file path
+# (one OTLP/JSON batch per line), or an OTLP/HTTP collector like http://localhost:4318
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+tracer = Tracer(exporter_from_url(TRACE_EXPORT), resource={"service.instance.id": WORKER_ID})
+
+# Handlers write to the browser socket, so they run from a bounded per-session queue
+# rather than inside the OpenAI receive loop; text deltas are coalesced while it backs up
+REALTIME_EVENT_QUEUE_SIZE = int(os.getenv("REALTIME_EVENT_QUEUE_SIZE", "256"))
+REALTIME_BACKPRESSURE = os.getenv("REALTIME_BACKPRESSURE", "coalesce")
+# Audio is appended to the realtime session in messages of at least this much audio (0 sends
+# every chunk as it arrives); the commit always sends whatever is left
+REALTIME_APPEND_MS = int(os.getenv("REALTIME_APPEND_MS", "200"))
+# Realtime API endpoint; override to use a proxy or a local mock
+OPENAI_REALTIME_URL = os.getenv("OPENAI_REALTIME_URL", "wss://api.openai.com/v1/realtime")
+
+# Pre-warmed realtime sessions so start_recording doesn't pay the handshake
+session_pool = RealtimeSessionPool(
+    lambda: OpenAIRealtimeAudioTextClient(
+        OPENAI_API_KEY,
+        dispatch_mode=DISPATCH_QUEUED,
+        max_queue_size=REALTIME_EVENT_QUEUE_SIZE,
+        backpressure=REALTIME_BACKPRESSURE,
+        min_append_bytes=24000 * 2 * REALTIME_APPEND_MS // 1000,
+        base_url=OPENAI_REALTIME_URL,
+    ),
+    size=int(os.getenv("REALTIME_POOL_SIZE", "2")),
+    max_age=float(os.getenv("REALTIME_POOL_MAX_AGE", "600")),
+)
+
+# Transcripts and LLM results go to JOURNAL_DIR/YYYY-MM-DD.jsonl (logs/ by default) through a
+# batched background writer
+journal = JournalWriter(
+    os.getenv("JOURNAL_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs"),
+    fsync=os.getenv("JOURNAL_FSYNC", "never"),
+    fsync_interval=float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1.0")),
+)
+
+# Build LLM clients and open their connections at startup rather than on the first request
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+LLM_WARMUP_TIMEOUT = float(os.getenv("LLM_WARMUP_TIMEOUT", "10"))
+
+async def warm_up_llm():
+    models = set(ENDPOINT_MODELS.values()) | set(llm_processor.fallbacks.values())
+    try:
+        await asyncio.wait_for(llm_processor.warm_up(sorted(models)), timeout=LLM_WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"LLM warm-up did not finish within {LLM_WARMUP_TIMEOUT} seconds")
+
+async def publish_worker_stats():
+    """Keep this worker's stats in the shared state, where /api/v1/stats on any worker finds them"""
+    try:
+        while True:
+            try:
+                snapshot = {"updated": time.time(), **local_stats()}
+                await shared_state.hset(WORKERS_KEY, WORKER_ID, json.dumps(snapshot))
+                metrics = {"updated": time.time(), "families": REGISTRY.collect()}
+                await shared_state.hset(METRICS_KEY, WORKER_ID, json.dumps(metrics))
+            except Exception as e:
+                logger.warning(f"Could not publish worker stats: {e}")
+            await asyncio.sleep(STATS_PUBLISH_INTERVAL)
+    finally:
+        try:
+            await shared_state.hdel(WORKERS_KEY, WORKER_ID)
+            await shared_state.hdel(METRICS_KEY, WORKER_ID)
+        except Exception:
+            pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await journal.start()
+    await tracer.start()
+    await session_pool.start()
+    # Runs in the background so startup isn't held up by a slow provider
+    warmup_task = asyncio.create_task(warm_up_llm()) if LLM_WARMUP else None
+    stats_task = asyncio.create_task(publish_worker_stats()) if shared_state.shared else None
+    try:
+        yield
+    finally:
+        if warmup_task:
+            warmup_task.cancel()
+        if stats_task:
+            stats_task.cancel()
+            try:
+                await stats_task
+            except asyncio.CancelledError:
+                pass
+        await session_pool.stop()
+        await llm_processor.close()
+        # Flush every queued record and span before exiting
+        await journal.stop()
+        await tracer.stop()
+        response_cache.close()
+        await shared_state.close()
+
+app = FastAPI(lifespan=lifespan)
+
+class WebSocketByteCounter:
+    """ASGI middleware counting the bytes of every websocket message to and from browsers"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            await self.app(scope, receive, send)
+            return
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                BROWSER_BYTES.labels("received").inc(_message_size(message))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "websocket.send":
+                BROWSER_BYTES.labels("sent").inc(_message_size(message))
+            await send(message)
+
+        await self.app(scope, counting_receive, counting_send)
+
+def _message_size(message):
+    if message.get("bytes") is not None:
+        return len(message["bytes"])
+    return len((message.get("text") or "").encode("utf-8"))
+
+app.add_middleware(WebSocketByteCounter)
+
+class TraceMiddleware:
+    """
+    ASGI middleware giving every API request and websocket session a root span, continuing
+    the caller's trace when it sends a W3C traceparent header. HTTP responses carry the
+    trace back in traceparent and X-Trace-Id; the websocket endpoint sends it in its first message.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        if scope["type"] == "websocket":
+            name = f"WEBSOCKET {scope['path']}"
+        else:
+            name = f"{scope['method']} {scope['path']}"
+        span = tracer.start_span(name, traceparent=traceparent, kind=SPAN_KIND_SERVER)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"traceparent", span.traceparent.encode()),
+                    (b"x-trace-id", span.trace_id.encode()),
+                ]}
+            await send(message)
+
+        with span, tracing.use_span(span):
+            await self.app(scope, receive, traced_send)
+
+app.add_middleware(TraceMiddleware)
+
+# Model per endpoint; any OpenAI ("gpt-", "o1-") or Gemini ("gemini-") model name works
+ENDPOINT_MODELS = {
+    "readability": os.getenv("READABILITY_MODEL", "gpt-4o"),
+    "correctness": os.getenv("CORRECTNESS_MODEL", "gpt-4o"),
+    "ask_ai": os.getenv("ASK_AI_MODEL", "o1-mini"),
+}
+
+# In-flight LLM calls per model, e.g. LLM_CONCURRENCY="o1-mini=8,gpt-4o=32"; other models use the default
+llm_limiter = ModelConcurrencyLimiter.from_spec(
+    os.getenv("LLM_CONCURRENCY", ""),
+    default_limit=int(os.getenv("LLM_CONCURRENCY_DEFAULT", "16")),
+    shared=shared_state,
+    worker_id=WORKER_ID,
+)
+
+# Routes each call to its provider's processor, built on first use.
+# LLM_FALLBACKS="gpt-4o=gemini-1.5-pro" retries on another model once LLM_LATENCY_SLO seconds
+# pass without output; LLM_ROUTING=hedge keeps the slow call racing instead of abandoning it.
+# A rerouted call takes the fallback model's slot from llm_limiter.
+llm_processor = ProcessorRegistry(
+    default_model="gpt-4o",
+    factories={
+        "openai": lambda: GPTProcessor(
+            max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60")),
+        ),
+        "gemini": GeminiProcessor,
+    },
+    fallbacks=parse_model_map(os.getenv("LLM_FALLBACKS", "")),
+    latency_slo=float(os.getenv("LLM_LATENCY_SLO")) if os.getenv("LLM_LATENCY_SLO") else None,
+    hedge=os.getenv("LLM_ROUTING", "fallback") == "hedge",
+    metrics_registry=REGISTRY,
+    limiter=llm_limiter,
+)
+
+# Complete LLM answers keyed on (prompt, model, normalized text); RESPONSE_CACHE_DB adds a SQLite tier
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    db_path=os.getenv("RESPONSE_CACHE_DB") or None,
+    shared=shared_state if shared_state.shared else None,
+)
+
+# Identical requests in flight at the same time share one upstream call
+llm_single_flight = SingleFlight()
+
+# Prometheus metrics, served by /metrics
+ACTIVE_SESSIONS = Gauge("brainwave_active_sessions", "Open /api/v1/ws connections")
+STOP_TO_FIRST_DELTA_SECONDS = Histogram(
+    "brainwave_stop_to_first_delta_seconds", "From stop_recording to the first transcript text"
+)
+STOP_TO_DONE_SECONDS = Histogram(
+    "brainwave_stop_to_done_seconds", "From stop_recording to the transcript's response.done"
+)
+AUDIO_CHUNK_CPU_SECONDS = Histogram(
+    "brainwave_audio_chunk_cpu_seconds", "CPU time of process_audio_chunk per audio chunk", buckets=CPU_BUCKETS
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "brainwave_llm_first_token_seconds", "Time to the first output of an LLM call", ["endpoint", "model"]
+)
+LLM_SECONDS = Histogram("brainwave_llm_seconds", "Total time of an LLM call", ["endpoint", "model"])
+BROWSER_BYTES = Counter("brainwave_browser_bytes", "Bytes of websocket messages exchanged with browsers", ["direction"])
+QUEUE_DEPTH = Gauge("brainwave_queue_depth", "Items waiting in internal queues", ["queue"])
+LLM_IN_FLIGHT = Gauge("brainwave_llm_in_flight", "LLM calls running per model", ["model"])
+REALTIME_POOL_IDLE = Gauge("brainwave_realtime_pool_idle", "Pre-connected realtime sessions ready to use")
+
+# Endpoint label for each prompt, including speculative runs of the same prompts
+PROMPT_ENDPOINTS = {
+    "readability-enhance": "readability",
+    "readability-enhance-chunk": "readability",
+    "correctness-check": "correctness",
+    "ask-ai": "ask_ai",
+}
+
+# Realtime sessions currently serving a recording, for the event queue depth
+active_realtime_clients = set()
+
+QUEUE_DEPTH.set_function(lambda: {
+    ("journal",): journal.stats()["queued"],
+    ("realtime_events",): sum(len(client.queue) for client in active_realtime_clients),
+    ("llm_waiting",): sum(model["waiting"] for model in llm_limiter.stats().values()),
+})
+LLM_IN_FLIGHT.set_function(lambda: {(model,): stats["in_flight"] for model, stats in llm_limiter.stats().items()})
+REALTIME_POOL_IDLE.set_function(lambda: session_pool.metrics()["idle"])
+
+async def stream_llm(text, prompt_key, model):
+    """
+    Stream an LLM answer, holding the model's concurrency slot until the stream ends.
+    A cached answer is replayed as a stream; a fresh one is cached once it completes,
+    under the model that gave it when the call was rerouted to a fallback.
+    """
+    key = cache_key(prompt_key, model, text, PROMPTS[prompt_key])
+    cached = await response_cache.get(key)
+    if cached is not None:
+        async for part in replay(cached):
+            yield part
+        return
+
+    async def upstream():
+        parts = []
+        answered_by = model
+
+        def record_model(used):
+            nonlocal answered_by
+            answered_by = used
+
+        labels = (PROMPT_ENDPOINTS.get(prompt_key, prompt_key), model)
+        with tracing.span(f"llm.{labels[0]}", kind=SPAN_KIND_CLIENT, model=model, prompt=prompt_key,
+                          input_chars=len(text)) as span:
+            async with llm_limiter.limit(model):
+                if span:
+                    span.add_event("admitted")
+                started = time.monotonic()
+                async for part in llm_processor.process_text(text, PROMPTS[prompt_key], model=model,
+                                                             answered_by=record_model):
+                    if not parts:
+                        LLM_FIRST_TOKEN_SECONDS.labels(*labels).observe(time.monotonic() - started)
+                        if span:
+                            span.add_event("first_token")
+                    parts.append(part)
+                    yield part
+                LLM_SECONDS.labels(*labels).observe(time.monotonic() - started)
+            if span:
+                span.set_attribute("output_chars", sum(map(len, parts)))
+        await response_cache.put(cache_key(prompt_key, answered_by, text, PROMPTS[prompt_key]), "".join(parts))
+
+    async for part in llm_single_flight.stream(key, upstream):
+        yield part
+
+async def complete_llm(text, prompt_key, model):
+    """Whole LLM answer, from the response cache when possible"""
+    key = cache_key(prompt_key, model, text, PROMPTS[prompt_key])
+    answer = await response_cache.get(key)
+    if answer is not None:
+        return answer
+
+    async def upstream():
+        answered_by = model
+
+        def record_model(used):
+            nonlocal answered_by
+            answered_by = used
+
+        labels = (PROMPT_ENDPOINTS.get(prompt_key, prompt_key), model)
+        with tracing.span(f"llm.{labels[0]}", kind=SPAN_KIND_CLIENT, model=model, prompt=prompt_key,
+                          input_chars=len(text)) as span:
+            async with llm_limiter.limit(model):
+                if span:
+                    span.add_event("admitted")
+                started = time.monotonic()
+                answer = await llm_processor.process_text_async(text, PROMPTS[prompt_key], model=model,
+                                                                answered_by=record_model)
+                # Not streamed: the first output is the whole answer
+                elapsed = time.monotonic() - started
+                LLM_FIRST_TOKEN_SECONDS.labels(*labels).observe(elapsed)
+                LLM_SECONDS.labels(*labels).observe(elapsed)
+            if span:
+                span.set_attribute("output_chars", len(answer))
+        await response_cache.put(cache_key(prompt_key, answered_by, text, PROMPTS[prompt_key]), answer)
+        yield answer
+
+    # Joins a streaming request for the same answer if one is already running
+    return "".join([part async for part in llm_single_flight.stream(key, upstream)])
+
+def stream_readability_chunked(text, model):
+    """Long-text readability: bounded chunks enhanced concurrently, streamed back in order"""
+    chunks = split_text(text, READABILITY_CHUNK_CHARS)
+    inputs = []
+    for index, (_, chunk) in enumerate(chunks):
+        context = overlap_context(chunks[index - 1][1], READABILITY_CHUNK_OVERLAP) if index else ""
+        if context:
+            inputs.append(f"PRECEDING CONTEXT:\n{context}\n\nTEXT TO PROCESS:\n{chunk}")
+        else:
+            inputs.append(f"TEXT TO PROCESS:\n{chunk}")
+    logger.info(f"Enhancing readability of {len(text)} characters in {len(chunks)} chunks")
+    return stream_in_order(
+        inputs,
+        lambda chunk_input: stream_llm(chunk_input, 'readability-enhance-chunk', model),
+        concurrency=READABILITY_CHUNK_CONCURRENCY,
+        separators=[separator for separator, _ in chunks],
+    )
+
+def stream_readability(text, model):
+    """Readability for text: chunked past READABILITY_CHUNK_THRESHOLD, one call below it"""
+    if len(text) > READABILITY_CHUNK_THRESHOLD:
+        return stream_readability_chunked(text, model)
+    return stream_llm(text, 'readability-enhance', model)
 
 # Use an absolute path for the static directory
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
 
-def log_content(content_type, content):
+def log_content(content_type, content, session_id=None, model=None, latency_ms=None):
     """
     记录内容到日志文件
     
     Args:
         content_type: 内容类型 ("Transcript", "Readability", "Correctness", "AskAI")
         content: 要记录的内容
+        session_id: WebSocket 连接或 HTTP 请求的 ID
+        model: 生成内容的模型
+        latency_ms: 生成内容所用的时间
     """
-    # 获取当前日期作为文件名
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # 使用绝对路径，确保日志文件被创建在正确的位置
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    log_dir = os.path.join(base_dir, "logs")
-    log_file = os.path.join(log_dir, f"{today}.log")
-    
-    # 确保日志目录存在
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # 格式化当前时间和内容
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    formatted_content = f"""
-=== {content_type} - {timestamp} ===
-{content}
-==============================================
-"""
-    
-    # 写入日志文件
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(formatted_content)
-    
-    logger.info(f"Logged {content_type} content to {log_file}")
+    # Queued for the journal writer; never blocks on disk
+    journal.record(content_type, content, session_id=session_id, model=model, latency_ms=latency_ms)
+    logger.info(f"Logged {content_type} content")
 
 @app.get("/", response_class=HTMLResponse)
 async def get_realtime_page(request: Request):
     return FileResponse(os.path.join(os.path.dirname(__file__), "static/realtime.html"))
 
+# Sample formats a client may declare in its audio_format handshake.
+# "opus" is compressed: one raw Opus packet per websocket frame.
+SAMPLE_FORMATS = {
+    "pcm16": np.int16,
+    "float32": np.float32,
+    "opus": None,
+}
+
+# Capture rates a client may declare, including the high rates some interfaces run at.
+# The resampling filter grows with the rate ratio, so arbitrary rates (e.g. 191999)
+# would let any browser make the server build huge filters
+SAMPLE_RATES = (8000, 11025, 16000, 22050, 24000, 32000, 44100, 48000, 88200, 96000, 176400, 192000)
+
 class AudioProcessor:
-    def __init__(self, target_sample_rate=24000):
+    def __init__(self, target_sample_rate=24000, source_sample_rate=48000, channels=1, sample_format="pcm16"):
         self.target_sample_rate = target_sample_rate
-        self.source_sample_rate = 48000  # Most common sample rate for microphones
+        # 48kHz is assumed until the client declares its format
+        self.configure(source_sample_rate, channels, sample_format)
+
+    def configure(self, source_sample_rate, channels=1, sample_format="pcm16"):
+        """
+        Pick the cheapest conversion path for the client's declared input format:
+        passthrough when it already matches the target rate, an integer-ratio
+        decimator (e.g. 48kHz) or a rational polyphase resampler (e.g. 44.1kHz).
+        Opus is decoded at 48kHz and then decimated.
+        """
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+        if not isinstance(source_sample_rate, int) or source_sample_rate not in SAMPLE_RATES:
+            raise ValueError(f"Unsupported sample rate: {source_sample_rate}")
+        if not isinstance(channels, int) or not 1 <= channels <= 8:
+            raise ValueError(f"Unsupported channel count: {channels}")
+
+        self.source_sample_rate = source_sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self._dtype = SAMPLE_FORMATS[sample_format]
+        self.decoder = None
+
+        if sample_format == "opus":
+            if not opus_available():
+                raise ValueError("Opus transport is not available on this server")
+            self.mode = "opus"
+            self.decoder = OpusDecoder(channels)
+            self.resampler = StreamingResampler(OPUS_SAMPLE_RATE, self.target_sample_rate)
+        elif source_sample_rate == self.target_sample_rate:
+            self.mode = "passthrough"
+            self.resampler = None
+        else:
+            # Built once per connection; keeps filter state across websocket chunks.
+            # For integer ratios it runs as a strided decimator with no gather.
+            self.mode = "decimate" if source_sample_rate % self.target_sample_rate == 0 else "resample"
+            self.resampler = StreamingResampler(source_sample_rate, self.target_sample_rate)
+        logger.info(f"Audio input {source_sample_rate}Hz/{channels}ch/{sample_format}, using {self.mode} path")
+
+    def reset(self):
+        """Drop resampler and decoder history, e.g. when a new recording starts"""
+        if self.resampler:
+            self.resampler.reset()
+        if self.decoder:
+            self.decoder.reset()
         
     def process_audio_chunk(self, audio_data):
-        # Convert binary audio data to Int16 array
-        pcm_data = np.frombuffer(audio_data, dtype=np.int16)
-        
-        # Convert to float32 for better precision during resampling
-        float_data = pcm_data.astype(np.float32) / 32768.0
-        
-        # Resample from 48kHz to 24kHz
-        resampled_data = scipy.signal.resample_poly(
-            float_data, 
-            self.target_sample_rate, 
-            self.source_sample_rate
-        )
-        
-        # Convert back to int16 while preserving amplitude
-        resampled_int16 = (resampled_data * 32768.0).clip(-32768, 32767).astype(np.int16)
-        return resampled_int16.tobytes()
+        # Mono PCM16 already at the target rate needs no work at all
+        if self.mode == "passthrough" and self.channels == 1 and self.sample_format == "pcm16":
+            return bytes(audio_data)
+
+        if self.decoder:
+            return self.resampler.process_int16(self.decoder.decode(audio_data))
+
+        samples = np.frombuffer(audio_data, dtype=self._dtype)
+        if self.channels > 1:
+            # Downmix interleaved frames, dropping any incomplete trailing frame
+            frames = len(samples) // self.channels
+            samples = samples[:frames * self.channels].reshape(frames, self.channels).mean(axis=1, dtype=np.float32)
+        if self.sample_format == "float32":
+            samples = samples * np.float32(32768.0)
+
+        if self.resampler is None:
+            return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+        # Resample to 24kHz in float32, carrying filter state between chunks
+        return self.resampler.process_int16(samples)
 
     def save_audio_buffer(self, audio_buffer, filename):
         with wave.open(filename, 'wb') as wf:
@@ -140,39 +612,164 @@ class AudioProcessor:
             wf.writeframes(b''.join(audio_buffer))
         logger.info(f"Saved audio buffer to {filename}")
 
+class ConnectionState:
+    """States of a /api/v1/ws connection"""
+    IDLE = "idle"               # No recording, no response pending
+    CONNECTING = "connecting"   # start_recording received, realtime session being set up
+    RECORDING = "recording"     # Streaming audio to the realtime session
+    FINALIZING = "finalizing"   # Stopped, waiting for the response
+
+# Status shown by the browser's connection dot for each state
+BROWSER_STATUS = {
+    ConnectionState.IDLE: "idle",
+    ConnectionState.CONNECTING: "connecting",
+    ConnectionState.RECORDING: "connected",
+    ConnectionState.FINALIZING: "connected",
+}
+
+class Recording:
+    """One dictation on a connection: its realtime session, pre-roll audio and response"""
+    def __init__(self, live=False, span=None):
+        self.client = None
+        self.connect_task = None
+        self.ready = asyncio.Event()
+        # Audio that arrives before the realtime session is ready, flushed in order once it is
+        self.preroll = PreRollBuffer(PREROLL_MAX_BYTES)
+        # Serializes pre-roll flushes and live sends so audio always reaches OpenAI in order
+        self.send_lock = asyncio.Lock()
+        self.response_done = asyncio.Event()
+        self.stopped_at = None
+        self.first_delta_at = None
+        # 添加变量跟踪完整的听译内容
+        self.transcript = TranscriptBuffer(MAX_TRANSCRIPT_CHARS)
+
+        # Live transcription: segments are committed while recording continues
+        self.live = live
+        self.segmenter = LiveSegmenter(
+            min_segment=LIVE_SEGMENT_MIN_SECONDS,
+            max_segment=LIVE_SEGMENT_MAX_SECONDS,
+            silence=LIVE_SEGMENT_SILENCE_MS / 1000,
+            silence_rms=LIVE_SILENCE_RMS,
+        ) if live else None
+        self.uncommitted_bytes = 0
+        # A segment boundary reached while the audio before it is still in the pre-roll
+        self.segment_boundary = False
+        self.response_wanted = False
+        # One response at a time per realtime session
+        self.response_lock = asyncio.Lock()
+        self.segment_tasks = set()
+        self.previous = None        # Finalize task of the previous recording
+        # Audio received from the browser, before voice activity detection
+        self.received_bytes = 0
+        self.audio_cpu_seconds = 0.0
+
+        # Trace spans: the whole dictation, and the response being waited for
+        self.span = span or tracer.start_span("recording")
+        self.span.set_attribute("live", live)
+        self.response_span = None
+        self.awaiting_first_delta = False
+
+    async def _send(self, chunk):
+        await self.client.send_audio(chunk)
+        self.uncommitted_bytes += len(chunk)
+
+    async def send_audio(self, chunk):
+        async with self.send_lock:
+            # Anything still in the pre-roll goes first
+            if len(self.preroll):
+                await self.preroll.flush(self._send)
+            await self._send(chunk)
+
+    async def start_response(self, instructions):
+        self.response_span = self.span.child("realtime.response")
+        self.awaiting_first_delta = True
+        await self.client.start_response(instructions)
+
+    def end_response(self):
+        if self.response_span is not None:
+            self.response_span.end()
+            self.response_span = None
+
+    async def flush_preroll(self):
+        async with self.send_lock:
+            if self.client and len(self.preroll):
+                age = self.preroll.oldest_age()
+                count = await self.preroll.flush(self._send)
+                logger.info(f"Flushed {count} pre-roll audio chunks buffered over {age * 1000:.0f} ms")
+
+    async def commit_segment(self):
+        """Commit everything sent since the last commit; False if there was nothing to commit"""
+        async with self.send_lock:
+            if len(self.preroll):
+                await self.preroll.flush(self._send)
+            if not self.uncommitted_bytes:
+                return False
+            with self.span.child("realtime.commit", audio_bytes=self.uncommitted_bytes, segment=True):
+                await self.client.commit_audio()
+            self.uncommitted_bytes = 0
+        self.response_wanted = True
+        return True
+
+# Voice activity detection totals over all finished connections
+vad_totals = {"sessions": 0, "seconds_in": 0.0, "seconds_sent": 0.0, "seconds_suppressed": 0.0}
+
 @app.websocket("/api/v1/ws")
 async def websocket_endpoint(websocket: WebSocket):
     logger.info("New WebSocket connection attempt")
     await websocket.accept()
-    logger.info("WebSocket connection accepted")
+    session_id = uuid.uuid4().hex
+    logger.info(f"WebSocket connection accepted (session {session_id})")
+    # Root span of this session, started by TraceMiddleware
+    session_span = tracing.current_span() or tracer.start_span("WEBSOCKET /api/v1/ws", kind=SPAN_KIND_SERVER)
+    session_span.set_attribute("session.id", session_id)
     
-    # Add initial status update here
+    # Add initial status update here; the trace lets the browser join its own timings
     await websocket.send_text(json.dumps({
         "type": "status",
-        "status": "idle"  # Set initial status to idle (blue)
+        "status": "idle",  # Set initial status to idle (blue)
+        "trace_id": session_span.trace_id,
+        "traceparent": session_span.traceparent,
     }))
     
-    client = None
     audio_processor = AudioProcessor()
-    audio_buffer = []
-    recording_stopped = asyncio.Event()
-    openai_ready = asyncio.Event()
-    pending_audio_chunks = []
-    
-    # 添加变量跟踪完整的听译内容
-    full_transcript = ""
-    
-    async def initialize_openai():
-        nonlocal client
+    vad = VoiceActivityGate(
+        threshold_db=VAD_THRESHOLD_DB,
+        hangover_ms=VAD_HANGOVER_MS,
+        lookback_ms=VAD_LOOKBACK_MS,
+        max_pause_ms=VAD_MAX_PAUSE_MS,
+    ) if VAD_ENABLED else None
+
+    # Per-connection state machine. A new recording may start while earlier ones are
+    # still finalizing, so back-to-back dictations are pipelined.
+    state = ConnectionState.IDLE
+    recording = None            # The recording currently receiving audio
+    finalize_tasks = set()      # Recordings waiting for their response
+    last_finalize = None        # Responses are delivered to the browser in recording order
+    preroll_totals = {}
+
+    async def send_status(status):
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.send_text(json.dumps({
+                "type": "status",
+                "status": status
+            }))
+
+    async def set_state(new_state):
+        nonlocal state
+        if new_state != state:
+            logger.info(f"Connection state {state} -> {new_state}")
+            state = new_state
+            await send_status(BROWSER_STATUS[new_state])
+
+    async def initialize_openai(rec):
         try:
-            # Clear the ready flag while initializing
-            openai_ready.clear()
-            
-            client = OpenAIRealtimeAudioTextClient(os.getenv("OPENAI_API_KEY"))
-            await client.connect()
+            with rec.span.child("realtime.acquire"):
+                client = await session_pool.acquire()
+            active_realtime_clients.add(client)
+            trace_connect(rec, client)
             logger.info("Successfully connected to OpenAI client")
             
-            # Register handlers after client is initialized
+            # Register handlers after client is initialized; they are bound to this recording
             client.register_handler("session.updated", lambda data: handle_generic_event("session.updated", data))
             client.register_handler("input_audio_buffer.cleared", lambda data: handle_generic_event("input_audio_buffer.cleared", data))
             client.register_handler("input_audio_buffer.speech_started", lambda data: handle_generic_event("input_audio_buffer.speech_started", data))
@@ -183,45 +780,158 @@ async def websocket_endpoint(websocket: WebSocket):
             client.register_handler("response.text.done", lambda data: handle_generic_event("response.text.done", data))
             client.register_handler("response.content_part.done", lambda data: handle_generic_event("response.content_part.done", data))
             client.register_handler("response.output_item.done", lambda data: handle_generic_event("response.output_item.done", data))
-            client.register_handler("response.done", lambda data: handle_response_done(data))
+            client.register_handler("response.done", lambda data: handle_response_done(rec, data))
             client.register_handler("error", lambda data: handle_error(data))
-            client.register_handler("response.text.delta", lambda data: handle_text_delta(data))
-            client.register_handler("response.created", lambda data: handle_response_created(data))
+            client.register_handler("response.text.delta", lambda data: handle_text_delta(rec, data))
+            client.register_handler("response.created", lambda data: handle_response_created(rec, data))
             
-            openai_ready.set()  # Set ready flag after successful initialization
-            await websocket.send_text(json.dumps({
-                "type": "status",
-                "status": "connected"
-            }))
+            rec.client = client
+            client.trace_parent = rec.span
+            rec.ready.set()  # Set ready flag after successful initialization
+            await rec.flush_preroll()
+            if rec is recording:
+                await set_state(ConnectionState.RECORDING)
             return True
         except Exception as e:
             logger.error(f"Failed to connect to OpenAI: {e}")
-            openai_ready.clear()  # Ensure flag is cleared on failure
+            rec.preroll.clear()
             await websocket.send_text(json.dumps({
                 "type": "error",
                 "content": "Failed to initialize OpenAI connection"
             }))
             return False
 
+    def trace_connect(rec, client):
+        # Usually a pre-connected session: its handshake happened before this recording
+        times = client.connect_times
+        if "session_created" in times:
+            rec.span.record("realtime.connect", times["started"], times["session_created"],
+                            preconnected=times["started"] < rec.span.start_ns)
+        if "session_update_sent" in times:
+            rec.span.record("realtime.session.update", times["session_created"],
+                            times.get("session_updated", times["session_update_sent"]),
+                            acknowledged="session_updated" in times)
+
+    async def finalize(rec, previous):
+        """Commit a stopped recording and wait for its response, without blocking the receive loop"""
+        rec.stopped_at = time.monotonic()
+        try:
+            if not await rec.connect_task:
+                return
+            if rec.live:
+                # Only the audio since the last segment is left to transcribe
+                await rec.commit_segment()
+                await respond_live(rec)
+                transcript_complete(rec)
+                return
+            await rec.flush_preroll()
+            if rec.received_bytes and not rec.uncommitted_bytes:
+                # Voice activity detection found nothing to transcribe; say so, or the
+                # browser can't tell this apart from an empty transcript
+                logger.info("No speech in recording, skipping transcription")
+                await websocket.send_text(json.dumps({
+                    "type": "no_speech",
+                    "content": "No speech detected"
+                }))
+                return
+            if previous:
+                # Let the previous response reach the browser first
+                await asyncio.wait([previous])
+            with rec.span.child("realtime.commit", audio_bytes=rec.uncommitted_bytes):
+                await rec.client.commit_audio()
+            await rec.start_response(PROMPTS['paraphrase-gpt-realtime'])
+            try:
+                await asyncio.wait_for(rec.response_done.wait(), timeout=RESPONSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"No response.done after {RESPONSE_TIMEOUT} seconds")
+                await websocket.send_text(json.dumps({
+                    "type": "error",
+                    "content": "Timed out waiting for the transcription"
+                }))
+        except Exception as e:
+            logger.error(f"Error finalizing recording: {str(e)}", exc_info=True)
+        finally:
+            await release_recording(rec)
+            finalize_tasks.discard(asyncio.current_task())
+            if recording is None and not finalize_tasks:
+                await set_state(ConnectionState.IDLE)
+
+    async def release_recording(rec):
+        for key, value in rec.preroll.stats().items():
+            preroll_totals[key] = preroll_totals.get(key, 0) + value
+        rec.end_response()
+        rec.span.set_attribute("audio.received_bytes", rec.received_bytes)
+        rec.span.set_attribute("audio.cpu_ms", round(rec.audio_cpu_seconds * 1000, 3))
+        rec.span.end()
+        if rec.client:
+            used_client, rec.client = rec.client, None
+            used_client.trace_parent = None
+            active_realtime_clients.discard(used_client)
+            try:
+                logger.info(f"Realtime event dispatch stats: {used_client.dispatch_stats()}")
+                await session_pool.release(used_client)
+                logger.info("Connection closed after response completion")
+            except Exception as e:
+                logger.error(f"Error closing client after response done: {str(e)}")
+
     # Move the handler definitions here (before initialize_openai)
-    async def handle_text_delta(data):
-        nonlocal full_transcript
+    async def send_text_batch(text):
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.send_text(json.dumps({
+                "type": "text",
+                "content": text,
+                "isNewResponse": False
+            }))
+            logger.debug(f"Sent text batch of {len(text)} characters")
+
+    # Takes the same path as the HTTP endpoints, so they join or replay these results
+    name_for_prompt = {prompt_key: name for name, prompt_key in SPECULATIVE_PROMPTS.items()}
+
+    def run_speculative(prompt_key, text):
+        model = ENDPOINT_MODELS[name_for_prompt[prompt_key]]
+        if prompt_key == 'readability-enhance':
+            return stream_readability(text, model)
+        return stream_llm(text, prompt_key, model)
+
+    speculative = SpeculativeRunner(
+        run_speculative,
+        [SPECULATIVE_PROMPTS[name] for name in SPECULATIVE_POSTPROCESS],
+        max_runs=SPECULATIVE_MAX_RUNS,
+        max_chars=SPECULATIVE_MAX_CHARS,
+    )
+
+    # Coalesces text deltas into one websocket frame per window
+    text_batcher = DeltaBatcher(send_text_batch, window=TEXT_BATCH_WINDOW_MS / 1000, max_chars=TEXT_BATCH_MAX_CHARS)
+
+    async def handle_text_delta(rec, data):
         try:
             if websocket.client_state == WebSocketState.CONNECTED:
                 delta = data.get("delta", "")
-                full_transcript += delta  # 累积完整的听译内容
-                await websocket.send_text(json.dumps({
-                    "type": "text",
-                    "content": delta,
-                    "isNewResponse": False
-                }))
-                logger.info("Handled response.text.delta")
+                if rec.stopped_at and rec.first_delta_at is None:
+                    rec.first_delta_at = time.monotonic()
+                    STOP_TO_FIRST_DELTA_SECONDS.observe(rec.first_delta_at - rec.stopped_at)
+                if rec.awaiting_first_delta and rec.response_span is not None:
+                    rec.awaiting_first_delta = False
+                    rec.response_span.record("first_delta", rec.response_span.start_ns, time.time_ns())
+                rec.transcript.append(delta)  # 累积完整的听译内容
+                await text_batcher.add(delta)
         except Exception as e:
             logger.error(f"Error in handle_text_delta: {str(e)}", exc_info=True)
 
-    async def handle_response_created(data):
-        nonlocal full_transcript
-        full_transcript = ""  # 重置完整的听译内容
+    async def handle_response_created(rec, data):
+        if rec.response_span is not None:
+            rec.response_span.set_attribute("response.id", data.get("response", {}).get("id"))
+            rec.response_span.record("response.created", rec.response_span.start_ns, time.time_ns())
+        await text_batcher.flush()
+        if rec.live and rec.transcript:
+            # A later segment of a live transcription continues the text on screen
+            separator = segment_separator(rec.transcript.tail(1))
+            rec.transcript.append(separator)
+            if separator:
+                await text_batcher.add(separator)
+            logger.info("Handled response.created for the next live segment")
+            return
+        rec.transcript.clear()  # 重置完整的听译内容
         await websocket.send_text(json.dumps({
             "type": "text",
             "content": "",
@@ -238,96 +948,196 @@ async def websocket_endpoint(websocket: WebSocket):
         }))
         logger.info("Handled error message from OpenAI")
 
-    async def handle_response_done(data):
-        nonlocal client, full_transcript
+    async def handle_response_done(rec, data):
         logger.info("Handled response.done")
-        recording_stopped.set()
+        # Deliver the tail of the text before anything else
+        try:
+            await text_batcher.flush()
+        except Exception as e:
+            logger.error(f"Error flushing text batch: {str(e)}")
+        logger.info(f"Text batching stats: {text_batcher.stats()}")
         
+        # A live recording is complete only after its last segment; finalize handles that
+        if not rec.live:
+            transcript_complete(rec)
+        if rec.stopped_at:
+            STOP_TO_DONE_SECONDS.observe(time.monotonic() - rec.stopped_at)
+        rec.end_response()
+        # The finalize task releases the session
+        rec.response_done.set()
+
+    def transcript_complete(rec):
         # 记录完整的听译内容到日志
-        if full_transcript:
-            log_content("Transcript", full_transcript)
-        
-        if client:
+        if rec.transcript:
+            latency_ms = (time.monotonic() - rec.stopped_at) * 1000 if rec.stopped_at else None
+            log_content("Transcript", rec.transcript.text, session_id=session_id,
+                        model=rec.client.model if rec.client else None, latency_ms=latency_ms)
+            if speculative.enabled:
+                # Handlers run in the realtime session's task; the LLM spans belong to this recording
+                with tracing.use_span(rec.span):
+                    started = speculative.schedule(rec.transcript.text)
+                logger.info(f"Started speculative post-processing: {started}")
+
+    async def respond_live(rec):
+        """Ask for a transcription of every segment committed since the last response"""
+        async with rec.response_lock:
+            if not rec.response_wanted:
+                return
+            if rec.previous:
+                # The previous recording's text reaches the browser first
+                await asyncio.wait([rec.previous])
+            rec.response_wanted = False
+            rec.response_done.clear()
+            await rec.start_response(PROMPTS['paraphrase-gpt-realtime-live'])
             try:
-                await client.close()
-                client = None
-                openai_ready.clear()
-                await websocket.send_text(json.dumps({
-                    "type": "status",
-                    "status": "idle"
-                }))
-                logger.info("Connection closed after response completion")
-            except Exception as e:
-                logger.error(f"Error closing client after response done: {str(e)}")
+                await asyncio.wait_for(rec.response_done.wait(), timeout=RESPONSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"No response.done for a live segment after {RESPONSE_TIMEOUT} seconds")
+
+    async def commit_live_segment(rec):
+        if await rec.commit_segment():
+            task = asyncio.create_task(respond_live(rec))
+            rec.segment_tasks.add(task)
+            task.add_done_callback(rec.segment_tasks.discard)
 
     async def handle_generic_event(event_type, data):
-        logger.info(f"Handled {event_type} with data: {json.dumps(data, ensure_ascii=False)}")
+        logger.debug(f"Handled {event_type} with data: {json.dumps(data, ensure_ascii=False)}")
 
-    # Create a queue to handle incoming audio chunks
-    audio_queue = asyncio.Queue()
 
     async def receive_messages():
-        nonlocal client
+        nonlocal recording, last_finalize
+        streaming_confirmed = False
         
         try:
             while True:
                 if websocket.client_state == WebSocketState.DISCONNECTED:
                     logger.info("WebSocket client disconnected")
-                    openai_ready.clear()
                     break
                     
                 try:
                     # Add timeout to prevent infinite waiting
                     data = await asyncio.wait_for(websocket.receive(), timeout=30.0)
+                    if data["type"] == "websocket.disconnect":
+                        logger.info("WebSocket client disconnected")
+                        break
+                    if data.get("bytes") is not None:
+                        size = len(data["bytes"])
+                    else:
+                        # Measured as sent, UTF-8 encoded, like ws_max_size does
+                        size = len((data.get("text") or "").encode("utf-8"))
+                    if size > MAX_WS_MESSAGE_BYTES:
+                        logger.warning(f"Dropped a {size} byte message, over the {MAX_WS_MESSAGE_BYTES} byte limit")
+                        continue
                     
-                    if "bytes" in data:
+                    if data.get("bytes") is not None:
+                        cpu_started = time.thread_time()
                         processed_audio = audio_processor.process_audio_chunk(data["bytes"])
-                        if not openai_ready.is_set():
+                        cpu_seconds = time.thread_time() - cpu_started
+                        AUDIO_CHUNK_CPU_SECONDS.observe(cpu_seconds)
+                        rec = recording
+                        if rec is None:
+                            logger.warning("Received audio while not recording, dropping it")
+                            continue
+                        rec.audio_cpu_seconds += cpu_seconds
+                        rec.received_bytes += len(processed_audio)
+                        voiced = vad.process(processed_audio) if vad else processed_audio
+                        # Segment boundaries follow the pauses as spoken, not as uploaded; audio
+                        # held in the pre-roll counts toward the first segment like any other
+                        if rec.live and rec.segmenter.feed(processed_audio):
+                            rec.segment_boundary = True
+                        if not rec.ready.is_set():
                             logger.debug("OpenAI not ready, buffering audio chunk")
-                            pending_audio_chunks.append(processed_audio)
-                        elif client:
-                            await client.send_audio(processed_audio)
-                            await websocket.send_text(json.dumps({
-                                "type": "status",
-                                "status": "connected"
-                            }))
-                            logger.debug(f"Sent audio chunk, size: {len(processed_audio)} bytes")
+                            if voiced:
+                                rec.preroll.append(voiced)
                         else:
-                            logger.warning("Received audio but client is not initialized")
+                            if voiced:
+                                await rec.send_audio(voiced)
+                            if rec.segment_boundary:
+                                rec.segment_boundary = False
+                                await commit_live_segment(rec)
+                            # Frames can be as short as 20 ms, so only confirm streaming once per recording
+                            if not streaming_confirmed:
+                                streaming_confirmed = True
+                                await send_status("connected")
+                            logger.debug(f"Sent audio chunk, size: {len(voiced)} bytes")
                             
-                    elif "text" in data:
+                    elif data.get("text") is not None:
                         msg = json.loads(data["text"])
                         
                         if msg.get("type") == "start_recording":
-                            # Update status to connecting while initializing OpenAI
-                            await websocket.send_text(json.dumps({
-                                "type": "status",
-                                "status": "connecting"
-                            }))
-                            if not await initialize_openai():
+                            if recording is not None:
+                                logger.warning(f"start_recording while {state}, ignoring")
                                 continue
-                            recording_stopped.clear()
-                            pending_audio_chunks.clear()
-                            
-                            # Send any buffered chunks
-                            if pending_audio_chunks and client:
-                                logger.info(f"Sending {len(pending_audio_chunks)} buffered chunks")
-                                for chunk in pending_audio_chunks:
-                                    await client.send_audio(chunk)
-                                pending_audio_chunks.clear()
+                            if len(finalize_tasks) >= MAX_PENDING_RECORDINGS:
+                                logger.warning(f"{len(finalize_tasks)} recordings still finalizing, refusing another")
+                                await websocket.send_text(json.dumps({
+                                    "type": "error",
+                                    "content": "Still transcribing earlier recordings, try again in a moment"
+                                }))
+                                continue
+                            audio_processor.reset()
+                            if vad:
+                                vad.reset()
+                            streaming_confirmed = False
+                            # Update status to connecting while initializing OpenAI
+                            live = LIVE_TRANSCRIPTION or bool(msg.get("live"))
+                            recording = Recording(live=live, span=session_span.child("recording"))
+                            recording.previous = last_finalize
+                            await set_state(ConnectionState.CONNECTING)
+                            # Connect in the background; audio that arrives meanwhile goes to the pre-roll
+                            recording.connect_task = asyncio.create_task(initialize_openai(recording))
                             
-                        elif msg.get("type") == "stop_recording":
-                            if client:
-                                await client.commit_audio()
-                                await client.start_response(PROMPTS['paraphrase-gpt-realtime'])
-                                await recording_stopped.wait()
-                                # Don't close the client here, let the disconnect timer handle it
-                                # Update client status to connected (waiting for response)
+                        elif msg.get("type") == "audio_format":
+                            # Handshake declaring the client's capture format
+                            if msg.get("sample_format") == "opus" and not opus_available():
+                                # Not an error: the client falls back to PCM
+                                await websocket.send_text(json.dumps({
+                                    "type": "audio_format",
+                                    "status": "rejected",
+                                    "reason": "Opus transport is not available on this server"
+                                }))
+                                continue
+                            try:
+                                audio_processor.configure(
+                                    msg.get("sample_rate", 48000),
+                                    msg.get("channels", 1),
+                                    msg.get("sample_format", "pcm16"),
+                                )
+                                await websocket.send_text(json.dumps({
+                                    "type": "audio_format",
+                                    "status": "accepted",
+                                    "mode": audio_processor.mode,
+                                }))
+                            except ValueError as e:
+                                logger.warning(f"Rejected audio format {msg}: {e}")
                                 await websocket.send_text(json.dumps({
-                                    "type": "status",
-                                    "status": "connected"
+                                    "type": "error",
+                                    "content": str(e)
                                 }))
 
+                        elif msg.get("type") == "stop_recording":
+                            if recording is None:
+                                logger.warning(f"stop_recording while {state}, ignoring")
+                                continue
+                            # Hand the recording to a finalize task and keep serving the socket
+                            rec, recording = recording, None
+                            # Trailing silence is dropped; a last partial frame of speech is not
+                            tail = vad.flush() if vad else b""
+                            if tail:
+                                if rec.ready.is_set():
+                                    await rec.send_audio(tail)
+                                else:
+                                    rec.preroll.append(tail)
+                            await set_state(ConnectionState.FINALIZING)
+                            last_finalize = asyncio.create_task(finalize(rec, last_finalize))
+                            finalize_tasks.add(last_finalize)
+
+                        elif msg.get("type") == "transcript_edited":
+                            # Speculative results for the old text would never be asked for
+                            if speculative.enabled:
+                                speculative.cancel()
+                                logger.info("Transcript edited, cancelled speculative post-processing")
+
                 except asyncio.TimeoutError:
                     logger.debug("No message received for 30 seconds")
                     continue
@@ -337,49 +1147,87 @@ async def websocket_endpoint(websocket: WebSocket):
                 
         finally:
             # Cleanup when the loop exits
-            if client:
+            tasks = list(finalize_tasks)
+            abandoned, recording = recording, None
+            if abandoned and abandoned.connect_task:
+                tasks.append(abandoned.connect_task)
+            if abandoned:
+                tasks.extend(abandoned.segment_tasks)
+            for task in tasks:
+                task.cancel()
+            for task in tasks:
                 try:
-                    await client.close()
-                except Exception as e:
-                    logger.error(f"Error closing client in receive_messages: {str(e)}")
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            if abandoned:
+                await release_recording(abandoned)
+            logger.info(f"Pre-roll stats: {preroll_totals}")
+            if vad:
+                session_vad = vad.stats()
+                logger.info(f"Voice activity stats: {session_vad}")
+                vad_totals["sessions"] += 1
+                for key, value in session_vad.items():
+                    vad_totals[key] = round(vad_totals[key] + value, 2)
+            if speculative.enabled:
+                speculative.cancel()
+                logger.info(f"Speculative post-processing stats: {speculative.stats()}")
+            await text_batcher.close()
             logger.info("Receive messages loop ended")
 
-    async def send_audio_messages():
-        while True:
-            try:
-                processed_audio = await audio_queue.get()
-                if processed_audio is None:
-                    break
-                
-                # Add validation
-                if len(processed_audio) == 0:
-                    logger.warning("Empty audio chunk received, skipping")
-                    continue
-                
-                # Append the processed audio to the buffer
-                audio_buffer.append(processed_audio)
-
-                await client.send_audio(processed_audio)
-                logger.info(f"Audio chunk sent to OpenAI client, size: {len(processed_audio)} bytes")
-                
-            except Exception as e:
-                logger.error(f"Error in send_audio_messages: {str(e)}", exc_info=True)
-                break
+    ACTIVE_SESSIONS.inc()
+    try:
+        await receive_messages()
+    finally:
+        ACTIVE_SESSIONS.dec()
+        # TraceMiddleware would end it too, but only once the websocket is closed
+        session_span.end()
+        logger.info(f"WebSocket session {session_id} closed")
 
-        # After processing all audio, set the event
-        recording_stopped.set()
+def local_stats():
+    return {
+        "realtime_pool": session_pool.metrics(),
+        "llm_concurrency": llm_limiter.stats(),
+        "response_cache": response_cache.stats(),
+        "llm_single_flight": llm_single_flight.stats(),
+        "llm_routing": llm_processor.stats(),
+        "voice_activity": vad_totals,
+        "tracing": tracer.stats(),
+    }
 
-    # Start concurrent tasks for receiving and sending
-    receive_task = asyncio.create_task(receive_messages())
-    send_task = asyncio.create_task(send_audio_messages())
+@app.get("/metrics", summary="Prometheus metrics")
+async def get_metrics():
+    families = REGISTRY.collect()
+    if shared_state.shared:
+        # Any worker answers for all of them, each sample labelled with its worker
+        by_worker = {WORKER_ID: families}
+        try:
+            published = await shared_state.hgetall(METRICS_KEY)
+        except Exception as e:
+            logger.warning(f"Could not read worker metrics: {e}")
+            published = {}
+        cutoff = time.time() - 3 * STATS_PUBLISH_INTERVAL
+        for worker, snapshot in published.items():
+            snapshot = json.loads(snapshot)
+            if worker != WORKER_ID and snapshot["updated"] >= cutoff:
+                by_worker[worker] = snapshot["families"]
+        families = merge_families(by_worker)
+    return PlainTextResponse(render(families), media_type="text/plain; version=0.0.4")
 
-    try:
-        # Wait for both tasks to complete
-        await asyncio.gather(receive_task, send_task)
-    finally:
-        if client:
-            await client.close()
-            logger.info("OpenAI client connection closed")
+@app.get("/api/v1/stats", summary="Runtime statistics")
+async def get_stats():
+    stats = {"worker": WORKER_ID, **local_stats()}
+    if shared_state.shared:
+        # Every live worker's last published stats; a worker that stopped publishing drops out
+        try:
+            published = await shared_state.hgetall(WORKERS_KEY)
+        except Exception as e:
+            logger.warning(f"Could not read worker stats: {e}")
+            published = {}
+        cutoff = time.time() - 3 * STATS_PUBLISH_INTERVAL
+        workers = {worker: json.loads(snapshot) for worker, snapshot in published.items()}
+        stats["workers"] = {worker: snapshot for worker, snapshot in workers.items() if snapshot["updated"] >= cutoff}
+    return stats
 
 @app.post(
     "/api/v1/readability",
@@ -395,16 +1243,18 @@ async def enhance_readability(request: ReadabilityRequest):
     try:
         # 用于收集完整的增强文本
         full_enhanced_text = ""
+        model = ENDPOINT_MODELS["readability"]
+        started = time.monotonic()
         
         async def text_generator():
             nonlocal full_enhanced_text
-            # Use gpt-4o specifically for readability
-            async for part in llm_processor.process_text(request.text, prompt, model="gpt-4o"):
+            async for part in stream_readability(request.text, model):
                 full_enhanced_text += part
                 yield part
             
             # 在生成完整内容后记录到日志
-            log_content("Readability", full_enhanced_text)
+            log_content("Readability", full_enhanced_text, session_id=uuid.uuid4().hex,
+                        model=model, latency_ms=(time.monotonic() - started) * 1000)
 
         return StreamingResponse(text_generator(), media_type="text/plain")
 
@@ -416,19 +1266,34 @@ async def enhance_readability(request: ReadabilityRequest):
     "/api/v1/ask_ai",
     response_model=AskAIResponse,
     summary="Ask AI a Question",
-    description="Ask AI to provide insights using O1-mini model."
+    description="Ask AI to provide insights using O1-mini model. Pass stream=true to receive the answer as streamed plain text."
 )
-def ask_ai(request: AskAIRequest):
+async def ask_ai(request: AskAIRequest, stream: bool = False):
     prompt = PROMPTS.get('ask-ai')
     if not prompt:
         raise HTTPException(status_code=500, detail="Ask AI prompt not found.")
 
+    model = ENDPOINT_MODELS["ask_ai"]
+    started = time.monotonic()
+
+    if stream:
+        # ?stream=true returns plain text chunks like readability and correctness
+        async def text_generator():
+            answer = ""
+            async for part in stream_llm(request.text, 'ask-ai', model):
+                answer += part
+                yield part
+            log_content("AskAI", answer, session_id=uuid.uuid4().hex,
+                        model=model, latency_ms=(time.monotonic() - started) * 1000)
+
+        return StreamingResponse(text_generator(), media_type="text/plain")
+
     try:
-        # Use o1-mini specifically for ask_ai
-        answer = llm_processor.process_text_sync(request.text, prompt, model="o1-mini")
+        answer = await complete_llm(request.text, 'ask-ai', model)
         
         # 记录AI回答到日志
-        log_content("AskAI", answer)
+        log_content("AskAI", answer, session_id=uuid.uuid4().hex,
+                    model=model, latency_ms=(time.monotonic() - started) * 1000)
         
         return AskAIResponse(answer=answer)
     except Exception as e:
@@ -449,16 +1314,18 @@ async def check_correctness(request: CorrectnessRequest):
     try:
         # 用于收集完整的正确性检查结果
         full_correctness_result = ""
+        model = ENDPOINT_MODELS["correctness"]
+        started = time.monotonic()
         
         async def text_generator():
             nonlocal full_correctness_result
-            # Specifically use gpt-4o for correctness checking
-            async for part in llm_processor.process_text(request.text, prompt, model="gpt-4o"):
+            async for part in stream_llm(request.text, 'correctness-check', model):
                 full_correctness_result += part
                 yield part
             
             # 在生成完整内容后记录到日志
-            log_content("Correctness", full_correctness_result)
+            log_content("Correctness", full_correctness_result, session_id=uuid.uuid4().hex,
+                        model=model, latency_ms=(time.monotonic() - started) * 1000)
 
         return StreamingResponse(text_generator(), media_type="text/plain")
 
@@ -512,6 +1379,8 @@ if __name__ == '__main__':
     parser.add_argument('--ssl-certfile', help='Path to SSL certificate file for HTTPS')
     parser.add_argument('--port', type=int, default=3005, help='Port to run the server on')
     parser.add_argument('--host', default="0.0.0.0", help='Host to run the server on')
+    parser.add_argument('--workers', type=int, default=int(os.getenv("WORKERS", "1")),
+                        help='Number of worker processes')
     
     args = parser.parse_args()
     
@@ -521,10 +1390,23 @@ if __name__ == '__main__':
     os.makedirs(log_dir, exist_ok=True)
     logger.info(f"Ensured logs directory exists at {log_dir}")
     
+    # Several workers need the app as an import string so each process can load it
+    target = app
+    options = {"ws_max_size": MAX_WS_MESSAGE_BYTES}
+    if args.workers > 1:
+        if not SHARED_STATE_URL:
+            # Workers are separate processes: give them a stand-in to share state through
+            from state_server import start_in_thread
+            state_port = start_in_thread()
+            os.environ["SHARED_STATE_URL"] = f"redis://127.0.0.1:{state_port}"
+            logger.info(f"Started shared state stand-in on port {state_port} for {args.workers} workers")
+        target = "realtime_server:app"
+        options.update(workers=args.workers, app_dir=base_dir)
+
     if args.ssl_certfile:
         print(f"Running with HTTPS on {args.host}:{args.port}")
-        uvicorn.run(app, host=args.host, port=args.port, ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_certfile)
+        uvicorn.run(target, host=args.host, port=args.port, ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_certfile, **options)
     else:
         print(f"Running with HTTP on {args.host}:{args.port}")
         print("Note: Microphone access on mobile devices typically requires HTTPS.")
-        uvicorn.run(app, host=args.host, port=args.port)
+        uvicorn.run(target, host=args.host, port=args.port, **options)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set
+
+from openai_realtime_client import OpenAIRealtimeAudioTextClient
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class RealtimeSessionPool:
+    """
+    Keeps a few configured OpenAI realtime sessions connected ahead of time, so that
+    start_recording does not pay the websocket handshake and session.update round trip.
+
+    A session carries the conversation of the response it served, so released sessions
+    are closed and replaced by fresh ones in the background rather than handed out again.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], OpenAIRealtimeAudioTextClient],
+        size: int = 2,
+        max_age: float = 600.0,
+        health_check_interval: float = 15.0,
+    ):
+        self.client_factory = client_factory
+        self.size = max(0, size)
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+
+        self._idle: Deque[OpenAIRealtimeAudioTextClient] = deque()
+        self._connecting = 0
+        self._running = False
+        self._refill_task: Optional[asyncio.Task] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connect_failures = 0
+        self._acquire_count = 0
+        self._acquire_latency_total = 0.0
+        self._acquire_latency_max = 0.0
+
+    async def start(self):
+        """Start filling the pool and the periodic health check"""
+        if self._running or self.size == 0:
+            return
+        self._running = True
+        self._schedule_refill()
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+        logger.info(f"Realtime session pool started with size {self.size}")
+
+    async def stop(self):
+        """Stop background work and close every idle session"""
+        self._running = False
+        for task in (self._maintenance_task, self._refill_task, *self._background):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._maintenance_task = None
+        self._refill_task = None
+        self._background.clear()
+        while self._idle:
+            await self._close_quietly(self._idle.popleft())
+        logger.info("Realtime session pool stopped")
+
+    async def acquire(self) -> OpenAIRealtimeAudioTextClient:
+        """Return a connected session, from the pool when possible"""
+        start = time.perf_counter()
+        client = None
+        while self._idle:
+            candidate = self._idle.popleft()
+            if candidate.is_healthy(self.max_age):
+                client = candidate
+                break
+            self.evictions += 1
+            self._close_in_background(candidate)
+
+        hit = client is not None
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            client = self.client_factory()
+            try:
+                await client.connect()
+            except BaseException:
+                # Failed or cancelled mid-handshake: don't leave the socket open
+                await asyncio.shield(self._close_quietly(client))
+                raise
+
+        elapsed = time.perf_counter() - start
+        self._acquire_count += 1
+        self._acquire_latency_total += elapsed
+        self._acquire_latency_max = max(self._acquire_latency_max, elapsed)
+        logger.info(f"Acquired realtime session ({'hit' if hit else 'miss'}) in {elapsed * 1000:.1f} ms")
+
+        self._schedule_refill()
+        return client
+
+    async def release(self, client: Optional[OpenAIRealtimeAudioTextClient]):
+        """Give back a session after its response is done; it is closed and replaced"""
+        if client is not None:
+            await self._close_quietly(client)
+        self._schedule_refill()
+
+    def metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "connect_failures": self.connect_failures,
+            "acquire_latency_avg_ms": (self._acquire_latency_total / self._acquire_count * 1000) if self._acquire_count else 0.0,
+            "acquire_latency_max_ms": self._acquire_latency_max * 1000,
+        }
+
+    def _schedule_refill(self):
+        if not self._running:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        while self._running and len(self._idle) + self._connecting < self.size:
+            client = self.client_factory()
+            self._connecting += 1
+            try:
+                await client.connect()
+            except Exception as e:
+                self.connect_failures += 1
+                logger.error(f"Failed to pre-warm realtime session: {e}")
+                await self._close_quietly(client)
+                # Back off until the next health check instead of hammering the API
+                return
+            except asyncio.CancelledError:
+                await asyncio.shield(self._close_quietly(client))
+                raise
+            finally:
+                self._connecting -= 1
+            if self._running:
+                self._idle.append(client)
+            else:
+                await self._close_quietly(client)
+
+    async def _maintenance_loop(self):
+        while self._running:
+            await asyncio.sleep(self.health_check_interval)
+            healthy = deque()
+            while self._idle:
+                client = self._idle.popleft()
+                if client.is_healthy(self.max_age):
+                    healthy.append(client)
+                else:
+                    self.evictions += 1
+                    self._close_in_background(client)
+            self._idle.extend(healthy)
+            self._schedule_refill()
+
+    def _close_in_background(self, client: OpenAIRealtimeAudioTextClient):
+        task = asyncio.create_task(self._close_quietly(client))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _close_quietly(self, client: OpenAIRealtimeAudioTextClient):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Error closing realtime session: {e}")
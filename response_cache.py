@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncGenerator, Dict, Optional, Tuple
+
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Shared entries are {"expires_at", "value"} JSON; the version keeps older bare values out
+_SHARED_PREFIX = "brainwave:response:v2:"
+
+
+def normalize_text(text: str) -> str:
+    """
+    Spacing and Unicode form differences shouldn't defeat the cache. Line and paragraph
+    breaks are kept: Readability and Correctness answer differently for a different layout.
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r" ?\n ?", "\n", text).strip()
+
+
+def cache_key(prompt_key: str, model: str, text: str, prompt: str = "") -> str:
+    """The prompt text itself is hashed too, so editing a prompt invalidates its old answers"""
+    digest = hashlib.sha256()
+    for part in (prompt_key, prompt, model.lower(), normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of complete LLM responses.
+
+    The memory tier is an LRU bounded by entry count and total bytes. If db_path is
+    given, entries are also written to SQLite so they survive restarts; disk hits are
+    promoted back into memory. With shared state, entries are also published there so
+    every worker can answer from them; shared hits are promoted into memory as well.
+    Every entry expires ttl seconds after it was put, in whichever tier it is found.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 8 * 1024 * 1024,
+        ttl: float = 3600.0,
+        db_path: Optional[str] = None,
+        shared: Optional[SharedState] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path = db_path
+        self.shared = shared
+        # key -> (expires_at, value, size)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._remove(key)
+            self.expirations += 1
+
+        if self.shared is not None:
+            try:
+                entry = await self.shared.get(_SHARED_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"Shared response cache unavailable: {e}")
+                entry = None
+            if entry is not None:
+                entry = json.loads(entry)
+                # Keeps the expiry it was published with, so promoting it doesn't extend its life
+                if entry["expires_at"] > now:
+                    self._store(key, entry["value"], entry["expires_at"])
+                    self.hits += 1
+                    self.shared_hits += 1
+                    return entry["value"]
+                self.expirations += 1
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._db_get, key, now)
+            if row is not None:
+                expires_at, value = row
+                self._store(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        self._store(key, value, expires_at)
+        if self.shared is not None:
+            try:
+                entry = json.dumps({"expires_at": expires_at, "value": value}, ensure_ascii=False)
+                await self.shared.set(_SHARED_PREFIX + key, entry, ttl=self.ttl)
+            except Exception as e:
+                logger.warning(f"Could not publish response to the shared cache: {e}")
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, key, value, expires_at)
+
+    async def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        if self._db is not None:
+            await asyncio.to_thread(self._db_execute, "DELETE FROM responses")
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _store(self, key: str, value: str, expires_at: float):
+        size = len(value.encode("utf-8"))
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            # Too big for the memory tier; the disk tier may still keep it
+            return
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _db_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT expires_at, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self.expirations += 1
+                return None
+            return row
+
+    def _db_put(self, key: str, value: str, expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+
+    def _db_execute(self, sql: str):
+        with self._db_lock:
+            self._db.execute(sql)
+            self._db.commit()
+
+
+async def replay(value: str, chunk_chars: int = 64) -> AsyncGenerator[str, None]:
+    """Stream a cached response in small pieces, the way the model would have"""
+    for start in range(0, len(value), chunk_chars):
+        yield value[start:start + chunk_chars]
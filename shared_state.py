@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class SharedStateError(Exception):
+    """Error reply from the backend"""
+
+
+class SharedState(ABC):
+    """
+    Small key-value store for state that every worker must see: the shared response cache
+    tier, global LLM concurrency counters and published worker stats. Values are strings;
+    ttl is in seconds.
+    """
+
+    # Whether other processes see the same state
+    shared = False
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to a counter and return the new value; ttl is renewed on every call"""
+        pass
+
+    @abstractmethod
+    async def hset(self, key: str, field: str, value: str):
+        pass
+
+    @abstractmethod
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    async def hdel(self, key: str, field: str) -> bool:
+        """Remove a field; True if this call removed it"""
+        pass
+
+    async def close(self):
+        pass
+
+
+class InProcessState(SharedState):
+    """Plain dictionaries: enough for a single worker, and the store behind state_server.py"""
+
+    def __init__(self):
+        # key -> (expires_at or None, str or dict)
+        self._values: Dict[str, Tuple[Optional[float], Any]] = {}
+
+    def _live(self, key: str) -> Any:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._values[key]
+            return None
+        return entry[1]
+
+    def _expires(self, ttl: Optional[float]) -> Optional[float]:
+        return time.monotonic() + ttl if ttl is not None else None
+
+    def _hash(self, key: str, create: bool = False) -> Optional[Dict[str, str]]:
+        value = self._live(key)
+        if value is None and create:
+            value = {}
+            self._values[key] = (None, value)
+        if value is not None and not isinstance(value, dict):
+            raise SharedStateError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._live(key)
+        if isinstance(value, dict):
+            raise SharedStateError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._values[key] = (self._expires(ttl), str(value))
+
+    async def delete(self, key: str) -> bool:
+        existed = self._live(key) is not None
+        self._values.pop(key, None)
+        return existed
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        current = await self.get(key)
+        try:
+            value = int(current or 0) + amount
+        except ValueError:
+            raise SharedStateError("ERR value is not an integer or out of range")
+        expires_at = self._expires(ttl) if ttl is not None else self._values.get(key, (None,))[0]
+        self._values[key] = (expires_at, str(value))
+        return value
+
+    async def expire(self, key: str, ttl: float) -> bool:
+        value = self._live(key)
+        if value is None:
+            return False
+        self._values[key] = (self._expires(ttl), value)
+        return True
+
+    async def hset(self, key: str, field: str, value: str):
+        self._hash(key, create=True)[field] = str(value)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self._hash(key) or {})
+
+    async def hdel(self, key: str, field: str) -> bool:
+        values = self._hash(key)
+        if values is None or field not in values:
+            return False
+        del values[field]
+        if not values:
+            del self._values[key]
+        return True
+
+    async def flush(self):
+        self._values.clear()
+
+
+# RESP, the Redis wire protocol: commands are arrays of bulk strings
+
+def encode_command(*args: Union[str, int, float]) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def encode_reply(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, SharedStateError):
+        return b"-%s\r\n" % str(reply).encode("utf-8")
+    if isinstance(reply, bool):
+        return b":%d\r\n" % int(reply)
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode_reply(item) for item in reply)
+    if reply == "OK" or reply == "PONG":
+        return b"+%s\r\n" % reply.encode("utf-8")
+    data = str(reply).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode("utf-8")
+    if kind == b"-":
+        raise SharedStateError(body.decode("utf-8"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2].decode("utf-8")
+    if kind == b"*":
+        size = int(body)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise SharedStateError(f"Protocol error: unexpected reply {line!r}")
+
+
+class RedisState(SharedState):
+    """
+    Talks to Redis, or to the stand-in in state_server.py, over one connection per worker.
+    A broken connection is re-opened on the next command.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = 2.0,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", self.db)
+        logger.info(f"Connected to shared state at {self.host}:{self.port}/{self.db}")
+
+    async def _roundtrip(self, *args) -> Any:
+        self._writer.write(encode_command(*args))
+        await self._writer.drain()
+        return await asyncio.wait_for(read_reply(self._reader), self.timeout)
+
+    async def command(self, *args) -> Any:
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._roundtrip(*args)
+            except SharedStateError:
+                raise
+            except BaseException:
+                # Includes cancellation: a reply left unread would be taken for the next one's
+                self._disconnect()
+                raise
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if ttl is None:
+            await self.command("SET", key, value)
+        else:
+            await self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self.command("DEL", key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = await self.command("INCRBY", key, amount)
+        if ttl is not None:
+            await self.command("PEXPIRE", key, max(1, int(ttl * 1000)))
+        return value
+
+    async def hset(self, key: str, field: str, value: str):
+        await self.command("HSET", key, field, value)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        flat: List[str] = await self.command("HGETALL", key) or []
+        return dict(zip(flat[::2], flat[1::2]))
+
+    async def hdel(self, key: str, field: str) -> bool:
+        return bool(await self.command("HDEL", key, field))
+
+    async def close(self):
+        async with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                try:
+                    await self._writer.wait_closed()
+                except OSError:
+                    pass
+            self._reader = self._writer = None
+
+
+def shared_state_from_url(url: Optional[str]) -> SharedState:
+    """"" or memory:// for in-process state, redis://[:password@]host[:port][/db] for shared"""
+    if not url or url == "memory://":
+        return InProcessState()
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Unsupported shared state URL: {url}")
+    db = parsed.path.lstrip("/")
+    return RedisState(
+        host=parsed.hostname or "127.0.0.1",
+        port=parsed.port or 6379,
+        db=int(db) if db else 0,
+        password=parsed.password,
+    )
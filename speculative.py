@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class SpeculativeRunner:
+    """
+    Starts LLM post-processing (readability, correctness) of a finished transcript
+    before the user asks for it.
+
+    Results are not kept here: run(prompt_key, text) must go through the same
+    content-addressed path as the HTTP endpoints, so a request for the same text joins
+    the in-flight stream or gets the cached answer. A new transcript or an edit cancels whatever is still running.
+    Each session may spend at most max_runs calls and max_chars input characters.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[str, str], AsyncIterator[str]],
+        prompt_keys: Iterable[str],
+        max_runs: int = 20,
+        max_chars: int = 50000,
+    ):
+        self.run = run
+        self.prompt_keys = list(prompt_keys)
+        self.max_runs = max_runs
+        self.max_chars = max_chars
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.text: Optional[str] = None
+
+        self.runs_started = 0
+        self.runs_completed = 0
+        self.runs_cancelled = 0
+        self.runs_failed = 0
+        self.runs_over_cap = 0
+        self.chars_spent = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.prompt_keys)
+
+    def schedule(self, text: str) -> List[str]:
+        """Start every configured prompt on the new transcript; returns the prompt keys started"""
+        self.cancel()
+        if not self.enabled or not text.strip():
+            return []
+        self.text = text
+        started = []
+        for prompt_key in self.prompt_keys:
+            if self.runs_started >= self.max_runs or self.chars_spent + len(text) > self.max_chars:
+                self.runs_over_cap += 1
+                logger.info(f"Speculative {prompt_key} skipped: session cost cap reached")
+                continue
+            self.runs_started += 1
+            self.chars_spent += len(text)
+            self._tasks[prompt_key] = asyncio.create_task(self._consume(prompt_key, text))
+            started.append(prompt_key)
+        return started
+
+    def cancel(self):
+        """Stop running work, e.g. because the transcript was edited"""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        self._tasks.clear()
+        self.text = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "runs_started": self.runs_started,
+            "runs_completed": self.runs_completed,
+            "runs_cancelled": self.runs_cancelled,
+            "runs_failed": self.runs_failed,
+            "runs_over_cap": self.runs_over_cap,
+            "chars_spent": self.chars_spent,
+        }
+
+    async def _consume(self, prompt_key: str, text: str):
+        chars = 0
+        try:
+            async for part in self.run(prompt_key, text):
+                chars += len(part)
+        except asyncio.CancelledError:
+            self.runs_cancelled += 1
+            raise
+        except Exception as e:
+            self.runs_failed += 1
+            logger.error(f"Speculative {prompt_key} failed: {e}")
+            return
+        self.runs_completed += 1
+        logger.info(f"Speculative {prompt_key} ready ({chars} characters)")
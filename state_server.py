@@ -0,0 +1,134 @@
+"""
+Redis-compatible stand-in for the shared state of a multi-worker deployment.
+
+Speaks enough of the Redis protocol for shared_state.RedisState (GET, SET, DEL, INCRBY,
+PEXPIRE, HSET, HGETALL, HDEL and a few more), keeping everything in memory. Point
+SHARED_STATE_URL at a real Redis instead for multi-host deployments that need persistence.
+    python state_server.py --port 6390
+"""
+import argparse
+import asyncio
+import logging
+import threading
+from typing import Any, List, Optional
+
+from shared_state import InProcessState, SharedStateError, encode_reply, read_reply
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _ttl_from_options(options: List[str]) -> Optional[float]:
+    options = [option.upper() for option in options]
+    if "PX" in options:
+        return int(options[options.index("PX") + 1]) / 1000
+    if "EX" in options:
+        return float(options[options.index("EX") + 1])
+    return None
+
+
+class StateServer:
+    def __init__(self, state: Optional[InProcessState] = None):
+        self.state = state or InProcessState()
+        self.connections = 0
+
+    async def execute(self, request: List[str]) -> Any:
+        name, args = request[0].upper(), request[1:]
+        state = self.state
+        try:
+            if name == "PING":
+                return args[0] if args else "PONG"
+            if name in ("SELECT", "AUTH"):
+                return "OK"
+            if name == "GET":
+                return await state.get(args[0])
+            if name == "SET":
+                await state.set(args[0], args[1], _ttl_from_options(args[2:]))
+                return "OK"
+            if name == "DEL":
+                return sum([await state.delete(key) for key in args])
+            if name in ("INCR", "DECR", "INCRBY", "DECRBY"):
+                amount = int(args[1]) if name.endswith("BY") else 1
+                return await state.incr(args[0], -amount if name.startswith("DECR") else amount)
+            if name in ("EXPIRE", "PEXPIRE"):
+                ttl = int(args[1]) / (1000 if name == "PEXPIRE" else 1)
+                return await state.expire(args[0], ttl)
+            if name == "HSET":
+                pairs = list(zip(args[1::2], args[2::2]))
+                existing = await state.hgetall(args[0])
+                for field, value in pairs:
+                    await state.hset(args[0], field, value)
+                return sum(field not in existing for field, _ in pairs)
+            if name == "HGETALL":
+                return [item for pair in (await state.hgetall(args[0])).items() for item in pair]
+            if name == "HDEL":
+                existing = await state.hgetall(args[0])
+                for field in args[1:]:
+                    await state.hdel(args[0], field)
+                return sum(field in existing for field in args[1:])
+            if name in ("FLUSHDB", "FLUSHALL"):
+                await state.flush()
+                return "OK"
+        except SharedStateError as e:
+            return e
+        except (IndexError, ValueError):
+            return SharedStateError(f"ERR wrong arguments for '{name.lower()}' command")
+        return SharedStateError(f"ERR unknown command '{name.lower()}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request = await read_reply(reader)
+                if not isinstance(request, list) or not request:
+                    writer.write(encode_reply(SharedStateError("ERR Protocol error: expected a command array")))
+                    break
+                if request[0].upper() == "QUIT":
+                    writer.write(encode_reply("OK"))
+                    break
+                writer.write(encode_reply(await self.execute(request)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, SharedStateError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 6390) -> asyncio.AbstractServer:
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Shared state stand-in listening on {host}:{server.sockets[0].getsockname()[1]}")
+        return server
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0) -> int:
+    """Run a stand-in in a daemon thread of this process and return its port"""
+    started = threading.Event()
+    bound = {}
+
+    def run():
+        async def main():
+            server = await StateServer().serve(host, port)
+            bound["port"] = server.sockets[0].getsockname()[1]
+            started.set()
+            await server.serve_forever()
+
+        asyncio.run(main())
+
+    threading.Thread(target=run, name="state-server", daemon=True).start()
+    if not started.wait(timeout=10):
+        raise RuntimeError("Shared state stand-in did not start")
+    return bound["port"]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Run the Redis-compatible shared state stand-in')
+    parser.add_argument('--host', default="127.0.0.1", help='Host to listen on')
+    parser.add_argument('--port', type=int, default=6390, help='Port to listen on')
+    args = parser.parse_args()
+
+    async def main():
+        server = await StateServer().serve(args.host, args.port)
+        await server.serve_forever()
+
+    asyncio.run(main())
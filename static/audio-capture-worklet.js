@@ -0,0 +1,70 @@
+// Audio capture worklet: converts microphone samples to PCM16 off the main thread
+// and posts fixed-size frames to the main thread as transferable ArrayBuffers.
+class PCM16CaptureProcessor extends AudioWorkletProcessor {
+    constructor(options) {
+        super();
+        this.frameSamples = options.processorOptions.frameSamples;
+        // Room for a few frames in case the main thread falls behind
+        this.ring = new Int16Array(this.frameSamples * 8);
+        this.readIndex = 0;
+        this.writeIndex = 0;
+        this.available = 0;
+        this.recording = false;
+
+        this.port.onmessage = (event) => {
+            switch (event.data.type) {
+                case 'start':
+                    this.readIndex = 0;
+                    this.writeIndex = 0;
+                    this.available = 0;
+                    this.recording = true;
+                    break;
+                case 'stop':
+                    this.recording = false;
+                    // Send whatever is left as a final short frame
+                    this.postFrames(true);
+                    this.port.postMessage({ type: 'flushed' });
+                    break;
+            }
+        };
+    }
+
+    postFrames(flush) {
+        while (this.available >= this.frameSamples || (flush && this.available > 0)) {
+            const length = Math.min(this.frameSamples, this.available);
+            const frame = new Int16Array(length);
+            const firstPart = Math.min(length, this.ring.length - this.readIndex);
+            frame.set(this.ring.subarray(this.readIndex, this.readIndex + firstPart));
+            if (firstPart < length) {
+                frame.set(this.ring.subarray(0, length - firstPart), firstPart);
+            }
+            this.readIndex = (this.readIndex + length) % this.ring.length;
+            this.available -= length;
+            this.port.postMessage(frame.buffer, [frame.buffer]);
+        }
+    }
+
+    process(inputs) {
+        const input = inputs[0];
+        if (!this.recording || input.length === 0) return true;
+
+        const channel = input[0];
+        const ring = this.ring;
+        for (let i = 0; i < channel.length; i++) {
+            const sample = Math.max(-1, Math.min(1, channel[i]));
+            ring[this.writeIndex] = sample * 32767;
+            this.writeIndex = (this.writeIndex + 1) % ring.length;
+        }
+        this.available += channel.length;
+        if (this.available > ring.length) {
+            // Overflow: drop the oldest samples
+            this.readIndex = this.writeIndex;
+            this.available = ring.length;
+        }
+
+        this.postFrames(false);
+        return true;
+    }
+}
+
+registerProcessor('pcm16-capture', PCM16CaptureProcessor);
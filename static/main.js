@@ -3,10 +3,19 @@ let ws, audioContext, processor, source, stream;
 let isRecording = false;
 let timerInterval;
 let startTime;
-let audioBuffer = new Int16Array(0);
+let flushResolver = null;
+let audioCodec = 'pcm16';  // Transport the server accepted for this connection
+let audioEncoder = null;
+let audioFormatSettled = Promise.resolve();  // Resolves once the server has answered our audio_format
+let settleAudioFormat = null;
+let heldFrames = [];  // Captured while a format change is unanswered, sent once it is
+let encoderTimestamp = 0;
 let wsConnected = false;
 let streamInitialized = false;
 let isAutoStarted = false;
+let noSpeechDetected = false;  // The last recording had nothing to transcribe, so there's nothing to copy
+let transcriptEdited = false;  // Reported once per transcript so the server drops speculative work
+let sessionTraceparent = null;  // Server trace of this websocket session; LLM calls join it
 
 // DOM elements
 const recordButton = document.getElementById('recordButton');
@@ -22,10 +31,24 @@ const toComputerEnhancedButton = document.getElementById('toComputerEnhancedButt
 
 // Configuration
 const targetSeconds = 5;
+const targetSampleRate = 24000;  // What the OpenAI realtime API expects
 const urlParams = new URLSearchParams(window.location.search);
 const autoStart = urlParams.get('start') === '1';
+// Audio frame length sent over the websocket, 20-100 ms (e.g. ?frameMs=20)
+const frameMs = Math.min(100, Math.max(20, parseInt(urlParams.get('frameMs'), 10) || 40));
+// Upstream transport: Opus via WebCodecs when supported, ?codec=pcm forces raw PCM16
+const preferredCodec = urlParams.get('codec') === 'pcm' ? 'pcm16' : 'opus';
+const opusBitrate = 24000;
+// Show the transcription segment by segment while still recording (?live=1)
+const liveTranscription = urlParams.get('live') === '1';
 
 // Utility functions
+function jsonHeaders() {
+    const headers = { 'Content-Type': 'application/json' };
+    if (sessionTraceparent) headers.traceparent = sessionTraceparent;
+    return headers;
+}
+
 const isMobileDevice = () => /Android|webOS|iPhone|iPad|iPod|BlackBerry|IEMobile|Opera Mini/i.test(navigator.userAgent);
 
 async function copyToClipboard(text, button) {
@@ -68,43 +91,141 @@ function stopTimer() {
 }
 
 // Audio processing
-function createAudioProcessor() {
-    processor = audioContext.createScriptProcessor(4096, 1, 1);
-    processor.onaudioprocess = (e) => {
-        if (!isRecording) return;
-        
-        const inputData = e.inputBuffer.getChannelData(0);
-        const pcmData = new Int16Array(inputData.length);
-        
-        for (let i = 0; i < inputData.length; i++) {
-            pcmData[i] = Math.max(-32768, Math.min(32767, Math.floor(inputData[i] * 32767)));
+// Capture runs in an AudioWorklet that posts fixed frames of PCM16 as transferable buffers
+async function createAudioProcessor() {
+    await audioContext.audioWorklet.addModule('/static/audio-capture-worklet.js');
+    const node = new AudioWorkletNode(audioContext, 'pcm16-capture', {
+        numberOfInputs: 1,
+        numberOfOutputs: 1,
+        channelCount: 1,
+        processorOptions: {
+            frameSamples: Math.round(audioContext.sampleRate * frameMs / 1000)
         }
-        
-        const combinedBuffer = new Int16Array(audioBuffer.length + pcmData.length);
-        combinedBuffer.set(audioBuffer);
-        combinedBuffer.set(pcmData, audioBuffer.length);
-        audioBuffer = combinedBuffer;
-        
-        if (audioBuffer.length >= 24000) {
-            const sendBuffer = audioBuffer.slice(0, 24000);
-            audioBuffer = audioBuffer.slice(24000);
-            
-            if (ws.readyState === WebSocket.OPEN) {
-                ws.send(sendBuffer.buffer);
+    });
+    node.port.onmessage = (event) => {
+        if (event.data instanceof ArrayBuffer) {
+            if (settleAudioFormat) {
+                heldFrames.push(event.data);
+            } else {
+                sendFrame(event.data);
             }
+        } else if (event.data.type === 'flushed' && flushResolver) {
+            flushResolver();
+            flushResolver = null;
         }
     };
-    return processor;
+    return node;
+}
+
+function sendFrame(buffer) {
+    if (audioCodec === 'opus' && audioEncoder) {
+        encodeFrame(buffer);
+    } else if (ws.readyState === WebSocket.OPEN) {
+        ws.send(buffer);
+    }
 }
 
 async function initAudio(stream) {
-    audioContext = new AudioContext();
-    source = audioContext.createMediaStreamSource(stream);
-    processor = createAudioProcessor();
+    // Capture at the server's target rate when the browser can, so no resampling is needed
+    try {
+        audioContext = new AudioContext({ sampleRate: targetSampleRate });
+        source = audioContext.createMediaStreamSource(stream);
+    } catch (error) {
+        // Some browsers can't connect a microphone to a context at a different rate
+        console.warn('Falling back to the default AudioContext sample rate:', error);
+        if (audioContext) audioContext.close();
+        audioContext = new AudioContext();
+        source = audioContext.createMediaStreamSource(stream);
+    }
+    await sendAudioFormat();
+    processor = await createAudioProcessor();
     source.connect(processor);
     processor.connect(audioContext.destination);
 }
 
+// Opus encoding via WebCodecs, one packet per websocket frame
+function opusConfig() {
+    return {
+        codec: 'opus',
+        sampleRate: audioContext.sampleRate,
+        numberOfChannels: 1,
+        bitrate: opusBitrate
+    };
+}
+
+async function opusSupported() {
+    if (typeof AudioEncoder === 'undefined') return false;
+    try {
+        const { supported } = await AudioEncoder.isConfigSupported(opusConfig());
+        return supported;
+    } catch (error) {
+        return false;
+    }
+}
+
+function createOpusEncoder() {
+    if (audioEncoder && audioEncoder.state !== 'closed') audioEncoder.close();
+    encoderTimestamp = 0;
+    audioEncoder = new AudioEncoder({
+        output: (chunk) => {
+            const packet = new ArrayBuffer(chunk.byteLength);
+            chunk.copyTo(packet);
+            if (ws.readyState === WebSocket.OPEN) ws.send(packet);
+        },
+        error: (error) => {
+            console.error('Opus encoder failed, falling back to PCM:', error);
+            audioEncoder = null;
+            sendAudioFormat('pcm16');
+        }
+    });
+    audioEncoder.configure(opusConfig());
+}
+
+function encodeFrame(buffer) {
+    const samples = new Int16Array(buffer);
+    const data = new AudioData({
+        format: 's16',
+        sampleRate: audioContext.sampleRate,
+        numberOfFrames: samples.length,
+        numberOfChannels: 1,
+        timestamp: encoderTimestamp,
+        data: samples
+    });
+    encoderTimestamp += samples.length * 1e6 / audioContext.sampleRate;
+    audioEncoder.encode(data);
+    data.close();
+}
+
+// Tell the server what we capture so it can pick the cheapest conversion path.
+// The codec only changes once the server accepts: until then captured frames are held,
+// since frames sent before the reply would be read in the old format.
+async function sendAudioFormat(sampleFormat) {
+    if (!audioContext || !ws || ws.readyState !== WebSocket.OPEN) return;
+    if (!settleAudioFormat) {
+        // A rejected Opus offer is retried as PCM under the same promise
+        audioFormatSettled = new Promise(resolve => { settleAudioFormat = resolve; });
+    }
+    if (!sampleFormat) {
+        sampleFormat = preferredCodec === 'opus' && await opusSupported() ? 'opus' : 'pcm16';
+    }
+    ws.send(JSON.stringify({
+        type: 'audio_format',
+        sample_rate: audioContext.sampleRate,
+        channels: 1,
+        sample_format: sampleFormat
+    }));
+}
+
+function audioFormatAnswered() {
+    if (settleAudioFormat) {
+        settleAudioFormat();
+        settleAudioFormat = null;
+    }
+    const frames = heldFrames;
+    heldFrames = [];
+    frames.forEach(sendFrame);
+}
+
 // WebSocket handling
 function updateConnectionStatus(status) {
     const statusDot = document.getElementById('connectionStatus');
@@ -135,6 +256,7 @@ function initializeWebSocket() {
     ws.onopen = () => {
         wsConnected = true;
         updateConnectionStatus(true);
+        sendAudioFormat();
         if (autoStart && !isRecording && !isAutoStarted) startRecording();
     };
     
@@ -142,21 +264,44 @@ function initializeWebSocket() {
         const data = JSON.parse(event.data);
         switch (data.type) {
             case 'status':
+                if (data.traceparent) {
+                    sessionTraceparent = data.traceparent;
+                    console.debug(`Session trace ${data.trace_id}`);
+                }
                 updateConnectionStatus(data.status);
                 if (data.status === 'idle') {
-                    copyToClipboard(transcript.value, copyButton);
+                    if (!noSpeechDetected) copyToClipboard(transcript.value, copyButton);
+                    noSpeechDetected = false;
                 }
                 break;
             case 'text':
                 if (data.isNewResponse) {
                     transcript.value = data.content;
+                    transcriptEdited = false;
                     stopTimer();
                 } else {
                     transcript.value += data.content;
                 }
                 transcript.scrollTop = transcript.scrollHeight;
                 break;
+            case 'no_speech':
+                noSpeechDetected = true;
+                stopTimer();
+                transcript.placeholder = data.content;
+                break;
+            case 'audio_format':
+                if (data.status === 'accepted') {
+                    audioCodec = data.mode === 'opus' ? 'opus' : 'pcm16';
+                    if (audioCodec === 'opus') createOpusEncoder();
+                    audioFormatAnswered();
+                } else if (data.status === 'rejected') {
+                    // Server can't decode Opus, stream raw PCM instead
+                    sendAudioFormat('pcm16');
+                }
+                break;
             case 'error':
+                // Also the answer to a format the server refused; it keeps the previous one
+                audioFormatAnswered();
                 alert(data.content);
                 updateConnectionStatus('idle');
                 break;
@@ -165,6 +310,9 @@ function initializeWebSocket() {
     
     ws.onclose = () => {
         wsConnected = false;
+        heldFrames = [];
+        audioCodec = 'pcm16';
+        audioFormatAnswered();
         updateConnectionStatus(false);
         setTimeout(initializeWebSocket, 1000);
     };
@@ -176,6 +324,8 @@ async function startRecording() {
     
     try {
         transcript.value = '';
+        transcript.placeholder = '';
+        noSpeechDetected = false;
         enhancedTranscript.value = '';
 
         // Check if mediaDevices is available
@@ -198,8 +348,15 @@ async function startRecording() {
         if (!stream) throw new Error('Failed to initialize audio stream');
         if (!audioContext) await initAudio(stream);
 
+        if (audioContext.state === 'suspended') await audioContext.resume();
+
+        // The server must know the capture format before the first frame arrives
+        await audioFormatSettled;
+
         isRecording = true;
-        await ws.send(JSON.stringify({ type: 'start_recording' }));
+        await ws.send(JSON.stringify({ type: 'start_recording', live: liveTranscription }));
+        if (audioCodec === 'opus') createOpusEncoder();
+        processor.port.postMessage({ type: 'start' });
         
         startTimer();
         recordButton.textContent = 'Stop';
@@ -217,12 +374,21 @@ async function stopRecording() {
     isRecording = false;
     startTimer();
     
-    if (audioBuffer.length > 0 && ws.readyState === WebSocket.OPEN) {
-        ws.send(audioBuffer.buffer);
-        audioBuffer = new Int16Array(0);
+    // Wait for the worklet to send its last partial frame before stopping
+    await new Promise(resolve => {
+        flushResolver = resolve;
+        processor.port.postMessage({ type: 'stop' });
+        setTimeout(resolve, 200);
+    });
+    // Frames held for a format change go out before the stop
+    await audioFormatSettled;
+    if (audioCodec === 'opus' && audioEncoder) {
+        try {
+            await audioEncoder.flush();
+        } catch (error) {
+            console.error('Error flushing Opus encoder:', error);
+        }
     }
-    
-    await new Promise(resolve => setTimeout(resolve, 500));
     await ws.send(JSON.stringify({ type: 'stop_recording' }));
     
     recordButton.textContent = 'Start';
@@ -234,6 +400,13 @@ recordButton.onclick = () => isRecording ? stopRecording() : startRecording();
 copyButton.onclick = () => copyToClipboard(transcript.value, copyButton);
 copyEnhancedButton.onclick = () => copyToClipboard(enhancedTranscript.value, copyEnhancedButton);
 
+// User edits (not streamed text, which doesn't fire input events) invalidate speculative results
+transcript.addEventListener('input', () => {
+    if (transcriptEdited || !ws || ws.readyState !== WebSocket.OPEN) return;
+    transcriptEdited = true;
+    ws.send(JSON.stringify({ type: 'transcript_edited' }));
+});
+
 // Handle spacebar toggle
 document.addEventListener('keydown', (event) => {
     if (event.code === 'Space') {
@@ -258,7 +431,7 @@ readabilityButton.onclick = async () => {
     try {
         const response = await fetch('/api/v1/readability', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: jsonHeaders(),
             body: JSON.stringify({ text: inputText })
         });
 
@@ -298,7 +471,7 @@ askAIButton.onclick = async () => {
     try {
         const response = await fetch('/api/v1/ask_ai', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: jsonHeaders(),
             body: JSON.stringify({ text: inputText })
         });
 
@@ -328,7 +501,7 @@ correctnessButton.onclick = async () => {
     try {
         const response = await fetch('/api/v1/correctness', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: jsonHeaders(),
             body: JSON.stringify({ text: inputText })
         });
 
@@ -0,0 +1,55 @@
+import pytest
+import fractions
+import numpy as np
+from unittest.mock import patch
+
+av = pytest.importorskip("av")
+
+from audio_codecs import OpusDecoder, opus_available
+from realtime_server import AudioProcessor
+
+def encode_opus(samples, sample_rate=48000, frame_samples=960):
+    encoder = av.CodecContext.create('libopus', 'w')
+    encoder.sample_rate = sample_rate
+    encoder.layout = 'mono'
+    encoder.format = 's16'
+    encoder.bit_rate = 24000
+    encoder.open()
+    packets = []
+    for start in range(0, len(samples), frame_samples):
+        frame = av.AudioFrame.from_ndarray(samples[start:start + frame_samples].reshape(1, -1), format='s16', layout='mono')
+        frame.sample_rate = sample_rate
+        frame.pts = start
+        frame.time_base = fractions.Fraction(1, sample_rate)
+        packets.extend(bytes(packet) for packet in encoder.encode(frame))
+    return packets
+
+@pytest.fixture
+def sine_packets():
+    t = np.arange(48000) / 48000
+    return encode_opus((np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16))
+
+def test_opus_available():
+    assert opus_available()
+
+def test_decoder_produces_48khz_samples(sine_packets):
+    decoder = OpusDecoder()
+    decoded = np.concatenate([decoder.decode(packet) for packet in sine_packets])
+    assert decoded.dtype == np.float32
+    assert len(decoded) == 48000
+    # Roughly the amplitude that went in
+    assert 5000 < np.abs(decoded[4800:]).max() < 10000
+
+def test_decoder_drops_garbage_packets():
+    assert len(OpusDecoder().decode(b"\xff\x00garbage")) == 0
+
+def test_audio_processor_opus_mode(sine_packets):
+    processor = AudioProcessor(source_sample_rate=48000, sample_format="opus")
+    assert processor.mode == "opus"
+    output = b''.join(processor.process_audio_chunk(packet) for packet in sine_packets)
+    assert len(output) == 24000 * 2
+
+def test_audio_processor_rejects_opus_without_decoder():
+    with patch('realtime_server.opus_available', return_value=False):
+        with pytest.raises(ValueError, match="Opus"):
+            AudioProcessor(source_sample_rate=48000, sample_format="opus")
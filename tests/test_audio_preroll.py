@@ -0,0 +1,58 @@
+import pytest
+from unittest.mock import AsyncMock
+from audio_preroll import PreRollBuffer
+
+@pytest.mark.asyncio
+async def test_flush_sends_in_arrival_order():
+    preroll = PreRollBuffer(max_bytes=1000)
+    for chunk in (b"one", b"two", b"three"):
+        preroll.append(chunk)
+    send = AsyncMock()
+
+    assert await preroll.flush(send) == 3
+    assert [call.args[0] for call in send.await_args_list] == [b"one", b"two", b"three"]
+    assert len(preroll) == 0
+    assert preroll.buffered_bytes == 0
+    assert preroll.stats() == {
+        "chunks_buffered": 3,
+        "chunks_flushed": 3,
+        "chunks_dropped": 0,
+        "bytes_dropped": 0,
+    }
+
+def test_byte_cap_drops_oldest():
+    preroll = PreRollBuffer(max_bytes=10)
+    preroll.append(b"aaaa")
+    preroll.append(b"bbbb")
+    preroll.append(b"cccc")
+
+    assert len(preroll) == 2
+    assert preroll.buffered_bytes == 8
+    assert preroll.stats()["chunks_dropped"] == 1
+    assert preroll.stats()["bytes_dropped"] == 4
+
+def test_max_age_drops_stale_audio():
+    preroll = PreRollBuffer(max_bytes=1000, max_age=1.0)
+    preroll.append(b"old", now=0.0)
+    preroll.append(b"new", now=5.0)
+
+    assert len(preroll) == 1
+    assert preroll.oldest_age(now=5.5) == 0.5
+
+@pytest.mark.asyncio
+async def test_failed_send_keeps_chunk():
+    preroll = PreRollBuffer(max_bytes=1000)
+    preroll.append(b"one")
+    preroll.append(b"two")
+    send = AsyncMock(side_effect=[None, ConnectionError()])
+
+    with pytest.raises(ConnectionError):
+        await preroll.flush(send)
+    assert len(preroll) == 1
+
+def test_clear_counts_dropped():
+    preroll = PreRollBuffer(max_bytes=1000)
+    preroll.append(b"one")
+    preroll.clear()
+    assert len(preroll) == 0
+    assert preroll.stats()["chunks_dropped"] == 1
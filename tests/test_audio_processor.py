@@ -62,3 +62,53 @@ def test_save_audio_buffer(audio_processor, tmp_path):
             np.frombuffer(audio_data, dtype=np.int16),
             np.frombuffer(test_audio, dtype=np.int16)
         )
+
+def test_process_audio_chunk_is_continuous_across_chunks(audio_processor):
+    t = np.arange(9600) / 48000
+    test_audio = (np.sin(2 * np.pi * 440 * t) * 16000).astype(np.int16)
+
+    whole = AudioProcessor().process_audio_chunk(test_audio.tobytes())
+    chunked = b''.join(
+        audio_processor.process_audio_chunk(test_audio[i:i + 4096].tobytes())
+        for i in range(0, len(test_audio), 4096)
+    )
+    assert whole == chunked
+
+def test_passthrough_at_target_rate():
+    processor = AudioProcessor(source_sample_rate=24000)
+    assert processor.mode == "passthrough"
+    test_audio = (np.arange(480, dtype=np.int16) * 10).tobytes()
+    assert processor.process_audio_chunk(test_audio) == test_audio
+
+@pytest.mark.parametrize("source_rate,mode", [
+    (48000, "decimate"), (96000, "decimate"), (192000, "decimate"),
+    (44100, "resample"), (88200, "resample"), (176400, "resample"),
+])
+def test_configure_picks_path(audio_processor, source_rate, mode):
+    audio_processor.configure(source_rate)
+    assert audio_processor.mode == mode
+    test_audio = np.zeros(source_rate, dtype=np.int16).tobytes()
+    assert len(audio_processor.process_audio_chunk(test_audio)) == 24000 * 2
+
+def test_float32_stereo_input_is_downmixed():
+    processor = AudioProcessor(source_sample_rate=24000, channels=2, sample_format="float32")
+    frames = np.array([[0.5, 0.5], [-0.25, -0.25], [1.0, 0.0]], dtype=np.float32)
+    processed = np.frombuffer(processor.process_audio_chunk(frames.tobytes()), dtype=np.int16)
+    np.testing.assert_array_equal(processed, [16384, -8192, 16384])
+
+@pytest.mark.parametrize("kwargs", [
+    {"source_sample_rate": 24000, "sample_format": "mp3"},
+    {"source_sample_rate": 1000},
+    {"source_sample_rate": 191999},
+    {"source_sample_rate": 384000},
+    {"source_sample_rate": 48000, "channels": 0},
+])
+def test_configure_rejects_unsupported_formats(audio_processor, kwargs):
+    with pytest.raises(ValueError):
+        audio_processor.configure(kwargs.pop("source_sample_rate"), **kwargs)
+
+def test_small_fixed_frames_keep_exact_length(audio_processor):
+    # 20 ms frames from the AudioWorklet at 48kHz
+    frame = np.zeros(960, dtype=np.int16).tobytes()
+    for _ in range(5):
+        assert len(audio_processor.process_audio_chunk(frame)) == 480 * 2
@@ -0,0 +1,48 @@
+import pytest
+import numpy as np
+import scipy.signal
+from audio_resampler import StreamingResampler
+
+@pytest.fixture
+def noise():
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(48000) * 3000).astype(np.int16)
+
+def resample_in_chunks(resampler, samples, chunk_sizes):
+    out = []
+    pos = 0
+    for size in chunk_sizes:
+        out.append(resampler.process(samples[pos:pos + size]).copy())
+        pos += size
+    out.append(resampler.process(samples[pos:]).copy())
+    return np.concatenate(out)
+
+@pytest.mark.parametrize("source_rate", [48000, 44100, 16000])
+def test_output_independent_of_chunking(noise, source_rate):
+    samples = noise[:source_rate]
+    whole = StreamingResampler(source_rate, 24000).process(samples).copy()
+
+    rng = np.random.default_rng(1)
+    chunked = resample_in_chunks(
+        StreamingResampler(source_rate, 24000), samples, rng.integers(1, 3000, size=20)
+    )
+    np.testing.assert_array_equal(whole, chunked)
+
+@pytest.mark.parametrize("source_rate", [48000, 44100])
+def test_matches_resample_poly_up_to_filter_delay(noise, source_rate):
+    samples = noise[:source_rate]
+    resampler = StreamingResampler(source_rate, 24000)
+    out = resampler.process(samples)
+    reference = scipy.signal.resample_poly(samples.astype(np.float64), 24000, source_rate)
+
+    assert len(out) == len(reference)
+    # The streaming filter is causal, so it lags the zero-phase reference by half its length
+    delay = 10
+    np.testing.assert_allclose(out[delay:], reference[:-delay], atol=0.05)
+
+def test_reset_clears_history(noise):
+    resampler = StreamingResampler(48000, 24000)
+    first = resampler.process(noise[:4800]).copy()
+    resampler.process(noise[4800:9600])
+    resampler.reset()
+    np.testing.assert_array_equal(resampler.process(noise[:4800]), first)
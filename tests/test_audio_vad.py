@@ -0,0 +1,60 @@
+import numpy as np
+from audio_vad import VoiceActivityGate
+
+RATE = 24000
+
+def tone(seconds, amplitude=5000):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (np.sin(2 * np.pi * 220 * t) * amplitude).astype(np.int16)
+
+def silence(seconds):
+    return np.zeros(int(RATE * seconds), dtype=np.int16)
+
+def run(gate, *parts, chunk=960):
+    audio = np.concatenate(parts).tobytes()
+    out = b"".join(gate.process(audio[i:i + chunk]) for i in range(0, len(audio), chunk))
+    return np.frombuffer(out + gate.flush(), dtype=np.int16)
+
+def test_leading_and_trailing_silence_are_trimmed():
+    gate = VoiceActivityGate(hangover_ms=100, lookback_ms=100)
+    out = run(gate, silence(1.0), tone(0.5), silence(1.0))
+    # 100 ms lookback + 500 ms speech + 100 ms hangover
+    assert len(out) == int(RATE * 0.7)
+    stats = gate.stats()
+    assert stats["seconds_in"] == 2.5
+    assert stats["seconds_suppressed"] == 1.8
+
+def test_long_pause_is_compressed_short_pause_kept():
+    gate = VoiceActivityGate(hangover_ms=100, lookback_ms=100, max_pause_ms=400)
+    short = run(gate, tone(0.5), silence(0.3), tone(0.5))
+    assert len(short) == int(RATE * 1.3)
+
+    gate = VoiceActivityGate(hangover_ms=100, lookback_ms=100, max_pause_ms=400)
+    long = run(gate, tone(0.5), silence(3.0), tone(0.5))
+    assert len(long) == int(RATE * 1.4)
+
+def test_onset_is_not_clipped():
+    gate = VoiceActivityGate(lookback_ms=200)
+    speech = tone(0.3)
+    out = run(gate, silence(1.0), speech)
+    # The word itself reaches the output unchanged, preceded by the lookback
+    assert np.array_equal(out[-len(speech):], speech)
+    assert len(out) == len(speech) + int(RATE * 0.2)
+
+def test_quiet_fricative_counts_as_speech():
+    gate = VoiceActivityGate(threshold_db=-50)
+    rng = np.random.default_rng(0)
+    # Around -55 dBFS: too quiet on energy alone, but noise-like with a high zero-crossing rate
+    hiss = (rng.standard_normal(4800) * 60).astype(np.int16)
+    assert gate.classify(hiss.reshape(10, 480)).all()
+    hum = tone(0.2, amplitude=85)
+    assert not gate.classify(hum.reshape(10, 480)).any()
+
+def test_totals_survive_reset_between_recordings():
+    gate = VoiceActivityGate(hangover_ms=100, lookback_ms=100)
+    run(gate, silence(1.0), tone(0.5))
+    gate.reset()
+    run(gate, silence(1.0), tone(0.5))
+    stats = gate.stats()
+    assert stats["seconds_in"] == 3.0
+    assert stats["seconds_sent"] == 1.2
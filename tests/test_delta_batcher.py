@@ -0,0 +1,42 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+from delta_batcher import DeltaBatcher
+
+@pytest.mark.asyncio
+async def test_deltas_within_window_are_sent_together():
+    send = AsyncMock()
+    batcher = DeltaBatcher(send, window=0.02)
+    for delta in ("Hel", "lo", " world"):
+        await batcher.add(delta)
+    send.assert_not_awaited()
+
+    await asyncio.sleep(0.05)
+    send.assert_awaited_once_with("Hello world")
+    assert batcher.stats() == {"deltas_received": 3, "batches_sent": 1}
+
+@pytest.mark.asyncio
+async def test_size_threshold_flushes_immediately():
+    send = AsyncMock()
+    batcher = DeltaBatcher(send, window=10, max_chars=5)
+    await batcher.add("abc")
+    await batcher.add("def")
+    send.assert_awaited_once_with("abcdef")
+    await batcher.close()
+
+@pytest.mark.asyncio
+async def test_flush_sends_pending_text_and_cancels_timer():
+    send = AsyncMock()
+    batcher = DeltaBatcher(send, window=0.02)
+    await batcher.add("tail")
+    await batcher.flush()
+    send.assert_awaited_once_with("tail")
+
+    await asyncio.sleep(0.05)
+    send.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_flush_with_nothing_pending_sends_nothing():
+    send = AsyncMock()
+    await DeltaBatcher(send).flush()
+    send.assert_not_awaited()
@@ -0,0 +1,61 @@
+import pytest
+import json
+from datetime import datetime
+from unittest.mock import patch
+from journal import JournalWriter, FSYNC_BATCH
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+@pytest.mark.asyncio
+async def test_records_are_batched_and_flushed_on_stop(tmp_path):
+    journal = JournalWriter(str(tmp_path))
+    await journal.start()
+    for i in range(5):
+        journal.record("Transcript", f"text {i}", session_id="abc", model="gpt-4o", latency_ms=12.34)
+    await journal.stop()
+
+    files = list(tmp_path.glob("*.jsonl"))
+    assert len(files) == 1
+    records = read_lines(files[0])
+    assert [r["content"] for r in records] == [f"text {i}" for i in range(5)]
+    assert records[0]["session_id"] == "abc"
+    assert records[0]["model"] == "gpt-4o"
+    assert records[0]["latency_ms"] == 12.3
+    assert journal.stats()["records_written"] == 5
+    # All five were queued before the writer ran, so they went out as one batch
+    assert journal.stats()["batches_written"] == 1
+
+@pytest.mark.asyncio
+async def test_rotates_file_at_midnight(tmp_path):
+    journal = JournalWriter(str(tmp_path), fsync=FSYNC_BATCH)
+    await journal.start()
+    with patch("journal.datetime") as mock_datetime:
+        mock_datetime.now.return_value = datetime(2024, 1, 1, 23, 59, 59)
+        journal.record("Readability", "before")
+        mock_datetime.now.return_value = datetime(2024, 1, 2, 0, 0, 1)
+        journal.record("Readability", "after")
+    await journal.stop()
+
+    assert read_lines(tmp_path / "2024-01-01.jsonl")[0]["content"] == "before"
+    assert read_lines(tmp_path / "2024-01-02.jsonl")[0]["content"] == "after"
+
+@pytest.mark.asyncio
+async def test_records_before_start_are_held_for_the_writer(tmp_path):
+    journal = JournalWriter(str(tmp_path), max_queue=2)
+    for i in range(3):
+        journal.record("AskAI", f"answer {i}")
+    # Nothing touches the disk until the writer runs, and the backlog is bounded
+    assert list(tmp_path.glob("*.jsonl")) == []
+    assert journal.stats()["queued"] == 2
+    assert journal.stats()["records_dropped"] == 1
+
+    await journal.start()
+    await journal.stop()
+    records = read_lines(next(tmp_path.glob("*.jsonl")))
+    assert [r["content"] for r in records] == ["answer 0", "answer 1"]
+
+def test_rejects_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        JournalWriter(str(tmp_path), fsync="sometimes")
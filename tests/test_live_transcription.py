@@ -0,0 +1,44 @@
+import numpy as np
+from live_transcription import LiveSegmenter, segment_separator
+
+def tone(seconds, sample_rate=24000, amplitude=5000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (np.sin(2 * np.pi * 220 * t) * amplitude).astype(np.int16).tobytes()
+
+def silence(seconds, sample_rate=24000):
+    return np.zeros(int(seconds * sample_rate), dtype=np.int16).tobytes()
+
+def test_boundary_at_first_pause_after_min_segment():
+    segmenter = LiveSegmenter(min_segment=1.0, max_segment=10.0, silence=0.3)
+    assert not segmenter.feed(tone(0.5))
+    # A pause before min_segment doesn't cut the segment
+    assert not segmenter.feed(silence(0.4))
+    assert not segmenter.feed(tone(0.5))
+    assert not segmenter.feed(silence(0.2))
+    assert segmenter.feed(silence(0.2))
+    assert segmenter.segments == 1
+    assert segmenter.segment_seconds == 0.0
+
+def test_boundary_at_max_segment_without_pause():
+    segmenter = LiveSegmenter(min_segment=1.0, max_segment=2.0, silence=0.3)
+    results = [segmenter.feed(tone(0.5)) for _ in range(4)]
+    assert results == [False, False, False, True]
+
+def test_silence_only_is_never_a_segment():
+    segmenter = LiveSegmenter(min_segment=1.0, max_segment=2.0, silence=0.3)
+    assert not any(segmenter.feed(silence(0.5)) for _ in range(8))
+    assert segmenter.segments == 0
+
+def test_leading_silence_does_not_count_toward_segment():
+    segmenter = LiveSegmenter(min_segment=1.0, max_segment=2.0, silence=0.3)
+    assert not any(segmenter.feed(silence(0.5)) for _ in range(6))
+    # The first word after a long silence starts the segment instead of ending it
+    assert not segmenter.feed(tone(0.04))
+    assert segmenter.segment_seconds == 0.04
+    assert segmenter.segments == 0
+
+def test_segment_separator():
+    assert segment_separator("") == ""
+    assert segment_separator("Hello.") == " "
+    assert segment_separator("Hello. ") == ""
+    assert segment_separator("你好。") == ""
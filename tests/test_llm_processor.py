@@ -1,7 +1,11 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 import os
-from llm_processor import GeminiProcessor, GPTProcessor, get_llm_processor
+import asyncio
+from llm_processor import (
+    GeminiProcessor, GPTProcessor, LLMProcessor, ModelConcurrencyLimiter, SingleFlight,
+    ProcessorRegistry, get_llm_processor,
+)
 
 @pytest.fixture
 def mock_env_vars():
@@ -70,6 +74,13 @@ class TestGeminiProcessor:
         assert result == ["Hello", " World"]
         mock_genai.GenerativeModel.return_value.generate_content_async.assert_called_once()
 
+    def test_model_handles_are_cached(self, mock_env_vars, mock_genai):
+        processor = GeminiProcessor()
+        processor.process_text_sync("input", "prompt")
+        processor.process_text_sync("more input", "prompt")
+        processor.process_text_sync("input", "prompt", model="gemini-1.5-flash")
+        assert mock_genai.GenerativeModel.call_count == 2
+
     def test_process_text_sync(self, mock_env_vars, mock_genai):
         processor = GeminiProcessor()
         result = processor.process_text_sync("input", "prompt")
@@ -86,8 +97,28 @@ class TestGPTProcessor:
         mock_async_class, mock_class, _, _ = mock_openai
         processor = GPTProcessor()
         assert processor.default_model == 'gpt-4'
-        mock_async_class.assert_called_once_with(api_key='test_openai_key')
-        mock_class.assert_called_once_with(api_key='test_openai_key')
+        assert mock_async_class.call_args.kwargs['api_key'] == 'test_openai_key'
+        assert mock_class.call_args.kwargs['api_key'] == 'test_openai_key'
+
+    def test_http_pools_are_sized(self, mock_env_vars, mock_openai):
+        mock_async_class, mock_class, _, _ = mock_openai
+        GPTProcessor(max_connections=7, max_keepalive=3)
+        async_pool = mock_async_class.call_args.kwargs['http_client']._transport._pool
+        sync_pool = mock_class.call_args.kwargs['http_client']._transport._pool
+        for pool in (async_pool, sync_pool):
+            assert pool._max_connections == 7
+            assert pool._max_keepalive_connections == 3
+
+    @pytest.mark.asyncio
+    async def test_warm_up_and_close(self, mock_env_vars, mock_openai):
+        _, _, mock_async_client, mock_client = mock_openai
+        mock_async_client.models.list = AsyncMock()
+        processor = GPTProcessor()
+        await processor.warm_up("gpt-4o")
+        mock_async_client.models.list.assert_awaited_once()
+        await processor.close()
+        mock_async_client.close.assert_awaited_once()
+        mock_client.close.assert_called_once()
 
     @pytest.mark.asyncio
     async def test_process_text(self, mock_env_vars, mock_openai):
@@ -102,6 +133,220 @@ class TestGPTProcessor:
         result = processor.process_text_sync("input", "prompt")
         assert result == "Test response"
 
+    @pytest.mark.asyncio
+    async def test_process_text_async(self, mock_env_vars, mock_openai):
+        _, _, mock_async_client, _ = mock_openai
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock(message=MagicMock(content="Async response"))]
+        mock_async_client.chat.completions.create = AsyncMock(return_value=mock_response)
+        processor = GPTProcessor()
+        result = await processor.process_text_async("input", "prompt", model="o1-mini")
+        assert result == "Async response"
+        assert mock_async_client.chat.completions.create.call_args.kwargs["model"] == "o1-mini"
+        assert "stream" not in mock_async_client.chat.completions.create.call_args.kwargs
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_caps_each_model_separately():
+    limiter = ModelConcurrencyLimiter.from_spec("o1-mini=2", default_limit=5)
+    release = asyncio.Event()
+    active = {"o1-mini": 0, "gpt-4o": 0}
+    peak = {"o1-mini": 0, "gpt-4o": 0}
+
+    async def call(model):
+        async with limiter.limit(model):
+            active[model] += 1
+            peak[model] = max(peak[model], active[model])
+            await release.wait()
+            active[model] -= 1
+
+    tasks = [asyncio.create_task(call(m)) for m in ["o1-mini"] * 6 + ["gpt-4o"] * 6]
+    await asyncio.sleep(0.01)
+    assert limiter.stats()["o1-mini"] == {"limit": 2, "in_flight": 2, "waiting": 4}
+    assert limiter.stats()["gpt-4o"] == {"limit": 5, "in_flight": 5, "waiting": 1}
+    release.set()
+    await asyncio.gather(*tasks)
+    assert peak == {"o1-mini": 2, "gpt-4o": 5}
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_holds_across_workers():
+    from shared_state import RedisState
+    from state_server import StateServer
+
+    server = await StateServer().serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    # Two workers, each with its own limiter and connection
+    workers = [ModelConcurrencyLimiter.from_spec("o1-mini=3", shared=RedisState(port=port)) for _ in range(2)]
+    release = asyncio.Event()
+    active = 0
+    peak = 0
+
+    async def call(limiter):
+        nonlocal active, peak
+        async with limiter.limit("o1-mini"):
+            active += 1
+            peak = max(peak, active)
+            await release.wait()
+            active -= 1
+
+    tasks = [asyncio.create_task(call(workers[i % 2])) for i in range(8)]
+    await asyncio.sleep(0.1)
+    assert active == 3
+    release.set()
+    await asyncio.gather(*tasks)
+    assert peak == 3
+    assert await workers[0].shared.get("brainwave:llm_in_flight:o1-mini") == "0"
+
+    for limiter in workers:
+        await limiter.shared.close()
+    server.close()
+    await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_slots_of_a_dead_worker_are_reclaimed_once_its_lease_expires():
+    from shared_state import RedisState
+    from state_server import StateServer
+
+    server = await StateServer().serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    dead, alive = [
+        ModelConcurrencyLimiter.from_spec("o1-mini=2", shared=RedisState(port=port), lease=0.3, worker_id=name)
+        for name in ("dead", "alive")
+    ]
+    # The first worker takes every slot and then stops renewing its lease without releasing
+    held = [dead.limit("o1-mini") for _ in range(2)]
+    for slot in held:
+        await slot.__aenter__()
+    dead._heartbeat.cancel()
+    assert (await alive.shared.hgetall("brainwave:llm_leases:o1-mini"))["dead"].split()[0] == "2"
+
+    async def call():
+        async with alive.limit("o1-mini"):
+            return await alive.shared.get("brainwave:llm_in_flight:o1-mini")
+
+    assert await asyncio.wait_for(call(), timeout=3) == "1"
+    assert alive.slots_reclaimed == 2
+    assert await alive.shared.get("brainwave:llm_in_flight:o1-mini") == "0"
+    assert await alive.shared.hgetall("brainwave:llm_leases:o1-mini") == {}
+
+    for limiter in (dead, alive):
+        await limiter.shared.close()
+    server.close()
+    await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_reclaim_racing_a_release_never_drives_the_counter_negative():
+    from shared_state import RedisState
+    from state_server import StateServer
+
+    server = await StateServer().serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    slow, other = [
+        ModelConcurrencyLimiter.from_spec("o1-mini=2", shared=RedisState(port=port), lease=0.1, worker_id=name)
+        for name in ("slow", "other")
+    ]
+    # A worker that is alive but late renewing: its lease runs out while it holds two slots
+    held = [slow.limit("o1-mini") for _ in range(2)]
+    for slot in held:
+        await slot.__aenter__()
+    slow._heartbeat.cancel()
+    await asyncio.sleep(0.15)
+
+    # Another worker reclaims them while the slow one releases the same slots
+    await asyncio.gather(other._reclaim("o1-mini"), *[slot.__aexit__(None, None, None) for slot in held])
+
+    assert other.slots_reclaimed == 2
+    assert await other.shared.get("brainwave:llm_in_flight:o1-mini") == "0"
+    assert await other.shared.hgetall("brainwave:llm_leases:o1-mini") == {}
+    # Both slots are usable again, and no more
+    async with other.limit("o1-mini"), slow.limit("o1-mini"):
+        assert await other.shared.get("brainwave:llm_in_flight:o1-mini") == "2"
+
+    for limiter in (slow, other):
+        await limiter.shared.close()
+    server.close()
+    await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_falls_back_to_local_cap_without_shared_state():
+    from shared_state import RedisState
+
+    # Nothing listens on this port
+    limiter = ModelConcurrencyLimiter.from_spec("o1-mini=1", shared=RedisState(port=1, timeout=0.5))
+    async with limiter.limit("o1-mini"):
+        assert limiter.stats()["o1-mini"]["in_flight"] == 1
+
+def test_concurrency_limiter_rejects_bad_spec():
+    with pytest.raises(ValueError):
+        ModelConcurrencyLimiter.from_spec("o1-mini")
+
+def gated_stream(chunks, gate, calls):
+    async def factory():
+        calls.append(1)
+        for chunk in chunks:
+            await gate.get()
+            yield chunk
+    return factory
+
+async def collect(stream):
+    return [part async for part in stream]
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_upstream_and_replays_prefix():
+    flights = SingleFlight()
+    gate = asyncio.Queue()
+    calls = []
+    factory = gated_stream(["a", "b", "c"], gate, calls)
+
+    first = asyncio.create_task(collect(flights.stream("key", factory)))
+    gate.put_nowait(None)
+    await asyncio.sleep(0.01)
+    # Late joiner arrives after "a" was emitted
+    second = asyncio.create_task(collect(flights.stream("key", factory)))
+    await asyncio.sleep(0.01)
+    gate.put_nowait(None)
+    gate.put_nowait(None)
+
+    assert await first == ["a", "b", "c"]
+    assert await second == ["a", "b", "c"]
+    assert len(calls) == 1
+    assert flights.stats() == {"in_flight": 0, "upstream_streams": 1, "coalesced": 1}
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_upstream_when_everyone_leaves():
+    flights = SingleFlight()
+    gate = asyncio.Queue()
+    calls = []
+    stream = flights.stream("key", gated_stream(["a", "b"], gate, calls))
+    gate.put_nowait(None)
+    assert await stream.__anext__() == "a"
+    await stream.aclose()
+    await asyncio.sleep(0)
+    assert flights.in_flight() == 0
+
+    # The next request starts a fresh upstream stream
+    gate.put_nowait(None)
+    gate.put_nowait(None)
+    assert await collect(flights.stream("key", gated_stream(["x", "y"], gate, calls))) == ["x", "y"]
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_to_all_subscribers():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+
+    async def failing():
+        await gate.wait()
+        raise RuntimeError("upstream failed")
+        yield
+
+    first = asyncio.create_task(collect(flights.stream("key", failing)))
+    second = asyncio.create_task(collect(flights.stream("key", failing)))
+    await asyncio.sleep(0.01)
+    gate.set()
+    for task in (first, second):
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            await task
+
 def test_get_llm_processor_gemini(mock_env_vars, mock_genai):
     processor = get_llm_processor("gemini-1.5-pro")
     assert isinstance(processor, GeminiProcessor)
@@ -113,3 +358,169 @@ def test_get_llm_processor_gpt(mock_env_vars, mock_openai):
 def test_get_llm_processor_unknown(mock_env_vars):
     with pytest.raises(ValueError, match="Unsupported model type:"):
         get_llm_processor("unknown-model")
+
+class FakeProcessor(LLMProcessor):
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.closed = False
+
+    async def process_text(self, text, prompt, model=None):
+        self.calls.append(model)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError(f"{self.name} failed")
+            yield f"{self.name}:"
+            yield model
+        finally:
+            self.closed = True
+
+    def process_text_sync(self, text, prompt, model=None):
+        return f"{self.name}:{model}"
+
+    async def process_text_async(self, text, prompt, model=None):
+        self.calls.append(model)
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        return f"{self.name}:{model}"
+
+def make_registry(openai, gemini, **kwargs):
+    created = []
+    def factory(processor):
+        def build():
+            created.append(processor.name)
+            return processor
+        return build
+    registry = ProcessorRegistry(factories={"openai": factory(openai), "gemini": factory(gemini)}, **kwargs)
+    return registry, created
+
+@pytest.mark.asyncio
+async def test_registry_routes_by_model_and_builds_providers_lazily():
+    registry, created = make_registry(FakeProcessor("openai"), FakeProcessor("gemini"))
+    assert created == []
+    assert await registry.process_text_async("t", "p", model="gemini-1.5-pro") == "gemini:gemini-1.5-pro"
+    assert [part async for part in registry.process_text("t", "p", model="gpt-4o")] == ["openai:", "gpt-4o"]
+    assert registry.process_text_sync("t", "p", model="o1-mini") == "openai:o1-mini"
+    assert created == ["gemini", "openai"]
+    stats = registry.stats()
+    assert stats["providers"] == ["gemini", "openai"]
+    assert stats["latency"]["openai"]["total"]["count"] == 1
+    assert registry.latency.labels("gemini", "first_output").count == 1
+
+@pytest.mark.asyncio
+async def test_registry_falls_back_when_stream_exceeds_slo():
+    openai = FakeProcessor("openai", delay=1.0)
+    registry, _ = make_registry(openai, FakeProcessor("gemini"),
+                                fallbacks={"gpt-4o": "gemini-1.5-pro"}, latency_slo=0.02)
+    parts = [part async for part in registry.process_text("t", "p", model="gpt-4o")]
+    assert parts == ["gemini:", "gemini-1.5-pro"]
+    assert openai.closed
+    assert registry.stats()["fallbacks_used"] == 1
+
+@pytest.mark.asyncio
+async def test_registry_hedge_keeps_primary_racing():
+    openai = FakeProcessor("openai", delay=0.05)
+    gemini = FakeProcessor("gemini", delay=1.0)
+    registry, _ = make_registry(openai, gemini, fallbacks={"gpt-4o": "gemini-1.5-pro"},
+                                latency_slo=0.01, hedge=True)
+    parts = [part async for part in registry.process_text("t", "p", model="gpt-4o")]
+    assert parts == ["openai:", "gpt-4o"]
+    assert gemini.calls == ["gemini-1.5-pro"]
+    assert gemini.closed
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("latency_slo,hedged", [(0.5, False), (0.01, True)])
+async def test_registry_closes_racing_streams_when_the_caller_goes_away(latency_slo, hedged):
+    openai = FakeProcessor("openai", delay=1.0)
+    gemini = FakeProcessor("gemini", delay=1.0)
+    registry, _ = make_registry(openai, gemini, fallbacks={"gpt-4o": "gemini-1.5-pro"},
+                                latency_slo=latency_slo, hedge=True)
+
+    async def consume():
+        return [part async for part in registry.process_text("t", "p", model="gpt-4o")]
+
+    # Cancelled while waiting out the SLO, or while both providers race
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0.05)
+    assert bool(gemini.calls) == hedged
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+    assert openai.closed
+    assert gemini.closed == hedged
+
+@pytest.mark.asyncio
+async def test_registry_closes_the_provider_stream_when_the_caller_stops_early():
+    openai = FakeProcessor("openai")
+    registry, _ = make_registry(openai, FakeProcessor("gemini"),
+                                fallbacks={"gpt-4o": "gemini-1.5-pro"}, latency_slo=5)
+    stream = registry.process_text("t", "p", model="gpt-4o")
+    assert await stream.__anext__() == "openai:"
+    await stream.aclose()
+    assert openai.closed
+
+@pytest.mark.asyncio
+async def test_registry_falls_back_on_error_for_complete_answers():
+    registry, _ = make_registry(FakeProcessor("openai", fail=True), FakeProcessor("gemini"),
+                                fallbacks={"o1-mini": "gemini-1.5-pro"}, latency_slo=5)
+    assert await registry.process_text_async("t", "p", model="o1-mini") == "gemini:gemini-1.5-pro"
+
+@pytest.mark.asyncio
+async def test_registry_reports_the_model_that_answered():
+    registry, _ = make_registry(FakeProcessor("openai", delay=1.0), FakeProcessor("gemini"),
+                                fallbacks={"gpt-4o": "gemini-1.5-pro"}, latency_slo=0.02)
+    answered = []
+    parts = [part async for part in registry.process_text("t", "p", model="gpt-4o", answered_by=answered.append)]
+    assert parts == ["gemini:", "gemini-1.5-pro"]
+    assert await registry.process_text_async("t", "p", model="gpt-4o", answered_by=answered.append) == \
+        "gemini:gemini-1.5-pro"
+    assert await registry.process_text_async("t", "p", model="o1-mini", answered_by=answered.append) == \
+        "openai:o1-mini"
+    assert answered == ["gemini-1.5-pro", "gemini-1.5-pro", "o1-mini"]
+
+@pytest.mark.asyncio
+async def test_rerouted_calls_take_the_fallback_models_slot():
+    limiter = ModelConcurrencyLimiter(limits={"gemini-1.5-pro": 2})
+    peak = 0
+
+    class CountingGemini(FakeProcessor):
+        async def process_text_async(self, text, prompt, model=None):
+            nonlocal peak
+            peak = max(peak, limiter.stats()["gemini-1.5-pro"]["in_flight"])
+            return await super().process_text_async(text, prompt, model=model)
+
+    registry, _ = make_registry(FakeProcessor("openai", fail=True), CountingGemini("gemini", delay=0.02),
+                                fallbacks={"gpt-4o": "gemini-1.5-pro"}, latency_slo=5, limiter=limiter)
+    answers = await asyncio.gather(*[registry.process_text_async("t", "p", model="gpt-4o") for _ in range(6)])
+    assert answers == ["gemini:gemini-1.5-pro"] * 6
+    assert peak == 2
+    # The primary's slot is the caller's to take
+    assert "gpt-4o" not in limiter.stats()
+    assert limiter.stats()["gemini-1.5-pro"]["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_registry_without_available_fallback_waits_for_primary():
+    def unavailable():
+        raise EnvironmentError("GOOGLE_API_KEY is not set")
+    registry = ProcessorRegistry(
+        factories={"openai": lambda: FakeProcessor("openai", delay=0.03), "gemini": unavailable},
+        fallbacks={"gpt-4o": "gemini-1.5-pro"}, latency_slo=0.01,
+    )
+    assert await registry.process_text_async("t", "p", model="gpt-4o") == "openai:gpt-4o"
+
+@pytest.mark.asyncio
+async def test_registry_warm_up_builds_processors_and_tolerates_failures():
+    class FailingWarmUp(FakeProcessor):
+        async def warm_up(self, model=None):
+            raise ConnectionError("offline")
+
+    openai = FakeProcessor("openai")
+    openai.warm_up = AsyncMock()
+    registry, created = make_registry(openai, FailingWarmUp("gemini"))
+    await registry.warm_up(["gpt-4o", "gemini-1.5-pro"])
+    assert created == ["openai", "gemini"]
+    openai.warm_up.assert_awaited_once_with("gpt-4o")
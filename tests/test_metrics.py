@@ -0,0 +1,106 @@
+import pytest
+from metrics import Counter, Gauge, Histogram, Registry, _Metric, merge_families, render
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_renders_with_total_suffix_and_labels(registry):
+    counter = Counter("bytes", "Bytes moved", ["direction"], registry=registry)
+    counter.labels("sent").inc(10)
+    counter.labels(direction="sent").inc(5)
+    counter.labels("received").inc()
+
+    text = render(registry.collect())
+
+    assert "# HELP bytes Bytes moved\n# TYPE bytes counter\n" in text
+    assert 'bytes_total{direction="sent"} 15\n' in text
+    assert 'bytes_total{direction="received"} 1\n' in text
+
+
+def test_unlabelled_metrics_are_exported_before_first_use(registry):
+    Gauge("sessions", "Open sessions", registry=registry)
+    Histogram("latency", "Latency", registry=registry, buckets=(1.0,))
+
+    text = render(registry.collect())
+
+    assert "sessions 0\n" in text
+    assert 'latency_bucket{le="+Inf"} 0\n' in text
+    assert "latency_count 0\n" in text
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram("latency", "Latency", registry=registry, buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.3, 0.3, 2.0):
+        histogram.observe(value)
+
+    text = render(registry.collect())
+
+    assert 'latency_bucket{le="0.1"} 1\n' in text
+    assert 'latency_bucket{le="0.5"} 3\n' in text
+    assert 'latency_bucket{le="1"} 3\n' in text
+    assert 'latency_bucket{le="+Inf"} 4\n' in text
+    assert "latency_sum 2.65\n" in text
+    assert "latency_count 4\n" in text
+
+
+def test_gauge_callback_is_read_at_collection_time(registry):
+    depths = {"journal": 2}
+    gauge = Gauge("queue_depth", "Queued items", ["queue"], registry=registry)
+    gauge.set_function(lambda: {(name,): depth for name, depth in depths.items()})
+
+    depths["journal"] = 7
+
+    assert 'queue_depth{queue="journal"} 7\n' in render(registry.collect())
+
+
+def test_failing_callback_does_not_break_collection(registry):
+    Gauge("broken", "Broken", registry=registry).set_function(lambda: 1 / 0)
+    Counter("ok", "Fine", registry=registry).inc()
+
+    assert [family["name"] for family in registry.collect()] == ["ok"]
+
+
+def test_duplicate_names_are_rejected(registry):
+    Counter("requests", "Requests", registry=registry)
+    with pytest.raises(ValueError):
+        Gauge("requests", "Requests", registry=registry)
+
+
+def test_merge_labels_every_sample_with_its_worker(registry):
+    Counter("requests", "Requests", registry=registry).inc(3)
+    other = Registry()
+    Counter("requests", "Requests", registry=other).inc(4)
+
+    merged = merge_families({"a:1": registry.collect(), "b:2": other.collect()})
+    text = render(merged)
+
+    assert text.count("# TYPE requests counter") == 1
+    assert 'requests_total{worker="a:1"} 3\n' in text
+    assert 'requests_total{worker="b:2"} 4\n' in text
+
+
+def test_label_values_are_escaped(registry):
+    Counter("errors", "Errors", ["reason"], registry=registry).labels('bad "quote"\n').inc()
+
+    assert 'errors_total{reason="bad \\"quote\\"\\n"} 1\n' in render(registry.collect())
+
+
+def test_histogram_quantile_is_the_upper_bound_of_its_bucket(registry):
+    histogram = Histogram("latency", "Latency", registry=registry, buckets=(0.1, 1.0))
+    assert histogram.labels().quantile(0.5) is None
+    for value in (0.05, 0.05, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.labels().quantile(0.5) == 0.1
+    assert histogram.labels().quantile(0.95) == float("inf")
+
+
+def test_metric_types_must_implement_samples(registry):
+    class Incomplete(_Metric):
+        def _new_child(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Missing samples()", registry=registry)
@@ -41,6 +41,19 @@ async def test_connect_success(client):
         }
         mock_ws.send.assert_awaited_with(json.dumps(expected_update))
 
+@pytest.mark.asyncio
+async def test_idle_session_does_not_warn_about_session_updated(client, caplog):
+    mock_ws = AsyncMock()
+    mock_ws.recv.return_value = json.dumps({"type": "session.created", "session": {"id": "test_session_id"}})
+    mock_ws.__aiter__.return_value = [json.dumps({"type": "session.updated", "session": {}})]
+
+    with patch('websockets.connect', AsyncMock(return_value=mock_ws)), caplog.at_level("WARNING"):
+        await client.connect()
+        await asyncio.sleep(0.05)
+        await client.close()
+
+    assert "Unhandled message type" not in caplog.text
+
 @pytest.mark.asyncio
 async def test_send_audio(client):
     mock_ws = AsyncMock()
@@ -131,3 +144,158 @@ async def test_receive_messages(client):
         await receive_task
     except asyncio.CancelledError:
         pass
+
+@pytest.mark.asyncio
+async def test_is_healthy(client):
+    assert not client.is_healthy()
+
+    mock_ws = AsyncMock()
+    mock_ws.open = True
+    client.ws = mock_ws
+    client.connected_at = 0.0
+    client.receive_task = asyncio.create_task(asyncio.sleep(10))
+
+    assert client.is_healthy()
+    assert not client.is_healthy(max_age=1.0)
+
+    mock_ws.open = False
+    assert not client.is_healthy()
+    client.receive_task.cancel()
+
+@pytest.mark.asyncio
+async def test_queued_dispatch_does_not_block_receive_loop(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key, dispatch_mode="queued")
+    mock_ws = AsyncMock()
+    messages = [{"type": "slow", "n": i} for i in range(3)]
+    mock_ws.__aiter__.return_value = [json.dumps(m) for m in messages]
+    client.ws = mock_ws
+
+    release = asyncio.Event()
+    handled = []
+    async def slow_handler(data):
+        await release.wait()
+        handled.append(data["n"])
+    client.register_handler("slow", slow_handler)
+
+    client.dispatch_task = asyncio.create_task(client.dispatch_messages())
+    await asyncio.wait_for(client.receive_messages(), timeout=1)
+
+    # Everything was read from the socket even though no handler has finished
+    assert handled == []
+    assert client.dispatch_stats()["max_queue_depth"] >= 2
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert handled == [0, 1, 2]
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_queued_dispatch_coalesces_text_deltas(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key, dispatch_mode="queued", backpressure="coalesce")
+    for delta in ("Hel", "lo", " world"):
+        await client._enqueue({"type": "response.text.delta", "response_id": "r1", "item_id": "i1", "delta": delta})
+    await client._enqueue({"type": "response.done"})
+    await client._enqueue({"type": "response.text.delta", "response_id": "r2", "item_id": "i2", "delta": "next"})
+
+    assert [event.get("delta") for event in client.queue] == ["Hello world", None, "next"]
+    assert client.dispatch_stats()["coalesced_events"] == 2
+
+@pytest.mark.asyncio
+async def test_queued_dispatch_blocks_when_full(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key, dispatch_mode="queued", max_queue_size=1, backpressure="block")
+    await client._enqueue({"type": "a"})
+    blocked = asyncio.create_task(client._enqueue({"type": "b"}))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    client.queue.popleft()
+    client._queue_not_full.set()
+    await asyncio.wait_for(blocked, timeout=1)
+    assert client.dispatch_stats()["blocked_enqueues"] == 1
+
+@pytest.mark.asyncio
+async def test_small_chunks_are_aggregated_until_commit(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key, min_append_bytes=10)
+    mock_ws = AsyncMock()
+    mock_ws.open = True
+    client.ws = mock_ws
+
+    await client.send_audio(b"12345")
+    mock_ws.send.assert_not_awaited()
+    await client.send_audio(b"678901")
+    await client.send_audio(b"ab")
+    await client.commit_audio()
+
+    sent = [json.loads(call.args[0]) for call in mock_ws.send.await_args_list]
+    assert sent == [
+        {"type": "input_audio_buffer.append", "audio": "MTIzNDU2Nzg5MDE="},
+        {"type": "input_audio_buffer.append", "audio": "YWI="},
+        {"type": "input_audio_buffer.commit"},
+    ]
+    assert client.append_stats() == {"appends_sent": 2, "audio_bytes_sent": 13, "pending_audio_bytes": 0}
+
+@pytest.mark.asyncio
+async def test_clear_drops_held_audio(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key, min_append_bytes=10)
+    mock_ws = AsyncMock()
+    mock_ws.open = True
+    client.ws = mock_ws
+
+    await client.send_audio(b"12345")
+    await client.clear_audio_buffer()
+    await client.commit_audio()
+    sent = [json.loads(call.args[0])["type"] for call in mock_ws.send.await_args_list]
+    assert sent == ["input_audio_buffer.clear", "input_audio_buffer.commit"]
+
+@pytest.mark.asyncio
+async def test_append_is_sent_as_text_frame(api_key):
+    received = []
+
+    async def handler(ws, path=None):
+        async for message in ws:
+            received.append(message)
+
+    async with websockets.serve(handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        client = OpenAIRealtimeAudioTextClient(api_key)
+        client.ws = await websockets.connect(f"ws://127.0.0.1:{port}")
+        await client.send_audio(b"test_audio_data")
+        await client.send_audio(b"more")
+        await client.ws.close()
+
+    assert received == [
+        json.dumps({"type": "input_audio_buffer.append", "audio": "dGVzdF9hdWRpb19kYXRh"}),
+        json.dumps({"type": "input_audio_buffer.append", "audio": "bW9yZQ=="}),
+    ]
+
+@pytest.mark.asyncio
+async def test_appends_are_traced_under_the_current_recording(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key)
+    mock_ws = AsyncMock()
+    mock_ws.open = True
+    client.ws = mock_ws
+
+    await client.send_audio(b"untraced")
+    client.trace_parent = MagicMock()
+    await client.send_audio(b"12345")
+
+    client.trace_parent.record.assert_called_once()
+    name, started, ended = client.trace_parent.record.call_args.args
+    assert name == "realtime.append" and started <= ended
+    assert client.trace_parent.record.call_args.kwargs == {"audio_bytes": 5}
+
+@pytest.mark.asyncio
+async def test_close_releases_handlers_and_tasks_even_if_the_socket_fails(api_key):
+    client = OpenAIRealtimeAudioTextClient(api_key)
+    client.ws = AsyncMock()
+    client.ws.close.side_effect = ConnectionResetError()
+    client.receive_task = asyncio.create_task(asyncio.sleep(60))
+    client.register_handler("response.done", AsyncMock())
+    client.trace_parent = MagicMock()
+
+    with pytest.raises(ConnectionResetError):
+        await client.close()
+
+    assert client.receive_task.cancelled()
+    assert client.handlers == {}
+    assert client.trace_parent is None
@@ -1,4 +1,5 @@
 import pytest
+import os
 from fastapi.testclient import TestClient
 from realtime_server import app, ReadabilityRequest, CorrectnessRequest, AskAIRequest
 import json
@@ -6,11 +7,27 @@ from unittest.mock import patch, AsyncMock, MagicMock
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def empty_response_cache():
+    import asyncio
+    import realtime_server
+    asyncio.run(realtime_server.response_cache.clear())
+    yield
+
+@pytest.fixture(autouse=True)
+def journal_in_tmp_path(tmp_path, monkeypatch):
+    # Keep the tests' transcripts out of the repository's logs/
+    import realtime_server
+    from journal import JournalWriter
+    monkeypatch.setattr(realtime_server, "journal", JournalWriter(str(tmp_path / "logs")))
+    yield
+
 @pytest.fixture
 def mock_llm_processor():
     with patch('realtime_server.llm_processor') as mock:
         # Setup for sync processing
         mock.process_text_sync.return_value = "Mocked response"
+        mock.process_text_async = AsyncMock(return_value="Mocked response")
         
         # Setup for async processing
         async def text_generator():
@@ -38,6 +55,101 @@ def test_ask_ai(mock_llm_processor):
     response = client.post("/api/v1/ask_ai", json=request.model_dump())
     assert response.status_code == 200
     assert response.json()["answer"] == "Mocked response"
+    mock_llm_processor.process_text_async.assert_awaited_once()
+    mock_llm_processor.process_text_sync.assert_not_called()
+
+def test_endpoint_model_is_configurable(mock_llm_processor):
+    with patch.dict('realtime_server.ENDPOINT_MODELS', {"readability": "gemini-1.5-pro"}):
+        response = client.post("/api/v1/readability", json={"text": "Route me"})
+    assert response.status_code == 200
+    assert mock_llm_processor.process_text.call_args.kwargs["model"] == "gemini-1.5-pro"
+
+def test_repeated_readability_is_served_from_cache(mock_llm_processor):
+    request = ReadabilityRequest(text="Same transcript")
+    first = client.post("/api/v1/readability", json=request.model_dump())
+    second = client.post("/api/v1/readability", json={"text": "Same   transcript "})
+    assert first.text == second.text == "Mocked streaming response"
+    assert mock_llm_processor.process_text.call_count == 1
+
+def test_fallback_answers_are_cached_under_the_fallback_model(mock_llm_processor):
+    async def rerouted(text, prompt, model=None, answered_by=None):
+        answered_by("gemini-1.5-pro")
+        return "Fallback answer"
+
+    mock_llm_processor.process_text_async = AsyncMock(side_effect=rerouted)
+    first = client.post("/api/v1/ask_ai", json={"text": "Primary is down"})
+    second = client.post("/api/v1/ask_ai", json={"text": "Primary is down"})
+    assert first.json()["answer"] == second.json()["answer"] == "Fallback answer"
+    # Not served from cache to callers of the primary model once it recovers
+    assert mock_llm_processor.process_text_async.await_count == 2
+    with patch.dict('realtime_server.ENDPOINT_MODELS', {"ask_ai": "gemini-1.5-pro"}):
+        third = client.post("/api/v1/ask_ai", json={"text": "Primary is down"})
+    assert third.json()["answer"] == "Fallback answer"
+    assert mock_llm_processor.process_text_async.await_count == 2
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_correctness_requests_share_one_call():
+    import asyncio
+    import httpx
+
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_stream(text, prompt, model=None, answered_by=None):
+        started.set()
+        yield "Shared"
+        await release.wait()
+        yield " answer"
+
+    with patch('realtime_server.llm_processor') as mock, patch('realtime_server.log_content'):
+        mock.process_text = MagicMock(side_effect=slow_stream)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            first = asyncio.create_task(http.post("/api/v1/correctness", json={"text": "Concurrent fact"}))
+            await started.wait()
+            second = asyncio.create_task(http.post("/api/v1/correctness", json={"text": "Concurrent fact"}))
+            await asyncio.sleep(0.05)
+            release.set()
+            responses = await asyncio.gather(first, second)
+
+    assert [r.text for r in responses] == ["Shared answer", "Shared answer"]
+    assert mock.process_text.call_count == 1
+
+def test_ask_ai_streaming(mock_llm_processor):
+    request = AskAIRequest(text="What is the meaning of life?")
+    response = client.post("/api/v1/ask_ai?stream=true", json=request.model_dump())
+    assert response.status_code == 200
+    assert response.text == "Mocked streaming response"
+    assert mock_llm_processor.process_text.call_args.kwargs["model"] == "o1-mini"
+
+@pytest.mark.asyncio
+async def test_ask_ai_concurrent_calls_respect_model_limit():
+    import asyncio
+    import httpx
+    from llm_processor import ModelConcurrencyLimiter
+
+    limiter = ModelConcurrencyLimiter(limits={"o1-mini": 10})
+    peak = 0
+
+    async def slow_answer(text, prompt, model=None, answered_by=None):
+        nonlocal peak
+        peak = max(peak, limiter.stats()["o1-mini"]["in_flight"])
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    with patch('realtime_server.llm_processor') as mock, \
+         patch('realtime_server.llm_limiter', limiter), \
+         patch('realtime_server.log_content'):
+        mock.process_text_async = AsyncMock(side_effect=slow_answer)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            responses = await asyncio.gather(*[
+                http.post("/api/v1/ask_ai", json={"text": f"question {i}"}) for i in range(100)
+            ])
+
+    assert all(r.status_code == 200 for r in responses)
+    assert peak == 10
+    assert limiter.stats()["o1-mini"] == {"limit": 10, "in_flight": 0, "waiting": 0}
 
 @pytest.mark.asyncio
 async def test_websocket_endpoint():
@@ -64,3 +176,562 @@ def test_get_realtime_page():
     response = client.get("/")
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]
+
+def test_websocket_audio_format_handshake():
+    with client.websocket_connect("/api/v1/ws") as websocket:
+        assert websocket.receive_json()["status"] == "idle"
+
+        websocket.send_json({"type": "audio_format", "sample_rate": 24000, "channels": 1, "sample_format": "pcm16"})
+        assert websocket.receive_json() == {"type": "audio_format", "status": "accepted", "mode": "passthrough"}
+
+        websocket.send_json({"type": "audio_format", "sample_rate": 44100, "sample_format": "mp3"})
+        assert websocket.receive_json()["type"] == "error"
+
+def test_websocket_opus_negotiation():
+    with client.websocket_connect("/api/v1/ws") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "audio_format", "sample_rate": 48000, "channels": 1, "sample_format": "opus"})
+        assert websocket.receive_json() == {"type": "audio_format", "status": "accepted", "mode": "opus"}
+
+        with patch('realtime_server.opus_available', return_value=False):
+            websocket.send_json({"type": "audio_format", "sample_rate": 48000, "channels": 1, "sample_format": "opus"})
+            response = websocket.receive_json()
+        assert response["type"] == "audio_format"
+        assert response["status"] == "rejected"
+
+def test_websocket_flushes_audio_sent_during_connect():
+    import asyncio
+    import time
+
+    realtime_client = MagicMock()
+    realtime_client.send_audio = AsyncMock()
+
+    async def slow_acquire():
+        await asyncio.sleep(0.2)
+        return realtime_client
+
+    with patch('realtime_server.session_pool.acquire', side_effect=slow_acquire), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.VAD_ENABLED', False):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "audio_format", "sample_rate": 24000, "channels": 1, "sample_format": "pcm16"})
+            websocket.receive_json()
+
+            websocket.send_json({"type": "start_recording"})
+            chunks = [bytes([i]) * 480 for i in range(3)]
+            for chunk in chunks:
+                websocket.send_bytes(chunk)
+
+            deadline = time.time() + 5
+            while realtime_client.send_audio.await_count < 3 and time.time() < deadline:
+                time.sleep(0.05)
+
+    assert [call.args[0] for call in realtime_client.send_audio.await_args_list] == chunks
+
+def make_fake_realtime_client(response_text, response_delay):
+    import asyncio
+
+    realtime_client = MagicMock()
+    handlers = {}
+    realtime_client.register_handler.side_effect = lambda event, handler: handlers.__setitem__(event, handler)
+    realtime_client.send_audio = AsyncMock()
+    realtime_client.commit_audio = AsyncMock()
+    realtime_client.dispatch_stats.return_value = {}
+
+    async def respond():
+        await asyncio.sleep(response_delay)
+        await handlers["response.created"]({"type": "response.created"})
+        await handlers["response.text.delta"]({"type": "response.text.delta", "delta": response_text})
+        await handlers["response.done"]({"type": "response.done"})
+
+    async def start_response(instructions):
+        asyncio.get_running_loop().create_task(respond())
+
+    realtime_client.start_response = AsyncMock(side_effect=start_response)
+    return realtime_client
+
+def test_websocket_stop_does_not_block_next_recording():
+    first = make_fake_realtime_client("first", response_delay=0.5)
+    second = make_fake_realtime_client("second", response_delay=0.0)
+    release = AsyncMock()
+
+    with patch('realtime_server.session_pool.acquire', AsyncMock(side_effect=[first, second])), \
+         patch('realtime_server.session_pool.release', release), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            assert websocket.receive_json()["status"] == "idle"
+
+            websocket.send_json({"type": "start_recording"})
+            assert websocket.receive_json() == {"type": "status", "status": "connecting"}
+            assert websocket.receive_json() == {"type": "status", "status": "connected"}
+            websocket.send_json({"type": "stop_recording"})
+            assert websocket.receive_json() == {"type": "status", "status": "connected"}
+
+            # The first response is still pending, but the next recording starts right away
+            websocket.send_json({"type": "start_recording"})
+            assert websocket.receive_json() == {"type": "status", "status": "connecting"}
+            assert websocket.receive_json() == {"type": "status", "status": "connected"}
+            websocket.send_json({"type": "stop_recording"})
+            assert websocket.receive_json() == {"type": "status", "status": "connected"}
+
+            texts = []
+            while True:
+                message = websocket.receive_json()
+                if message == {"type": "status", "status": "idle"}:
+                    break
+                if message["type"] == "text" and message["content"]:
+                    texts.append(message["content"])
+
+    # Responses arrive in recording order even though the second one was faster
+    assert texts == ["first", "second"]
+    assert release.await_count == 2
+
+def test_silent_recording_is_not_uploaded_or_transcribed():
+    realtime_client = make_fake_realtime_client("should not happen", response_delay=0.0)
+
+    with patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.VAD_ENABLED', True), \
+         patch('realtime_server.log_content') as log:
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "audio_format", "sample_rate": 24000, "channels": 1, "sample_format": "pcm16"})
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording"})
+            assert websocket.receive_json() == {"type": "status", "status": "connecting"}
+            assert websocket.receive_json() == {"type": "status", "status": "connected"}
+            for _ in range(10):
+                websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "stop_recording"})
+            messages = []
+            while not messages or messages[-1] != {"type": "status", "status": "idle"}:
+                messages.append(websocket.receive_json())
+
+    # The browser is told why there is no transcript
+    assert {"type": "no_speech", "content": "No speech detected"} in messages
+    realtime_client.send_audio.assert_not_awaited()
+    realtime_client.commit_audio.assert_not_awaited()
+    log.assert_not_called()
+
+def test_speculative_readability_serves_the_http_request():
+    realtime_client = make_fake_realtime_client("Speculated transcript", response_delay=0.0)
+
+    async def stream(text, prompt, model=None, answered_by=None):
+        yield "Enhanced "
+        yield text
+
+    with patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.SPECULATIVE_POSTPROCESS', ["readability"]), \
+         patch('realtime_server.llm_processor') as mock_llm, \
+         patch('realtime_server.log_content'):
+        mock_llm.process_text = MagicMock(side_effect=stream)
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+            # The speculative run started on response.done; the button press reuses it
+            response = client.post("/api/v1/readability", json={"text": "Speculated transcript"})
+
+    assert response.text == "Enhanced Speculated transcript"
+    assert mock_llm.process_text.call_count == 1
+
+def test_speculative_readability_of_a_long_transcript_is_chunked_like_the_endpoint():
+    paragraphs = [f"paragraph {i} " + "x" * 40 for i in range(5)]
+    transcript = "\n\n".join(paragraphs)
+    realtime_client = make_fake_realtime_client(transcript, response_delay=0.0)
+
+    async def echo_chunk(text, prompt, model=None, answered_by=None):
+        yield text.split("TEXT TO PROCESS:\n", 1)[-1].upper()
+
+    with patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.SPECULATIVE_POSTPROCESS', ["readability"]), \
+         patch('realtime_server.READABILITY_CHUNK_THRESHOLD', 100), \
+         patch('realtime_server.READABILITY_CHUNK_CHARS', 60), \
+         patch('realtime_server.llm_processor') as mock_llm, \
+         patch('realtime_server.log_content'):
+        mock_llm.process_text = MagicMock(side_effect=echo_chunk)
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+            response = client.post("/api/v1/readability", json={"text": transcript})
+
+    assert response.text == "\n\n".join(p.upper() for p in paragraphs)
+    # One call per chunk, shared by both; no extra call on the whole transcript
+    assert mock_llm.process_text.call_count == 5
+    from prompts import PROMPTS
+    assert all(call.args[1] == PROMPTS["readability-enhance-chunk"] for call in mock_llm.process_text.call_args_list)
+
+def test_long_readability_is_chunked_and_streamed_in_order(mock_llm_processor):
+    async def echo_chunk(text, prompt, model=None, answered_by=None):
+        yield text.split("TEXT TO PROCESS:\n", 1)[1].upper()
+
+    mock_llm_processor.process_text = MagicMock(side_effect=echo_chunk)
+    paragraphs = [f"paragraph {i} " + "x" * 40 for i in range(5)]
+    with patch('realtime_server.READABILITY_CHUNK_THRESHOLD', 100), \
+         patch('realtime_server.READABILITY_CHUNK_CHARS', 60):
+        response = client.post("/api/v1/readability", json={"text": "\n\n".join(paragraphs)})
+
+    assert response.text == "\n\n".join(p.upper() for p in paragraphs)
+    assert mock_llm_processor.process_text.call_count == 5
+    # Every chunk after the first carries the previous one's tail as context
+    later_inputs = [call.args[0] for call in mock_llm_processor.process_text.call_args_list[1:]]
+    assert all(text.startswith("PRECEDING CONTEXT:") for text in later_inputs)
+
+def test_live_transcription_commits_segments_while_recording():
+    import asyncio
+    import numpy as np
+
+    realtime_client = MagicMock()
+    handlers = {}
+    realtime_client.register_handler.side_effect = lambda event, handler: handlers.__setitem__(event, handler)
+    realtime_client.send_audio = AsyncMock()
+    realtime_client.commit_audio = AsyncMock()
+    realtime_client.dispatch_stats.return_value = {}
+    segment_texts = iter(["Hello.", "World."])
+
+    async def respond(text):
+        await handlers["response.created"]({"type": "response.created"})
+        await handlers["response.text.delta"]({"type": "response.text.delta", "delta": text})
+        await handlers["response.done"]({"type": "response.done"})
+
+    async def start_response(instructions):
+        assert "[LIVE DICTATION]" in instructions
+        asyncio.get_running_loop().create_task(respond(next(segment_texts)))
+
+    realtime_client.start_response = AsyncMock(side_effect=start_response)
+
+    t = np.arange(2400) / 24000
+    speech = (np.sin(2 * np.pi * 220 * t) * 5000).astype(np.int16).tobytes()
+    quiet = bytes(4800)
+
+    with patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.LIVE_SEGMENT_MIN_SECONDS', 0.1), \
+         patch('realtime_server.LIVE_SEGMENT_SILENCE_MS', 100), \
+         patch('realtime_server.log_content') as log:
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "audio_format", "sample_rate": 24000, "channels": 1, "sample_format": "pcm16"})
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording", "live": True})
+            assert websocket.receive_json() == {"type": "status", "status": "connecting"}
+            assert websocket.receive_json() == {"type": "status", "status": "connected"}
+            websocket.send_bytes(speech)
+            websocket.send_bytes(quiet)
+
+            # The first segment is transcribed while still recording
+            messages = []
+            while "Hello." not in "".join(m.get("content", "") for m in messages if m["type"] == "text"):
+                messages.append(websocket.receive_json())
+
+            websocket.send_bytes(speech)
+            websocket.send_json({"type": "stop_recording"})
+            while True:
+                message = websocket.receive_json()
+                messages.append(message)
+                if message == {"type": "status", "status": "idle"}:
+                    break
+
+    text_messages = [m for m in messages if m["type"] == "text"]
+    assert sum(m["isNewResponse"] for m in text_messages) == 1
+    assert "".join(m["content"] for m in text_messages) == "Hello. World."
+    assert realtime_client.commit_audio.await_count == 2
+    log.assert_called_once()
+    assert log.call_args.args[:2] == ("Transcript", "Hello. World.")
+
+def test_live_segment_counts_audio_sent_during_connect():
+    import asyncio
+    import time
+    import numpy as np
+
+    realtime_client = make_fake_realtime_client("Hello.", response_delay=0.0)
+
+    async def slow_acquire():
+        await asyncio.sleep(0.3)
+        return realtime_client
+
+    t = np.arange(2400) / 24000
+    speech = (np.sin(2 * np.pi * 220 * t) * 5000).astype(np.int16).tobytes()
+
+    with patch('realtime_server.session_pool.acquire', side_effect=slow_acquire), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.VAD_ENABLED', False), \
+         patch('realtime_server.LIVE_SEGMENT_MIN_SECONDS', 0.1), \
+         patch('realtime_server.LIVE_SEGMENT_SILENCE_MS', 100), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "audio_format", "sample_rate": 24000, "channels": 1, "sample_format": "pcm16"})
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording", "live": True})
+            # A whole first segment, speech then a pause, is spoken while the session connects
+            websocket.send_bytes(speech)
+            websocket.send_bytes(bytes(4800))
+            while websocket.receive_json() != {"type": "status", "status": "connected"}:
+                pass
+            websocket.send_bytes(bytes(480))
+
+            deadline = time.time() + 5
+            while realtime_client.commit_audio.await_count < 1 and time.time() < deadline:
+                time.sleep(0.05)
+            # Committed while still recording, at the pause spoken during setup
+            assert realtime_client.commit_audio.await_count == 1
+
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+
+def test_metrics_endpoint_reports_pipeline_latencies():
+    realtime_client = make_fake_realtime_client("Measured transcript", response_delay=0.0)
+
+    with patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = dict(
+        line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#")
+    )
+    assert int(samples["brainwave_stop_to_first_delta_seconds_count"]) >= 1
+    assert int(samples["brainwave_stop_to_done_seconds_count"]) >= 1
+    assert int(samples["brainwave_audio_chunk_cpu_seconds_count"]) >= 1
+    assert float(samples['brainwave_browser_bytes_total{direction="received"}']) >= 4800
+    assert samples["brainwave_active_sessions"] == "0"
+    assert 'brainwave_queue_depth{queue="journal"}' in samples
+
+class CollectingExporter:
+    def __init__(self):
+        self.spans = []
+
+    async def export(self, document):
+        for resource in document["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                self.spans.extend(scope["spans"])
+
+    async def close(self):
+        pass
+
+def test_websocket_session_is_traced_and_trace_id_is_echoed():
+    import asyncio
+    import time
+    import realtime_server
+
+    realtime_client = make_fake_realtime_client("Traced transcript", response_delay=0.0)
+    now = time.time_ns()
+    realtime_client.connect_times = {
+        "started": now - 3_000_000_000,
+        "session_created": now - 2_900_000_000,
+        "session_update_sent": now - 2_899_000_000,
+        "session_updated": now - 2_850_000_000,
+    }
+    exporter = CollectingExporter()
+
+    with patch.object(realtime_server.tracer, 'exporter', exporter), \
+         patch('realtime_server.VAD_ENABLED', False), \
+         patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            trace_id = websocket.receive_json()["trace_id"]
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+        asyncio.run(realtime_server.tracer.flush())
+
+    spans = {span["name"]: span for span in exporter.spans}
+    assert {span["traceId"] for span in exporter.spans} == {trace_id}
+    session = spans["WEBSOCKET /api/v1/ws"]
+    assert "parentSpanId" not in session
+    recording = spans["recording"]
+    assert recording["parentSpanId"] == session["spanId"]
+    for name in ("realtime.acquire", "realtime.connect", "realtime.session.update", "realtime.commit", "realtime.response"):
+        assert spans[name]["parentSpanId"] == recording["spanId"]
+    for name in ("response.created", "first_delta"):
+        assert spans[name]["parentSpanId"] == spans["realtime.response"]["spanId"]
+    assert {"key": "preconnected", "value": {"boolValue": True}} in spans["realtime.connect"]["attributes"]
+
+def test_http_request_continues_the_callers_trace(mock_llm_processor):
+    import asyncio
+    import realtime_server
+
+    exporter = CollectingExporter()
+    traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    with patch.object(realtime_server.tracer, 'exporter', exporter):
+        response = client.post("/api/v1/readability", json={"text": "Trace me"}, headers={"traceparent": traceparent})
+        asyncio.run(realtime_server.tracer.flush())
+
+    assert response.headers["x-trace-id"] == "0af7651916cd43dd8448eb211c80319c"
+    spans = {span["name"]: span for span in exporter.spans}
+    request = spans["POST /api/v1/readability"]
+    assert request["parentSpanId"] == "b7ad6b7169203331"
+    llm = spans["llm.readability"]
+    assert llm["parentSpanId"] == request["spanId"]
+    assert [event["name"] for event in llm["events"]] == ["admitted", "first_token"]
+
+def test_recordings_beyond_the_pending_budget_are_refused():
+    slow = [make_fake_realtime_client(f"slow {i}", response_delay=0.5) for i in range(2)]
+
+    with patch('realtime_server.MAX_PENDING_RECORDINGS', 1), \
+         patch('realtime_server.VAD_ENABLED', False), \
+         patch('realtime_server.session_pool.acquire', AsyncMock(side_effect=slow)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "stop_recording"})
+            # The first recording is still waiting for its transcript
+            websocket.send_json({"type": "start_recording"})
+            messages = []
+            while not messages or messages[-1]["type"] != "error":
+                messages.append(websocket.receive_json())
+
+    assert "earlier recordings" in messages[-1]["content"]
+    slow[1].start_response.assert_not_awaited()
+
+def test_oversized_messages_are_dropped():
+    realtime_client = make_fake_realtime_client("ok", response_delay=0.0)
+
+    with patch('realtime_server.MAX_WS_MESSAGE_BYTES', 10000), \
+         patch('realtime_server.VAD_ENABLED', False), \
+         patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_bytes(bytes(20000))
+            websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+
+    # Only the second chunk, resampled from 48kHz to 24kHz
+    sent = sum(len(call.args[0]) for call in realtime_client.send_audio.await_args_list)
+    assert sent == 2400
+
+def test_oversized_text_messages_are_measured_in_bytes():
+    realtime_client = make_fake_realtime_client("ok", response_delay=0.0)
+
+    with patch('realtime_server.MAX_WS_MESSAGE_BYTES', 10000), \
+         patch('realtime_server.VAD_ENABLED', False), \
+         patch('realtime_server.session_pool.acquire', AsyncMock(return_value=realtime_client)), \
+         patch('realtime_server.session_pool.release', AsyncMock()), \
+         patch('realtime_server.log_content'):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            # 4000 characters, but 12000 bytes once UTF-8 encoded
+            websocket.send_text('{"type": "start_recording", "note": "' + "语" * 4000 + '"}')
+            # Not recording, so this chunk goes nowhere
+            websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "start_recording"})
+            websocket.send_bytes(bytes(4800))
+            websocket.send_json({"type": "stop_recording"})
+            while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                pass
+
+    # Only the chunk after the second start_recording, resampled from 48kHz to 24kHz
+    sent = sum(len(call.args[0]) for call in realtime_client.send_audio.await_args_list)
+    assert sent == 2400
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="reads RSS from /proc")
+def test_connect_disconnect_cycles_leave_nothing_behind():
+    import asyncio
+    import gc
+    import realtime_server
+
+    def rss_mib():
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+    def cycle(i):
+        with client.websocket_connect("/api/v1/ws") as websocket:
+            websocket.receive_json()
+            if i % 10 == 0:
+                # A whole dictation
+                websocket.send_json({"type": "start_recording"})
+                websocket.send_bytes(bytes(4800))
+                websocket.send_json({"type": "stop_recording"})
+                while websocket.receive_json() != {"type": "status", "status": "idle"}:
+                    pass
+            elif i % 10 == 5:
+                # Gone in the middle of a recording
+                websocket.send_json({"type": "start_recording"})
+                websocket.send_bytes(bytes(4800))
+
+    class FakeSession:
+        # A plain object: mocks create classes per instance and keep their calls, which
+        # would show up in RSS themselves
+        model = "fake"
+
+        def __init__(self):
+            self.handlers = {}
+            self.connect_times = {}
+            self.trace_parent = None
+
+        def register_handler(self, event, handler):
+            self.handlers[event] = handler
+
+        def dispatch_stats(self):
+            return {}
+
+        async def send_audio(self, chunk):
+            pass
+
+        async def commit_audio(self):
+            pass
+
+        async def start_response(self, instructions):
+            asyncio.get_running_loop().create_task(self.respond())
+
+        async def respond(self):
+            await self.handlers["response.created"]({"type": "response.created"})
+            await self.handlers["response.text.delta"]({"type": "response.text.delta", "delta": "Soak transcript"})
+            await self.handlers["response.done"]({"type": "response.done"})
+
+    handed_out = []
+    async def acquire():
+        handed_out.append(1)
+        return FakeSession()
+    async def release(realtime_client):
+        handed_out.pop()
+
+    with patch('realtime_server.VAD_ENABLED', False), \
+         patch('realtime_server.session_pool.acquire', acquire), \
+         patch('realtime_server.session_pool.release', release), \
+         patch('realtime_server.log_content'):
+        for i in range(200):
+            cycle(i)
+        gc.collect()
+        before = rss_mib()
+        for i in range(2000):
+            cycle(i)
+        gc.collect()
+        after = rss_mib()
+
+    assert after - before < 4, f"RSS grew from {before:.1f} to {after:.1f} MiB"
+    assert realtime_server.ACTIVE_SESSIONS.samples()[0][2] == 0
+    assert not realtime_server.active_realtime_clients
+    # Every realtime session handed out was given back
+    assert not handed_out
+    assert not [o for o in gc.get_objects() if isinstance(o, realtime_server.Recording)]
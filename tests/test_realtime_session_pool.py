@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from realtime_session_pool import RealtimeSessionPool
+
+def make_client(healthy=True):
+    client = MagicMock()
+    client.connect = AsyncMock()
+    client.close = AsyncMock()
+    client.is_healthy.return_value = healthy
+    return client
+
+@pytest.fixture
+def factory():
+    return MagicMock(side_effect=lambda: make_client())
+
+@pytest.mark.asyncio
+async def test_acquire_without_start_connects_on_demand(factory):
+    pool = RealtimeSessionPool(factory, size=2)
+    client = await pool.acquire()
+
+    client.connect.assert_awaited_once()
+    assert pool.metrics()["misses"] == 1
+    assert pool.metrics()["hits"] == 0
+
+@pytest.mark.asyncio
+async def test_start_prewarms_and_acquire_hits(factory):
+    pool = RealtimeSessionPool(factory, size=2, health_check_interval=60)
+    await pool.start()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert pool.metrics()["idle"] == 2
+
+    client = await pool.acquire()
+    client.connect.assert_awaited_once()
+    metrics = pool.metrics()
+    assert metrics["hits"] == 1
+    assert metrics["hit_rate"] == 1.0
+
+    # The pool tops itself back up after handing a session out
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert pool.metrics()["idle"] == 2
+
+    await pool.stop()
+    assert pool.metrics()["idle"] == 0
+
+@pytest.mark.asyncio
+async def test_unhealthy_sessions_are_evicted(factory):
+    pool = RealtimeSessionPool(factory, size=1)
+    stale = make_client(healthy=False)
+    pool._idle.append(stale)
+
+    client = await pool.acquire()
+    await asyncio.sleep(0)
+
+    assert client is not stale
+    stale.close.assert_awaited_once()
+    assert pool.metrics()["evictions"] == 1
+    assert pool.metrics()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_release_closes_session(factory):
+    pool = RealtimeSessionPool(factory, size=0)
+    client = await pool.acquire()
+    await pool.release(client)
+    client.close.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_connect_cancelled_during_acquire_closes_the_socket():
+    client = make_client()
+    handshake = asyncio.Event()
+    client.connect = AsyncMock(side_effect=handshake.wait)
+    pool = RealtimeSessionPool(MagicMock(return_value=client), size=0)
+
+    acquire = asyncio.create_task(pool.acquire())
+    await asyncio.sleep(0)
+    acquire.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await acquire
+
+    client.close.assert_awaited_once()
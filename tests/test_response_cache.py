@@ -0,0 +1,108 @@
+import pytest
+from unittest.mock import patch
+from response_cache import ResponseCache, cache_key, replay
+
+def test_cache_key_normalizes_text():
+    assert cache_key("readability-enhance", "gpt-4o", "hello   world\n") == \
+        cache_key("readability-enhance", "GPT-4o", " hello world")
+    assert cache_key("readability-enhance", "gpt-4o", "hello") != cache_key("correctness-check", "gpt-4o", "hello")
+    assert cache_key("readability-enhance", "gpt-4o", "one \ntwo\r\n\nthree") == \
+        cache_key("readability-enhance", "gpt-4o", "one\ntwo\n\n\tthree")
+
+def test_cache_key_keeps_paragraph_breaks():
+    one_paragraph = cache_key("readability-enhance", "gpt-4o", "first line\nsecond line")
+    two_paragraphs = cache_key("readability-enhance", "gpt-4o", "first line\n\nsecond line")
+    flat = cache_key("readability-enhance", "gpt-4o", "first line second line")
+    assert len({one_paragraph, two_paragraphs, flat}) == 3
+    assert cache_key("ask-ai", "gpt-4o", "hello", "prompt v1") != cache_key("ask-ai", "gpt-4o", "hello", "prompt v2")
+
+@pytest.mark.asyncio
+async def test_hit_and_miss_counters():
+    cache = ResponseCache()
+    assert await cache.get("a") is None
+    await cache.put("a", "answer")
+    assert await cache.get("a") == "answer"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes"] == len("answer")
+
+@pytest.mark.asyncio
+async def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    await cache.put("a", "1234")
+    await cache.put("b", "1234")
+    await cache.get("a")  # a becomes most recent
+    await cache.put("c", "1234")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "1234"
+
+    await cache.put("d", "123456789")
+    assert cache.stats()["bytes"] <= 10
+    assert cache.stats()["evictions"] == 3
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=10)
+    with patch("response_cache.time.time", return_value=1000.0):
+        await cache.put("a", "answer")
+    with patch("response_cache.time.time", return_value=1011.0):
+        assert await cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(db_path=db_path)
+    await cache.put("a", "persisted")
+    cache.close()
+
+    restarted = ResponseCache(db_path=db_path)
+    assert await restarted.get("a") == "persisted"
+    assert restarted.stats()["disk_hits"] == 1
+    # Promoted into memory
+    assert restarted.stats()["entries"] == 1
+    restarted.close()
+
+@pytest.mark.asyncio
+async def test_replay_streams_in_chunks():
+    parts = [part async for part in replay("abcdefgh", chunk_chars=3)]
+    assert parts == ["abc", "def", "gh"]
+
+@pytest.mark.asyncio
+async def test_shared_tier_serves_other_workers():
+    from shared_state import RedisState
+    from state_server import StateServer
+
+    server = await StateServer().serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    first = ResponseCache(shared=RedisState(port=port))
+    second = ResponseCache(shared=RedisState(port=port))
+    key = cache_key("readability-enhance", "gpt-4o", "hello")
+
+    await first.put(key, "Hello.")
+    assert await second.get(key) == "Hello."
+    assert second.stats()["shared_hits"] == 1
+    # Promoted into the second worker's memory tier
+    assert await second.get(key) == "Hello."
+    assert second.stats()["shared_hits"] == 1
+
+    await first.shared.close()
+    await second.shared.close()
+    server.close()
+    await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_shared_hits_keep_their_remaining_ttl():
+    from shared_state import InProcessState
+
+    shared = InProcessState()
+    first = ResponseCache(ttl=10, shared=shared)
+    second = ResponseCache(ttl=10, shared=shared)
+    with patch("response_cache.time.time", return_value=1000.0):
+        await first.put("a", "answer")
+    with patch("response_cache.time.time", return_value=1008.0):
+        assert await second.get("a") == "answer"
+    # Promoted with the publisher's expiry, not a fresh ttl from the time of the hit
+    with patch("response_cache.time.time", return_value=1011.0):
+        assert await second.get("a") is None
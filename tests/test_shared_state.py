@@ -0,0 +1,92 @@
+import pytest
+import asyncio
+import pytest_asyncio
+from shared_state import InProcessState, RedisState, SharedStateError, shared_state_from_url
+from state_server import StateServer
+
+@pytest_asyncio.fixture
+async def redis_state():
+    server = await StateServer().serve("127.0.0.1", 0)
+    state = RedisState(port=server.sockets[0].getsockname()[1])
+    yield state
+    await state.close()
+    server.close()
+    await server.wait_closed()
+
+async def check_operations(state):
+    assert await state.get("missing") is None
+    await state.set("key", "value")
+    assert await state.get("key") == "value"
+    await state.delete("key")
+    assert await state.get("key") is None
+
+    assert await state.incr("counter") == 1
+    assert await state.incr("counter", 5) == 6
+    assert await state.incr("counter", -6) == 0
+
+    await state.hset("hash", "a", "1")
+    await state.hset("hash", "b", "2")
+    assert await state.hgetall("hash") == {"a": "1", "b": "2"}
+    await state.hdel("hash", "a")
+    assert await state.hgetall("hash") == {"b": "2"}
+    assert await state.hgetall("missing") == {}
+
+    await state.set("short", "lived", ttl=0.05)
+    await state.incr("lease", 1, ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await state.get("short") is None
+    assert await state.get("lease") is None
+
+@pytest.mark.asyncio
+async def test_in_process_state():
+    state = InProcessState()
+    assert not state.shared
+    await check_operations(state)
+
+@pytest.mark.asyncio
+async def test_redis_state_against_stand_in(redis_state):
+    assert redis_state.shared
+    await check_operations(redis_state)
+
+@pytest.mark.asyncio
+async def test_wrong_type_is_an_error_reply(redis_state):
+    await redis_state.hset("hash", "a", "1")
+    with pytest.raises(SharedStateError, match="WRONGTYPE"):
+        await redis_state.get("hash")
+    # The connection is still usable afterwards
+    await redis_state.set("key", "value")
+    assert await redis_state.get("key") == "value"
+
+@pytest.mark.asyncio
+async def test_cancelled_command_does_not_desync_connection(redis_state):
+    await redis_state.set("a", "1")
+    await redis_state.set("b", "2")
+    task = asyncio.create_task(redis_state.get("a"))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert await redis_state.get("b") == "2"
+
+@pytest.mark.asyncio
+async def test_reconnects_after_server_restart():
+    server = await StateServer().serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    state = RedisState(port=port)
+    await state.set("key", "value")
+    server.close()
+    await server.wait_closed()
+    await state.close()
+
+    server = await StateServer().serve("127.0.0.1", port)
+    assert await state.get("key") is None
+    await state.close()
+    server.close()
+    await server.wait_closed()
+
+def test_shared_state_from_url():
+    assert isinstance(shared_state_from_url(""), InProcessState)
+    state = shared_state_from_url("redis://:secret@cache.local:6390/2")
+    assert (state.host, state.port, state.db, state.password) == ("cache.local", 6390, 2, "secret")
+    with pytest.raises(ValueError):
+        shared_state_from_url("memcached://localhost")
@@ -0,0 +1,75 @@
+import pytest
+import asyncio
+from response_cache import ResponseCache, cache_key
+from speculative import SpeculativeRunner
+
+def make_run(release=None, calls=None, cache=None):
+    # Like the server's stream_llm: the answer is cached once the stream completes
+    async def run(prompt_key, text):
+        if calls is not None:
+            calls.append((prompt_key, text))
+        if release is not None:
+            await release.wait()
+        parts = [f"{prompt_key}:", text]
+        for part in parts:
+            yield part
+        if cache is not None:
+            await cache.put(cache_key(prompt_key, "gpt-4o", text), "".join(parts))
+    return run
+
+async def cached(cache, prompt_key, text):
+    return await cache.get(cache_key(prompt_key, "gpt-4o", text))
+
+@pytest.mark.asyncio
+async def test_schedule_runs_every_prompt_into_the_cache():
+    cache = ResponseCache()
+    runner = SpeculativeRunner(make_run(cache=cache), ["readability-enhance", "correctness-check"])
+    assert runner.schedule("hello") == ["readability-enhance", "correctness-check"]
+    await asyncio.sleep(0.01)
+    assert await cached(cache, "readability-enhance", "hello") == "readability-enhance:hello"
+    assert await cached(cache, "correctness-check", "hello") == "correctness-check:hello"
+    assert runner.stats()["runs_completed"] == 2
+
+@pytest.mark.asyncio
+async def test_cancel_on_edit_stops_running_work():
+    release = asyncio.Event()
+    cache = ResponseCache()
+    runner = SpeculativeRunner(make_run(release, cache=cache), ["readability-enhance"])
+    runner.schedule("hello")
+    await asyncio.sleep(0.01)
+    runner.cancel()
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.sleep(0.01)
+    assert await cached(cache, "readability-enhance", "hello") is None
+    assert runner.stats()["runs_cancelled"] == 1
+
+@pytest.mark.asyncio
+async def test_new_transcript_supersedes_previous_one():
+    release = asyncio.Event()
+    cache = ResponseCache()
+    runner = SpeculativeRunner(make_run(release, cache=cache), ["readability-enhance"])
+    runner.schedule("first")
+    await asyncio.sleep(0.01)
+    runner.schedule("second")
+    release.set()
+    await asyncio.sleep(0.01)
+    assert await cached(cache, "readability-enhance", "first") is None
+    assert await cached(cache, "readability-enhance", "second") == "readability-enhance:second"
+    assert runner.stats()["runs_cancelled"] == 1
+
+@pytest.mark.asyncio
+async def test_cost_cap_limits_runs_and_characters():
+    calls = []
+    runner = SpeculativeRunner(make_run(calls=calls), ["readability-enhance"], max_runs=2, max_chars=8)
+    for text in ("abcd", "efgh", "ijkl"):
+        runner.schedule(text)
+        await asyncio.sleep(0.01)
+    assert [text for _, text in calls] == ["abcd", "efgh"]
+    assert runner.stats()["runs_over_cap"] == 1
+    assert runner.stats()["chars_spent"] == 8
+
+def test_disabled_without_prompts():
+    runner = SpeculativeRunner(make_run(), [])
+    assert not runner.enabled
+    assert runner.schedule("hello") == []
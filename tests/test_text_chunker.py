@@ -0,0 +1,71 @@
+import pytest
+import asyncio
+from text_chunker import split_text, overlap_context, stream_in_order
+
+def rejoin(chunks):
+    return "".join(sep + chunk for sep, chunk in chunks)
+
+def test_short_text_is_one_chunk():
+    assert split_text("Hello world.", 100) == [("", "Hello world.")]
+
+def test_splits_at_paragraphs_first():
+    text = "First paragraph here.\n\nSecond paragraph here.\n\nThird one."
+    chunks = split_text(text, 30)
+    assert [chunk for _, chunk in chunks] == ["First paragraph here.", "Second paragraph here.", "Third one."]
+    assert rejoin(chunks) == text
+
+def test_long_paragraph_splits_at_sentences():
+    text = "One sentence here. Another sentence here. A third sentence."
+    chunks = split_text(text, 45)
+    assert all(len(chunk) <= 45 for _, chunk in chunks)
+    assert chunks[0][1] == "One sentence here. Another sentence here."
+    assert rejoin(chunks) == text
+
+def test_cjk_sentences_rejoin_without_spaces():
+    text = "今天天气很好。我们去公园散步吧！你觉得怎么样？"
+    chunks = split_text(text, 10)
+    assert all(len(chunk) <= 10 for _, chunk in chunks)
+    assert rejoin(chunks) == text
+
+def test_oversized_sentence_is_hard_split():
+    text = "word " * 50
+    chunks = split_text(text, 30)
+    assert all(len(chunk) <= 30 for _, chunk in chunks)
+    assert rejoin(chunks) == text.strip()
+
+def test_overlap_context_starts_at_sentence_boundary():
+    previous = "The first sentence is long. The second one ends here."
+    assert overlap_context(previous, 30) == "The second one ends here."
+    assert overlap_context(previous, 0) == ""
+    assert overlap_context("Short.", 30) == "Short."
+
+@pytest.mark.asyncio
+async def test_stream_in_order_respects_order_and_concurrency():
+    running = 0
+    peak = 0
+
+    async def process(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Later items finish first
+        await asyncio.sleep(0.05 / (int(item) + 1))
+        running -= 1
+        yield f"<{item}"
+        yield ">"
+
+    parts = [part async for part in stream_in_order(["0", "1", "2", "3"], process, concurrency=2,
+                                                     separators=["", " ", " ", " "])]
+    assert "".join(parts) == "<0> <1> <2> <3>"
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_stream_in_order_propagates_errors():
+    async def process(item):
+        if item == "bad":
+            raise RuntimeError("chunk failed")
+        yield item
+
+    with pytest.raises(RuntimeError, match="chunk failed"):
+        async for _ in stream_in_order(["ok", "bad"], process):
+            pass
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import pytest
+from tracing import FileExporter, OTLPHttpExporter, Tracer, exporter_from_url, span, use_span
+
+
+class CollectingExporter:
+    def __init__(self):
+        self.documents = []
+
+    async def export(self, document):
+        self.documents.append(document)
+
+    async def close(self):
+        pass
+
+
+def test_new_trace_and_children_share_the_trace_id():
+    tracer = Tracer()
+    root = tracer.start_span("session")
+    child = root.child("recording", live=True)
+
+    assert len(root.trace_id) == 32 and len(root.span_id) == 16
+    assert child.trace_id == root.trace_id
+    assert child.parent_id == root.span_id
+    assert root.traceparent == f"00-{root.trace_id}-{root.span_id}-01"
+
+
+def test_valid_traceparent_is_continued_and_invalid_one_ignored():
+    tracer = Tracer()
+    continued = tracer.start_span("request", traceparent="00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01")
+    assert continued.trace_id == "0af7651916cd43dd8448eb211c80319c"
+    assert continued.parent_id == "b7ad6b7169203331"
+
+    for header in ("garbage", "00-" + "0" * 32 + "-b7ad6b7169203331-01"):
+        fresh = tracer.start_span("request", traceparent=header)
+        assert fresh.parent_id is None
+        assert fresh.trace_id != "0" * 32
+
+
+def test_finished_spans_are_exported_as_otlp_json():
+    exporter = CollectingExporter()
+    tracer = Tracer(exporter, resource={"service.instance.id": "host:1"})
+    root = tracer.start_span("session")
+    root.record("realtime.connect", 1_000, 2_000, preconnected=True)
+    with root.child("realtime.commit", audio_bytes=4800) as commit:
+        commit.add_event("sent")
+    try:
+        with root.child("realtime.response"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    root.end()
+    asyncio.run(tracer.flush())
+
+    resource_spans = exporter.documents[0]["resourceSpans"][0]
+    assert {"key": "service.name", "value": {"stringValue": "brainwave"}} in resource_spans["resource"]["attributes"]
+    spans = {s["name"]: s for s in resource_spans["scopeSpans"][0]["spans"]}
+    assert list(spans) == ["realtime.connect", "realtime.commit", "realtime.response", "session"]
+    connect = spans["realtime.connect"]
+    assert (connect["startTimeUnixNano"], connect["endTimeUnixNano"]) == ("1000", "2000")
+    assert connect["attributes"] == [{"key": "preconnected", "value": {"boolValue": True}}]
+    assert spans["realtime.commit"]["attributes"] == [{"key": "audio_bytes", "value": {"intValue": "4800"}}]
+    assert spans["realtime.commit"]["events"][0]["name"] == "sent"
+    assert spans["realtime.response"]["status"] == {"code": 2, "message": "RuntimeError: boom"}
+    assert tracer.stats()["spans_exported"] == 4
+
+
+def test_spans_are_dropped_without_exporter_or_when_queue_is_full():
+    Tracer().start_span("ignored").end()
+
+    tracer = Tracer(CollectingExporter(), max_queue=2)
+    for _ in range(3):
+        tracer.start_span("span").end()
+    assert tracer.stats() == {"queued": 2, "spans_exported": 0, "spans_dropped": 1, "export_errors": 0}
+
+
+def test_span_helper_follows_the_current_span():
+    tracer = Tracer()
+    with span("outside") as nothing:
+        assert nothing is None
+
+    root = tracer.start_span("request")
+    with use_span(root):
+        with span("llm.readability", model="gpt-4o") as child:
+            assert child.parent_id == root.span_id
+    assert child.ended
+
+
+@pytest.mark.asyncio
+async def test_export_loop_flushes_in_background_and_on_stop():
+    exporter = CollectingExporter()
+    tracer = Tracer(exporter, interval=0.01)
+    await tracer.start()
+    tracer.start_span("first").end()
+    await asyncio.sleep(0.05)
+    assert len(exporter.documents) == 1
+
+    tracer.start_span("second").end()
+    await tracer.stop()
+    assert len(exporter.documents) == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_the_batch_being_exported():
+    release = asyncio.Event()
+
+    class SlowExporter(CollectingExporter):
+        async def export(self, document):
+            await release.wait()
+            await super().export(document)
+
+    exporter = SlowExporter()
+    tracer = Tracer(exporter, interval=0.01)
+    await tracer.start()
+    tracer.start_span("in flight").end()
+    await asyncio.sleep(0.05)
+    # The loop has taken the span off the queue and is waiting on the exporter
+    assert tracer.stats()["queued"] == 0
+    tracer.start_span("queued").end()
+
+    stopping = asyncio.create_task(tracer.stop())
+    await asyncio.sleep(0.01)
+    release.set()
+    await stopping
+    names = [s["name"] for d in exporter.documents for s in d["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    assert names == ["in flight", "queued"]
+
+
+def test_file_exporter_appends_one_batch_per_line(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracer = Tracer(exporter_from_url(f"file://{path}"))
+    tracer.start_span("one").end()
+    asyncio.run(tracer.flush())
+    tracer.start_span("two").end()
+    asyncio.run(tracer.flush())
+
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] for line in lines] == ["one", "two"]
+
+
+def test_exporter_from_url():
+    assert exporter_from_url("") is None
+    assert isinstance(exporter_from_url("traces.jsonl"), FileExporter)
+    collector = exporter_from_url("http://localhost:4318")
+    assert isinstance(collector, OTLPHttpExporter)
+    assert collector.endpoint == "http://localhost:4318/v1/traces"
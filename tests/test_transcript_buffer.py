@@ -0,0 +1,46 @@
+from transcript_buffer import TranscriptBuffer
+
+
+def test_appended_parts_read_as_one_text():
+    transcript = TranscriptBuffer()
+    for delta in ("Hel", "lo", "", " world"):
+        assert transcript.append(delta)
+
+    assert transcript.text == "Hello world"
+    assert str(transcript) == "Hello world"
+    assert len(transcript) == 11
+    # Reading again after another append sees it
+    transcript.append("!")
+    assert transcript.text == "Hello world!"
+
+
+def test_tail_spans_parts():
+    transcript = TranscriptBuffer()
+    for delta in ("你好", "，", "world"):
+        transcript.append(delta)
+
+    assert transcript.tail(1) == "d"
+    assert transcript.tail(6) == "，world"
+    assert transcript.tail(100) == "你好，world"
+    assert TranscriptBuffer().tail(1) == ""
+
+
+def test_text_over_the_budget_is_dropped():
+    transcript = TranscriptBuffer(max_chars=8)
+    assert transcript.append("12345")
+    assert not transcript.append("6789")
+    assert not transcript.append("more")
+
+    assert transcript.text == "12345678"
+    assert transcript.dropped_chars == 5
+
+
+def test_clear_empties_and_resets_the_budget():
+    transcript = TranscriptBuffer(max_chars=4)
+    transcript.append("12345")
+    transcript.clear()
+
+    assert not transcript
+    assert transcript.text == ""
+    assert transcript.append("abcd")
+    assert transcript.dropped_chars == 0
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import re
+import textwrap
+from typing import AsyncGenerator, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# After Western sentence punctuation followed by whitespace, or after CJK sentence punctuation
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+|(?<=[。！？])\s*")
+_CJK_END = ("。", "！", "？")
+
+
+def _sentence_units(paragraph: str, max_chars: int) -> List[Tuple[str, str]]:
+    units = []
+    for sentence in filter(str.strip, _SENTENCE_BREAK.split(paragraph)):
+        sentence = sentence.strip()
+        sep = "" if not units or units[-1][1].endswith(_CJK_END) else " "
+        if len(sentence) <= max_chars:
+            units.append((sep, sentence))
+            continue
+        # A single sentence longer than a chunk: break it at spaces, or anywhere for unspaced text
+        inner_sep = " " if re.search(r"\s", sentence) else ""
+        pieces = textwrap.wrap(sentence, max_chars, break_long_words=True, break_on_hyphens=False)
+        units.append((sep, pieces[0]))
+        units.extend((inner_sep, piece) for piece in pieces[1:])
+    return units
+
+
+def split_text(text: str, max_chars: int = 2000) -> List[Tuple[str, str]]:
+    """
+    Split text into chunks of at most max_chars, preferring paragraph breaks, then
+    sentence ends. Returns (separator, chunk) pairs; joining them restores the layout.
+    """
+    units: List[Tuple[str, str]] = []
+    for paragraph in filter(str.strip, _PARAGRAPH_BREAK.split(text.strip())):
+        paragraph = paragraph.strip()
+        sep = "\n\n" if units else ""
+        if len(paragraph) <= max_chars:
+            units.append((sep, paragraph))
+        else:
+            sentences = _sentence_units(paragraph, max_chars)
+            units.append((sep, sentences[0][1]))
+            units.extend(sentences[1:])
+
+    chunks: List[Tuple[str, str]] = []
+    current, current_sep = "", ""
+    for sep, unit in units:
+        if current and len(current) + len(sep) + len(unit) > max_chars:
+            chunks.append((current_sep, current))
+            current, current_sep = unit, sep
+        elif current:
+            current += sep + unit
+        else:
+            current, current_sep = unit, sep
+    if current:
+        chunks.append((current_sep, current))
+    return chunks
+
+
+def overlap_context(previous_chunk: str, overlap_chars: int) -> str:
+    """Tail of the previous chunk, starting at a sentence boundary where possible"""
+    if overlap_chars <= 0 or not previous_chunk:
+        return ""
+    if len(previous_chunk) <= overlap_chars:
+        return previous_chunk
+    tail = previous_chunk[-overlap_chars:]
+    boundary = _SENTENCE_BREAK.search(tail)
+    if boundary and boundary.end() < len(tail):
+        tail = tail[boundary.end():]
+    return tail.strip()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+async def stream_in_order(
+    items: Sequence[str],
+    process: Callable[[str], AsyncIterator[str]],
+    concurrency: int = 4,
+    separators: Optional[Sequence[str]] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Run process() on every item with at most `concurrency` running at once, and stream
+    the outputs back in item order: the current item live, later ones as soon as it's done.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    queues: List[asyncio.Queue] = [asyncio.Queue() for _ in items]
+
+    async def worker(index: int, item: str):
+        try:
+            async with semaphore:
+                async for part in process(item):
+                    queues[index].put_nowait(part)
+            queues[index].put_nowait(_DONE)
+        except Exception as e:
+            queues[index].put_nowait(_Failure(e))
+
+    # Created in order, so the semaphore hands out slots to earlier items first
+    tasks = [asyncio.create_task(worker(index, item)) for index, item in enumerate(items)]
+    try:
+        for index, queue in enumerate(queues):
+            if index and separators:
+                yield separators[index]
+            while True:
+                part = await queue.get()
+                if part is _DONE:
+                    break
+                if isinstance(part, _Failure):
+                    raise part.error
+                yield part
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,337 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_ERROR = 2
+
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# The span that new spans in this task are children of
+_current_span: contextvars.ContextVar = contextvars.ContextVar("brainwave_current_span", default=None)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """A timed operation in a trace; times are nanoseconds since the epoch"""
+
+    __slots__ = (
+        "tracer", "trace_id", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "events", "error",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        start_ns: Optional[int] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def ended(self) -> bool:
+        return self.end_ns is not None
+
+    def child(self, name: str, kind: int = SPAN_KIND_INTERNAL, start_ns: Optional[int] = None, **attributes) -> "Span":
+        return Span(self.tracer, name, self.trace_id, self.span_id, kind, start_ns, attributes)
+
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes) -> "Span":
+        """Add a child span that has already finished, e.g. one timed before this trace existed"""
+        span = self.child(name, start_ns=start_ns, **attributes)
+        span.end(end_ns)
+        return span
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def set_error(self, message: str):
+        self.error = message
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            self.tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.error is None:
+            self.set_error("cancelled" if exc_type is asyncio.CancelledError else f"{exc_type.__name__}: {exc}")
+        self.end()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [
+                {"timeUnixNano": str(event["time_ns"]), "name": event["name"], "attributes": _attributes(event["attributes"])}
+                for event in self.events
+            ]
+        if self.error is not None:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class FileExporter:
+    """Appends each batch as one line of OTLP/JSON, the format of the collector's file exporter"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def export(self, document: Dict[str, Any]):
+        line = json.dumps(document, ensure_ascii=False) + "\n"
+        await asyncio.to_thread(self._write, line)
+
+    def _write(self, line: str):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def close(self):
+        pass
+
+
+class OTLPHttpExporter:
+    """Posts batches to an OpenTelemetry collector's OTLP/HTTP JSON endpoint"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        if not endpoint.rstrip("/").endswith("/v1/traces"):
+            endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._client = None
+
+    async def export(self, document: Dict[str, Any]):
+        import httpx
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        response = await self._client.post(self.endpoint, json=document)
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def exporter_from_url(url: Optional[str]):
+    """"" exports nothing, http(s)://collector:4318 posts OTLP/JSON, anything else is a file path"""
+    if not url:
+        return None
+    if url.startswith(("http://", "https://")):
+        return OTLPHttpExporter(url)
+    if url.startswith("file://"):
+        url = url[len("file://"):]
+    return FileExporter(url)
+
+
+class Tracer:
+    """
+    Hands out spans and exports the finished ones in batches from a background task, so
+    recording a span never waits for I/O. Without an exporter, spans still get ids (they
+    are echoed to clients) but are dropped when they end.
+    """
+
+    def __init__(
+        self,
+        exporter=None,
+        service_name: str = "brainwave",
+        resource: Optional[Dict[str, Any]] = None,
+        interval: float = 2.0,
+        max_batch: int = 512,
+        max_queue: int = 10000,
+    ):
+        self.exporter = exporter
+        self.resource = {"service.name": service_name, **(resource or {})}
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._finished: Deque[Span] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.spans_exported = 0
+        self.spans_dropped = 0
+        self.export_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        traceparent: Optional[str] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        **attributes,
+    ) -> Span:
+        """A child of parent, a continuation of a W3C traceparent header, or the root of a new trace"""
+        if parent is not None:
+            return parent.child(name, kind=kind, **attributes)
+        match = _TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+        if match and int(match.group(1), 16) and int(match.group(2), 16):
+            return Span(self, name, match.group(1), match.group(2), kind, attributes=attributes)
+        return Span(self, name, os.urandom(16).hex(), kind=kind, attributes=attributes)
+
+    def export(self, span: Span):
+        if self.exporter is None:
+            return
+        if len(self._finished) >= self.max_queue:
+            self.spans_dropped += 1
+            return
+        self._finished.append(span)
+        if len(self._finished) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self.exporter is not None and self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._export_loop())
+            logger.info(f"Exporting traces to {getattr(self.exporter, 'endpoint', None) or getattr(self.exporter, 'path', self.exporter)}")
+
+    async def stop(self):
+        """Export every finished span, then stop"""
+        if self._task is not None:
+            # Not cancelled: a batch the loop is exporting is already off the queue
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._finished:
+            await self.flush()
+        if self.exporter is not None:
+            await self.exporter.close()
+
+    async def _export_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._finished:
+                await self.flush()
+
+    async def flush(self):
+        batch = [self._finished.popleft() for _ in range(min(self.max_batch, len(self._finished)))]
+        if not batch:
+            return
+        try:
+            await self.exporter.export(self.to_otlp(batch))
+            self.spans_exported += len(batch)
+        except Exception as e:
+            self.export_errors += 1
+            self.spans_dropped += len(batch)
+            logger.warning(f"Could not export {len(batch)} spans: {e}")
+
+    def to_otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _attributes(self.resource)},
+                "scopeSpans": [{
+                    "scope": {"name": "brainwave"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": len(self._finished),
+            "spans_exported": self.spans_exported,
+            "spans_dropped": self.spans_dropped,
+            "export_errors": self.export_errors,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def use_span(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    """Make span the parent of spans started in this context, and in tasks created from it"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+    """
+    A child of the current span for the duration of the block, or None outside any trace.
+    The child is not made current, so this is safe around yields in async generators.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.child(name, kind=kind, **attributes) as child:
+        yield child
@@ -0,0 +1,71 @@
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TranscriptBuffer:
+    """
+    Text accumulated from many small deltas. Appending is O(1): parts are kept in a list
+    and joined only when the text is read. At most max_chars are kept (0 for no limit);
+    text beyond that is dropped and counted, so a runaway dictation can't grow its
+    connection without bound.
+    """
+
+    def __init__(self, max_chars: int = 0):
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._length = 0
+        self.dropped_chars = 0
+
+    def append(self, text: str) -> bool:
+        """Add text; False if some or all of it was over the budget and dropped"""
+        if not text:
+            return True
+        room = self.max_chars - self._length if self.max_chars else len(text)
+        if room < len(text):
+            if not self.dropped_chars:
+                logger.warning(f"Transcript reached {self.max_chars} characters, dropping the rest")
+            self.dropped_chars += len(text) - max(0, room)
+            text = text[:max(0, room)]
+            if not text:
+                return False
+            self._parts.append(text)
+            self._length += len(text)
+            return False
+        self._parts.append(text)
+        self._length += len(text)
+        return True
+
+    def clear(self):
+        self._parts = []
+        self._length = 0
+        self.dropped_chars = 0
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            # Keep the joined text, so reading again costs nothing until the next append
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def tail(self, chars: int) -> str:
+        """The last chars characters, without joining everything"""
+        parts = []
+        needed = chars
+        for part in reversed(self._parts):
+            if needed <= 0:
+                break
+            parts.append(part[-needed:])
+            needed -= len(part)
+        return "".join(reversed(parts))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __str__(self) -> str:
+        return self.text